@@ -224,6 +224,7 @@ OPEN_URLS = []
 
 HOOKS = {
     'target_post_save': 'tom_common.hooks.target_post_save',
+    'targets_post_save': 'tom_common.hooks.targets_post_save',
     'observation_change_state': 'tom_common.hooks.observation_change_state'
 }
 
@@ -1,11 +1,10 @@
 from tom_catalogs.harvester import AbstractHarvester
+from tom_common import http_client
 
 import os
-import requests
 import json
 from collections import OrderedDict
-from astropy import units as u
-from astropy.coordinates import SkyCoord
+from tom_targets.coordinates import to_degrees
 
 def get(term):
   api_key = os.environ['SNEXBOT_APIKEY']
@@ -21,7 +20,7 @@ def get(term):
     get_data = [('api_key',(None, api_key)),
                  ('data',(None,json.dumps(json_file)))]
    
-    response = requests.post(get_url, files=get_data)
+    response = http_client.post(get_url, files=get_data)
     response = json.loads(response.text)['data']['reply']
     return response
   except Exception as e:
@@ -42,7 +41,6 @@ class TNSHarvester(AbstractHarvester):
         target.epoch = 2000
         if self.catalog_data['redshift'] is not None:
             target.redshift = self.catalog_data['redshift']
-        c = SkyCoord('{0} {1}'.format(self.catalog_data['ra'], 
-            self.catalog_data['dec']), unit = (u.hourangle, u.deg))
-        target.ra, target.dec = c.ra.deg, c.dec.deg
+        target.ra = to_degrees(self.catalog_data['ra'], 'ra')
+        target.dec = to_degrees(self.catalog_data['dec'], 'dec')
         return target
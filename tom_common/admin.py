@@ -1,3 +1,9 @@
 from django.contrib import admin
 
-# Register your models here.
+from tom_common.models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('key', 'status', 'created', 'started', 'finished')
+    list_filter = ('status',)
@@ -1,2 +1,6 @@
 class ImproperCredentialsException(Exception):
     pass
+
+
+class ServiceUnavailableException(Exception):
+    pass
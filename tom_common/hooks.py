@@ -26,5 +26,10 @@ def target_post_save(target, created):
     logger.info('Target post save hook: %s created: %s', target, created)
 
 
+def targets_post_save(targets, created):
+    for target in targets:
+        run_hook('target_post_save', target=target, created=created)
+
+
 def observation_change_state(observation, previous_state):
     logger.info('Observation change state hook: %s from %s to %s', observation, previous_state, observation.status)
@@ -0,0 +1,159 @@
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+from django.core.cache import cache
+
+from tom_common.exceptions import ServiceUnavailableException
+
+logger = logging.getLogger(__name__)
+
+# Determine settings for this module. Timeouts are in seconds. They and the
+# retries are kept short, because every call goes through the circuit breaker,
+# which only counts a failure once all attempts at the call have timed out.
+HTTP_SETTINGS = {
+    'connect_timeout': 3,
+    'read_timeout': 15,
+    'retries': 1,
+    'backoff_factor': 0.5,
+    'pool_maxsize': 10,
+    'breaker_failures': 5,
+    'breaker_cooldown': 60,
+    **getattr(settings, 'FACILITY_HTTP_SETTINGS', {})
+}
+
+# Statuses worth retrying, as they usually indicate a temporary upstream problem
+RETRY_STATUSES = (502, 503, 504)
+
+_sessions = {}
+_lock = threading.Lock()
+call_statistics = {}
+
+
+def get_session(url):
+    """
+    Returns the session used for the host of a url, so that every call to the
+    same host reuses its pool of keep-alive connections.
+
+    Failed connections, reads and gateway errors are retried with exponential
+    backoff, but only for idempotent methods, so a POST is never sent twice.
+    """
+    host = urlparse(url).netloc
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            retry = Retry(
+                total=HTTP_SETTINGS['retries'],
+                backoff_factor=HTTP_SETTINGS['backoff_factor'],
+                status_forcelist=RETRY_STATUSES,
+                raise_on_status=False
+            )
+            adapter = HTTPAdapter(pool_maxsize=HTTP_SETTINGS['pool_maxsize'], max_retries=retry)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[host] = session
+    return session
+
+
+def _record_call(host, elapsed, failed):
+    with _lock:
+        statistics = call_statistics.setdefault(host, {'calls': 0, 'failures': 0, 'total_time': 0.0})
+        statistics['calls'] += 1
+        statistics['failures'] += int(failed)
+        statistics['total_time'] += elapsed
+
+
+def _breaker_keys(host):
+    key = 'circuit_breaker_{0}'.format(host)
+    return key + '_failures', key + '_opened', key + '_trial'
+
+
+def circuit_state(host):
+    """
+    Returns the state of the circuit breaker of a host: "closed" while calls
+    go through, "open" while calls fail fast after repeated failures, and
+    "half-open" once the cool-down has passed and a trial call is allowed.
+
+    The state is kept in the default cache. With the local memory cache that
+    Django uses when no CACHES are configured, each process has a breaker of
+    its own; configure a shared cache such as memcached or redis for all the
+    workers to share one.
+    """
+    _, opened_key, _ = _breaker_keys(host)
+    opened_at = cache.get(opened_key)
+    if opened_at is None:
+        return 'closed'
+    if time.time() - opened_at < HTTP_SETTINGS['breaker_cooldown']:
+        return 'open'
+    return 'half-open'
+
+
+def _allow_call(host):
+    state = circuit_state(host)
+    if state == 'half-open':
+        # Only the first caller after the cool-down gets to probe the host
+        _, _, trial_key = _breaker_keys(host)
+        return cache.add(trial_key, True, HTTP_SETTINGS['breaker_cooldown'])
+    return state == 'closed'
+
+
+def _update_breaker(host, failed):
+    failures_key, opened_key, trial_key = _breaker_keys(host)
+    if not failed:
+        if cache.get(failures_key) is not None:
+            cache.delete_many([failures_key, opened_key, trial_key])
+        return
+    # add and incr are atomic, so concurrent failures are all counted
+    cache.add(failures_key, 0, None)
+    try:
+        failures = cache.incr(failures_key)
+    except ValueError:
+        # A successful call reset the breaker in the meantime
+        return
+    opened_at = cache.get(opened_key)
+    if failures >= HTTP_SETTINGS['breaker_failures'] or opened_at is not None:
+        if opened_at is None:
+            logger.warning('Opening circuit breaker for %s after %d failures', host, failures)
+        cache.set(opened_key, time.time(), None)
+        cache.delete(trial_key)
+
+
+def request(method, url, **kwargs):
+    """
+    Drop in replacement for requests.request that goes through the pooled
+    session of the host, applies the configured connect and read timeouts
+    unless a timeout is given, and records how long the call took.
+
+    Connection errors, timeouts and server errors count towards the circuit
+    breaker of the host. Once it is open, calls raise
+    ServiceUnavailableException immediately instead of waiting on the host.
+    """
+    host = urlparse(url).netloc
+    if not _allow_call(host):
+        raise ServiceUnavailableException(host)
+    kwargs.setdefault('timeout', (HTTP_SETTINGS['connect_timeout'], HTTP_SETTINGS['read_timeout']))
+    failed = True
+    start = time.monotonic()
+    try:
+        response = get_session(url).request(method, url, **kwargs)
+        failed = response.status_code >= 500
+        return response
+    finally:
+        elapsed = time.monotonic() - start
+        _record_call(host, elapsed, failed)
+        _update_breaker(host, failed)
+        logger.debug('%s %s took %.3fs', method, url, elapsed)
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
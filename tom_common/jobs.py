@@ -0,0 +1,182 @@
+import json
+import logging
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html
+
+from tom_common.models import Job
+
+logger = logging.getLogger(__name__)
+
+# How jobs are run: "thread" runs each job in a thread of the web process
+# that enqueued it, "worker" leaves them to the processjobs command, and "eager"
+# runs them before enqueue returns, which is mostly useful in tests.
+DEFAULT_JOB_RUNNER = 'thread'
+
+# Determine settings for this module. A running job records a heartbeat every
+# heartbeat seconds, and is taken to have died with its process once it has
+# not for stale_after seconds, so that the same job can be started again.
+JOB_SETTINGS = {
+    'heartbeat': 30,
+    'stale_after': 300,
+    **getattr(settings, 'JOB_SETTINGS', {})
+}
+
+
+class JobOutput:
+    """
+    File-like object that stores what a command writes to its output on its
+    job as it is written, so that progress can be followed while it runs.
+    """
+    def __init__(self, job):
+        self.job = job
+
+    def write(self, text):
+        self.job.output += text
+        Job.objects.filter(pk=self.job.pk).update(output=self.job.output)
+
+    def flush(self):
+        pass
+
+
+def job_key(command, options):
+    return '{0} {1}'.format(command, json.dumps(options, sort_keys=True))
+
+
+def enqueue(command, **options):
+    """
+    Queues a management command to be run in the background with the given
+    options, unless the same command with the same options is already queued
+    or running, in which case that job is returned instead.
+
+    Parameters
+    ----------
+    command : str
+        Name of the management command
+    options : dict
+        Options passed to call_command, which must be serializable to JSON
+
+    Returns
+    -------
+    tuple
+        The job and whether it was newly created
+
+    """
+    key = job_key(command, options)
+    reclaim_stale_jobs(key)
+    while True:
+        try:
+            # The unique active key makes the database refuse a second job
+            # enqueued at the same time
+            with transaction.atomic():
+                job = Job.objects.create(command=command, arguments=json.dumps(options), key=key)
+            break
+        except IntegrityError:
+            job = Job.objects.filter(active_key=key).first()
+            if job is not None:
+                return job, False
+
+    runner = getattr(settings, 'JOB_RUNNER', DEFAULT_JOB_RUNNER)
+    if runner == 'eager':
+        run_job(job)
+    elif runner == 'thread':
+        transaction.on_commit(lambda: threading.Thread(target=_run_in_thread, args=(job,), daemon=True).start())
+    return job, True
+
+
+def claim_job(job):
+    """
+    Marks a queued job as running. Returns False if another worker got to it first.
+    """
+    now = timezone.now()
+    claimed = Job.objects.filter(pk=job.pk, status=Job.QUEUED).update(
+        status=Job.RUNNING, started=now, heartbeat=now
+    )
+    if claimed != 1:
+        return False
+    job.status = Job.RUNNING
+    job.started = job.heartbeat = now
+    return True
+
+
+def _beat(job, stopped):
+    try:
+        while not stopped.wait(JOB_SETTINGS['heartbeat']):
+            Job.objects.filter(pk=job.pk).update(heartbeat=timezone.now())
+    finally:
+        connection.close()
+
+
+def reclaim_stale_jobs(key=None):
+    """
+    Marks as failed the running jobs that have not recorded a heartbeat for
+    longer than the stale_after setting, because the process running them
+    died, so that they no longer block the same job from being enqueued.
+    Queued jobs are also reclaimed when jobs are run in threads of the web
+    process, as the process that would have run them is gone. Returns the
+    number of jobs reclaimed.
+    """
+    cutoff = timezone.now() - timedelta(seconds=JOB_SETTINGS['stale_after'])
+    stale = Q(status=Job.RUNNING) & (Q(heartbeat__lt=cutoff) | Q(heartbeat__isnull=True, started__lt=cutoff))
+    if getattr(settings, 'JOB_RUNNER', DEFAULT_JOB_RUNNER) == 'thread':
+        stale |= Q(status=Job.QUEUED, created__lt=cutoff)
+    jobs = Job.objects.filter(stale)
+    if key is not None:
+        jobs = jobs.filter(key=key)
+    return jobs.update(
+        status=Job.FAILED, active_key=None, finished=timezone.now(),
+        output=Concat(F('output'), Value('\nThe job stopped responding and was abandoned.\n'))
+    )
+
+
+def run_job(job):
+    """
+    Runs a queued job, recording its output and whether it succeeded.
+    """
+    if not claim_job(job):
+        return job
+    stopped = threading.Event()
+    threading.Thread(target=_beat, args=(job, stopped), daemon=True).start()
+    try:
+        call_command(job.command, stdout=JobOutput(job), **json.loads(job.arguments))
+        job.status = Job.SUCCEEDED
+    except Exception:
+        logger.exception('Job %s failed', job)
+        job.output += traceback.format_exc()
+        job.status = Job.FAILED
+    finally:
+        stopped.set()
+    job.finished = timezone.now()
+    job.save(update_fields=['status', 'output', 'finished'])
+    return job
+
+
+def _run_in_thread(job):
+    try:
+        run_job(job)
+    finally:
+        connection.close()
+
+
+def job_message(job, created, description):
+    """
+    Returns the message shown to a user who started a job, with a link to
+    the progress of the job.
+    """
+    return format_html(
+        '{0} {1} in the background. <a href="{2}">Follow its progress</a>.',
+        description, 'started' if created else 'is already running', reverse('job-status', kwargs={'pk': job.id})
+    )
+
+
+def next_queued_job():
+    return Job.objects.filter(status=Job.QUEUED).order_by('created').first()
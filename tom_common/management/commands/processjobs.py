@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tom_common.jobs import next_queued_job, reclaim_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs, such as updates started from the web interface'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run the jobs that are queued, then exit'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=int,
+            default=5,
+            help='Number of seconds to wait for new jobs when the queue is empty'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                reclaim_stale_jobs()
+                job = next_queued_job()
+                if job is None:
+                    if options['once']:
+                        return
+                    time.sleep(options['sleep'])
+                    continue
+                run_job(job)
+                self.stdout.write('{0}: {1}'.format(job.key, job.status))
+        except KeyboardInterrupt:
+            pass
@@ -3,7 +3,7 @@ from django.shortcuts import redirect
 from django.contrib import messages
 from django.conf import settings
 
-from tom_common.exceptions import ImproperCredentialsException
+from tom_common.exceptions import ImproperCredentialsException, ServiceUnavailableException
 
 
 class ExternalServiceMiddleware:
@@ -21,6 +21,12 @@ class ExternalServiceMiddleware:
             )
             messages.error(request, msg)
             return redirect(reverse('home'))
+        if isinstance(exception, ServiceUnavailableException):
+            msg = '{} is not responding, so some features are degraded. Please try again in a few minutes.'.format(
+                str(exception)
+            )
+            messages.warning(request, msg)
+            return redirect(reverse('home'))
         raise exception
 
 
@@ -0,0 +1,38 @@
+# Generated by Django 2.1.15 on 2026-10-19 01:49
+
+from django.db import migrations, models
+
+
+def set_active_keys(apps, schema_editor):
+    # Only the newest active job of each key stays active, any older ones
+    # could only be left over from jobs that never finished
+    Job = apps.get_model('tom_common', 'Job')
+    active = set()
+    for job in Job.objects.filter(status__in=['QUEUED', 'RUNNING']).order_by('-created'):
+        if job.key in active:
+            job.status = 'FAILED'
+        else:
+            job.active_key = job.key
+            active.add(job.key)
+        job.save(update_fields=['status', 'active_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_common', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='active_key',
+            field=models.CharField(editable=False, max_length=255, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='heartbeat',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(set_active_keys, migrations.RunPython.noop),
+    ]
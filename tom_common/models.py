@@ -1,3 +1,44 @@
 from django.db import models
 
-# Create your models here.
+
+class Job(models.Model):
+    """
+    A management command run in the background on behalf of a user, so that
+    long updates against external services do not hold up a web request.
+    """
+    QUEUED = 'QUEUED'
+    RUNNING = 'RUNNING'
+    SUCCEEDED = 'SUCCEEDED'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    )
+    ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+    command = models.CharField(max_length=100)
+    arguments = models.TextField(default='{}')
+    key = models.CharField(max_length=255, db_index=True)
+    # The key while the job is queued or running and null afterwards, so that
+    # the database refuses a second active job with the same key
+    active_key = models.CharField(max_length=255, unique=True, null=True, editable=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    output = models.TextField(blank=True, default='')
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    heartbeat = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ('-created',)
+
+    def __str__(self):
+        return '{0} ({1})'.format(self.key, self.status)
+
+    def save(self, *args, **kwargs):
+        self.active_key = self.key if self.status in self.ACTIVE_STATUSES else None
+        if 'update_fields' in kwargs and 'status' in kwargs['update_fields']:
+            kwargs['update_fields'] = list(kwargs['update_fields']) + ['active_key']
+        super().save(*args, **kwargs)
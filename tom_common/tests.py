@@ -1,7 +1,22 @@
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch, ANY
+
 from django.test import TestCase, override_settings
 
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from requests.exceptions import ConnectTimeout
+
+from tom_common import http_client
+from tom_common.jobs import JOB_SETTINGS, claim_job, enqueue, job_key, reclaim_stale_jobs
+from tom_common.models import Job
+from tom_common.exceptions import ServiceUnavailableException
 
 
 class TestUserManagement(TestCase):
@@ -83,3 +98,145 @@ class TestAuthScheme(TestCase):
         response = self.client.get(reverse('tom_targets:list'))
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'Add a target')
+
+
+class TestHTTPClient(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_session_per_host(self):
+        session = http_client.get_session('https://observe.lco.global/api/userrequests/')
+        self.assertIs(session, http_client.get_session('https://observe.lco.global/api/profile/'))
+        self.assertIsNot(session, http_client.get_session('https://archive-api.lco.global/frames/'))
+        retries = session.get_adapter('https://observe.lco.global/').max_retries
+        self.assertEqual(retries.total, http_client.HTTP_SETTINGS['retries'])
+        self.assertFalse(retries.is_retry('POST', 503))
+        self.assertTrue(retries.is_retry('GET', 503))
+
+    @patch('requests.Session.request')
+    def test_request_timeout_and_statistics(self, request_mock):
+        request_mock.return_value.status_code = 200
+        http_client.call_statistics.pop('stats.example.com', None)
+        http_client.get('https://stats.example.com/a')
+        http_client.get('https://stats.example.com/b', timeout=1)
+        self.assertEqual(
+            request_mock.call_args_list[0][1]['timeout'],
+            (http_client.HTTP_SETTINGS['connect_timeout'], http_client.HTTP_SETTINGS['read_timeout'])
+        )
+        self.assertEqual(request_mock.call_args_list[1][1]['timeout'], 1)
+        self.assertEqual(http_client.call_statistics['stats.example.com']['calls'], 2)
+        self.assertEqual(http_client.call_statistics['stats.example.com']['failures'], 0)
+
+    @patch('requests.Session.request', side_effect=ConnectTimeout)
+    def test_circuit_breaker(self, request_mock):
+        url = 'https://slow.example.com/api/'
+        for _ in range(http_client.HTTP_SETTINGS['breaker_failures']):
+            with self.assertRaises(ConnectTimeout):
+                http_client.get(url)
+        self.assertEqual(http_client.circuit_state('slow.example.com'), 'open')
+        with self.assertRaises(ServiceUnavailableException):
+            http_client.get(url)
+        self.assertEqual(request_mock.call_count, http_client.HTTP_SETTINGS['breaker_failures'])
+
+        # After the cool-down a single trial call is let through, and closes the circuit if it succeeds
+        with patch('tom_common.http_client.time.time', return_value=time.time() + 3600):
+            self.assertEqual(http_client.circuit_state('slow.example.com'), 'half-open')
+            request_mock.side_effect = None
+            request_mock.return_value.status_code = 200
+            http_client.get(url)
+        self.assertEqual(http_client.circuit_state('slow.example.com'), 'closed')
+
+    def test_circuit_breaker_counts_every_failure(self):
+        failures_key, _, _ = http_client._breaker_keys('busy.example.com')
+        # A failure recorded by another worker between this one's reads is not lost
+        cache.add(failures_key, 0, None)
+        cache.incr(failures_key)
+        http_client._update_breaker('busy.example.com', True)
+        self.assertEqual(cache.get(failures_key), 2)
+        http_client._update_breaker('busy.example.com', False)
+        self.assertIsNone(cache.get(failures_key))
+
+    def test_service_unavailable_message(self):
+        user = User.objects.create_user(username='test', password='test')
+        self.client.force_login(user)
+        with patch('tom_common.views.UserListView.get', side_effect=ServiceUnavailableException('slow.example.com')):
+            response = self.client.get(reverse('user-list'), follow=True)
+        self.assertContains(response, 'slow.example.com is not responding')
+
+
+class TestJobs(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='test', password='test')
+        self.client.force_login(self.user)
+
+    @override_settings(JOB_RUNNER='worker')
+    def test_identical_jobs_deduplicated(self):
+        job, created = enqueue('updatestatus', target_id=1)
+        self.assertTrue(created)
+        self.assertEqual(enqueue('updatestatus', target_id=1), (job, False))
+        self.assertTrue(enqueue('updatestatus', target_id=2)[1])
+        job.status = Job.SUCCEEDED
+        job.save()
+        self.assertTrue(enqueue('updatestatus', target_id=1)[1])
+
+    @override_settings(JOB_RUNNER='worker')
+    def test_one_active_job_per_key(self):
+        Job.objects.create(command='updatestatus', key=job_key('updatestatus', {}))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Job.objects.create(command='updatestatus', key=job_key('updatestatus', {}))
+        with patch('tom_common.jobs.Job.objects.create', side_effect=IntegrityError):
+            job, created = enqueue('updatestatus')
+        self.assertFalse(created)
+        self.assertEqual(job.status, Job.QUEUED)
+
+    @override_settings(JOB_RUNNER='worker')
+    def test_job_claimed_once(self):
+        job, _ = enqueue('updatestatus')
+        other = Job.objects.get(pk=job.pk)
+        self.assertTrue(claim_job(job))
+        self.assertFalse(claim_job(other))
+        self.assertEqual((other.status, other.started), (Job.QUEUED, None))
+
+    @override_settings(JOB_RUNNER='worker')
+    def test_stale_running_job_reclaimed(self):
+        job, _ = enqueue('updatestatus')
+        stale = timezone.now() - timedelta(seconds=JOB_SETTINGS['stale_after'] + 1)
+        Job.objects.filter(pk=job.pk).update(status=Job.RUNNING, started=stale, heartbeat=stale)
+        new_job, created = enqueue('updatestatus')
+        self.assertTrue(created)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIsNone(job.active_key)
+        self.assertIn('abandoned', job.output)
+
+    @override_settings(JOB_RUNNER='worker')
+    def test_running_job_with_heartbeat_not_reclaimed(self):
+        job, _ = enqueue('updatestatus')
+        stale = timezone.now() - timedelta(seconds=JOB_SETTINGS['stale_after'] + 1)
+        Job.objects.filter(pk=job.pk).update(status=Job.RUNNING, started=stale, heartbeat=timezone.now())
+        self.assertEqual(enqueue('updatestatus')[0].pk, job.pk)
+        self.assertEqual(reclaim_stale_jobs(), 0)
+
+    @override_settings(JOB_RUNNER='worker')
+    def test_worker_runs_queued_jobs(self):
+        with patch('tom_common.jobs.call_command') as command_mock:
+            command_mock.side_effect = lambda *args, **kwargs: kwargs['stdout'].write('Update completed successfully')
+            response = self.client.get(reverse('tom_observations:list') + '?update_status=True', follow=True)
+            job = Job.objects.get()
+            self.assertContains(
+                response, '<a href="{0}">Follow its progress</a>'.format(reverse('job-status', kwargs={'pk': job.id}))
+            )
+            self.assertEqual(job.status, Job.QUEUED)
+            self.assertFalse(command_mock.called)
+            call_command('processjobs', once=True, stdout=StringIO())
+        command_mock.assert_called_once_with('updatestatus', stdout=ANY)
+        status = self.client.get(reverse('job-status', kwargs={'pk': job.id})).json()
+        self.assertEqual(status['status'], Job.SUCCEEDED)
+        self.assertEqual(status['output'], 'Update completed successfully')
+
+    @override_settings(JOB_RUNNER='eager')
+    def test_failed_job(self):
+        with patch('tom_common.jobs.call_command', side_effect=Exception('API unavailable')):
+            job, _ = enqueue('updatereduceddata')
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn('API unavailable', job.output)
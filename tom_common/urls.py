@@ -22,7 +22,7 @@ from django.conf import settings
 from django.conf.urls.static import static
 
 from tom_common.views import UserListView, UserPasswordChangeView, UserCreateView, UserDeleteView, UserUpdateView
-from tom_common.views import CommentDeleteView
+from tom_common.views import CommentDeleteView, JobStatusView
 
 urlpatterns = [
     path('', TemplateView.as_view(template_name='tom_common/index.html'), name='home'),
@@ -40,6 +40,7 @@ urlpatterns = [
     path('accounts/logout/', LogoutView.as_view(), name='logout'),
     path('accounts/update/', UserUpdateView.as_view(), name='account-update'),
     path('comment/<pk>/delete', CommentDeleteView.as_view(), name='comment-delete'),
+    path('jobs/<int:pk>/', JobStatusView.as_view(), name='job-status'),
     path('admin/', admin.site.urls),
     # The static helper below only works in development see
     # https://docs.djangoproject.com/en/2.1/howto/static-files/#serving-files-uploaded-by-a-user-during-development
@@ -9,10 +9,12 @@ from django_comments.models import Comment
 from django.utils.decorators import method_decorator
 from django.urls import reverse_lazy
 from django.contrib import messages
-from django.http import HttpResponseForbidden
-from django.shortcuts import redirect
+from django.http import HttpResponseForbidden, JsonResponse
+from django.shortcuts import redirect, get_object_or_404
+from django.views.generic import View
 
 from tom_common.forms import ChangeUserPasswordForm, CustomUserCreationForm
+from tom_common.models import Job
 
 
 class UserListView(ListView):
@@ -86,3 +88,21 @@ class CommentDeleteView(LoginRequiredMixin, DeleteView):
             return super().delete(request, *args, **kwargs)
         else:
             return HttpResponseForbidden('Not authorized')
+
+
+class JobStatusView(LoginRequiredMixin, View):
+    """
+    Returns the status and output so far of a background job as JSON.
+    """
+    def get(self, request, *args, **kwargs):
+        job = get_object_or_404(Job, pk=kwargs['pk'])
+        return JsonResponse({
+            'id': job.id,
+            'command': job.command,
+            'status': job.status,
+            'output': job.output,
+            'created': job.created,
+            'started': job.started,
+            'finished': job.finished,
+            'heartbeat': job.heartbeat,
+        })
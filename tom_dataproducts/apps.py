@@ -1,5 +1,19 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete
+
+
+def delete_unreferenced_file(sender, instance, **kwargs):
+    # Stored files are shared by data products with the same content, so a
+    # file is only deleted with the last data product that references it.
+    # As a receiver this also runs for deletes cascaded from targets and
+    # observation records, and for deletes of querysets.
+    name = instance.data.name
+    if name and not sender.objects.filter(data=name).exists():
+        instance.data.storage.delete(name)
 
 
 class TomDataproductsConfig(AppConfig):
     name = 'tom_dataproducts'
+
+    def ready(self):
+        post_delete.connect(delete_unreferenced_file, sender='tom_dataproducts.DataProduct')
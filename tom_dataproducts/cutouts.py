@@ -0,0 +1,100 @@
+from io import BytesIO
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg') # noqa
+import matplotlib.pyplot as plt
+from astropy import units as u
+from astropy.coordinates import SkyCoord
+from astropy.io import fits
+from astropy.nddata import Cutout2D
+from astropy.visualization import ZScaleInterval
+from astropy.wcs import WCS
+from django.conf import settings
+from django.core.cache import cache
+
+CUTOUT_FORMATS = {
+    'fits': 'image/fits',
+    'png': 'image/png'
+}
+DEFAULT_CUTOUT_SIZE = 30
+# Largest cutout served, in arcseconds. Larger sizes are reduced to it, so
+# that a cutout is never a copy of a whole frame.
+MAX_CUTOUT_SIZE = getattr(settings, 'MAX_CUTOUT_SIZE', 300)
+CUTOUT_CACHE_TIMEOUT = getattr(settings, 'CUTOUT_CACHE_TIMEOUT', 86400)
+
+
+def cutout_cache_key(product, ra, dec, size, fmt):
+    return 'cutout_{0}_{1:.6f}_{2:.6f}_{3:g}_{4}'.format(product.id, ra, dec, size, fmt)
+
+
+def _to_fits(cutout, header):
+    header = header.copy()
+    header.update(cutout.wcs.to_header())
+    buffer = BytesIO()
+    fits.PrimaryHDU(cutout.data, header=header).writeto(buffer)
+    return buffer.getvalue()
+
+
+def _to_png(cutout):
+    buffer = BytesIO()
+    interval = ZScaleInterval(nsamples=2000, contrast=0.1)
+    plt.imsave(buffer, interval(np.nan_to_num(cutout.data)), cmap='gray', origin='lower', format='png')
+    return buffer.getvalue()
+
+
+def create_cutout(product, ra, dec, size=DEFAULT_CUTOUT_SIZE, fmt='fits'):
+    """
+    Extracts a square stamp centered on a sky position from a FITS data product.
+
+    The file is opened memory mapped, so only the pixels within the stamp are
+    read from disk. Cutouts are cached per product, position, size and format.
+
+    Parameters
+    ----------
+    product : DataProduct
+        The FITS data product to cut the stamp from
+    ra : float
+        Right Ascension of the center of the cutout, in degrees
+    dec : float
+        Declination of the center of the cutout, in degrees
+    size : float
+        Width and height of the cutout, in arcseconds, at most MAX_CUTOUT_SIZE
+    fmt : str
+        Either "fits" or "png"
+
+    Returns
+    -------
+    bytes
+        The cutout, encoded in the requested format
+
+    Raises
+    ------
+    ValueError
+        If the product is not a FITS file, or the position, size or format
+        are not valid
+    astropy.nddata.utils.NoOverlapError
+        If the requested position does not fall within the image
+
+    """
+    if fmt not in CUTOUT_FORMATS:
+        raise ValueError('Cutout format must be one of: {0}'.format(', '.join(CUTOUT_FORMATS)))
+    if product.get_file_extension() not in product.FITS_EXTENSIONS:
+        raise ValueError('Cutouts can only be made of FITS data products')
+    if ra is None or dec is None:
+        raise ValueError('A position is required, as the target has no coordinates')
+    if not np.isfinite(size) or size <= 0:
+        raise ValueError('Cutout size must be a positive number of arcseconds')
+    size = min(size, MAX_CUTOUT_SIZE)
+    key = cutout_cache_key(product, ra, dec, size, fmt)
+    content = cache.get(key)
+    if content is None:
+        extname = product.FITS_EXTENSIONS.get(product.get_file_extension(), 0)
+        with fits.open(product.data.path, memmap=True) as hdul:
+            hdu = hdul[extname]
+            cutout = Cutout2D(
+                hdu.data, SkyCoord(ra, dec, unit=u.deg), size * u.arcsec, wcs=WCS(hdu.header), copy=True
+            )
+            content = _to_fits(cutout, hdu.header) if fmt == 'fits' else _to_png(cutout)
+        cache.set(key, content, CUTOUT_CACHE_TIMEOUT)
+    return content
@@ -0,0 +1,94 @@
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from django.conf import settings
+
+from tom_common import http_client
+
+logger = logging.getLogger(__name__)
+
+# Determine settings for this module.
+DOWNLOAD_SETTINGS = {
+    'max_workers': 4,
+    'chunk_size': 1024 * 1024,
+    'timeout': (10, 60),
+    **getattr(settings, 'DATA_PRODUCT_DOWNLOADS', {})
+}
+
+
+def download_file(url, chunk_size=DOWNLOAD_SETTINGS['chunk_size'], timeout=DOWNLOAD_SETTINGS['timeout']):
+    """
+    Streams the response for a url to a temporary file in chunks, so that the
+    file is never held in memory in its entirety.
+
+    Returns
+    -------
+    file
+        The temporary file, positioned at its start. It is removed once closed.
+
+    """
+    destination = tempfile.TemporaryFile()
+    try:
+        with http_client.get(url, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                destination.write(chunk)
+    except Exception:
+        destination.close()
+        raise
+    destination.seek(0)
+    return destination
+
+
+def download_products(products, max_workers=DOWNLOAD_SETTINGS['max_workers']):
+    """
+    Downloads the files for data products concurrently over the pooled
+    session of each archive host.
+
+    Products are consumed lazily, and downloads start as soon as each product
+    is read, so a listing that is still being paged through can be downloaded
+    while it arrives. At most a few downloads per worker are queued at once.
+
+    Parameters
+    ----------
+    products : iterable
+        Dictionaries with at least "url" and "filename" keys, as returned by
+        the data_products method of a facility
+    max_workers : int
+        Maximum number of concurrent downloads
+
+    Yields
+    ------
+    tuple
+        A (product, file, error) tuple for every product as its download
+        finishes. On success file is an open temporary file and error is None,
+        on failure file is None and error is the exception that was raised.
+
+    """
+    completed = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+
+        def finished(futures):
+            nonlocal completed
+            for future in futures:
+                product = pending.pop(future)
+                completed += 1
+                try:
+                    dfile = future.result()
+                    logger.info('Downloaded %s (%d completed)', product['filename'], completed)
+                    yield product, dfile, None
+                except Exception as e:
+                    logger.error('Failed to download %s: %s', product['filename'], e)
+                    yield product, None, e
+
+        for product in products:
+            logger.info('Downloading %s', product['filename'])
+            pending[executor.submit(download_file, product['url'])] = product
+            if len(pending) >= max_workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from finished(done)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from finished(done)
@@ -0,0 +1,106 @@
+import csv
+import zipfile
+
+from tom_dataproducts.models import ReducedDatum
+
+
+class StreamBuffer:
+    """
+    Write-only file-like object that hands back whatever has been written to
+    it since it was last emptied. It has no tell or seek, which makes zipfile
+    write entries followed by data descriptors instead of seeking back to
+    their headers, so an archive can be produced front to back.
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class Echo:
+    """
+    Pseudo buffer that returns what is written to it, so that csv.writer
+    returns each formatted row instead of storing it.
+    """
+    def write(self, value):
+        return value
+
+
+def stream_zip(entries):
+    """
+    Generates a ZIP archive piece by piece, holding no more than one chunk of
+    one entry in memory at any time.
+
+    Parameters
+    ----------
+    entries : iterable
+        Tuples of an archive name and an iterable of the bytes chunks that
+        make up the content of that entry
+
+    Yields
+    ------
+    bytes
+        Consecutive pieces of the archive
+
+    """
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for arcname, chunks in entries:
+            with archive.open(arcname, mode='w', force_zip64=True) as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+                    yield buffer.pop()
+            yield buffer.pop()
+    yield buffer.pop()
+
+
+def file_chunks(product):
+    product.data.open('rb')
+    try:
+        yield from product.data.chunks()
+    finally:
+        product.data.close()
+
+
+def photometry_csv(target):
+    """
+    Generates the photometry of a target as CSV, one encoded row at a time.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(['timestamp', 'filter', 'magnitude', 'error', 'source']).encode('utf-8')
+    photometry = ReducedDatum.objects.filter(
+        target=target, data_type='PHOTOMETRY'
+    ).select_related('source').order_by('timestamp')
+    for datum in photometry.iterator():
+        yield writer.writerow(
+            [datum.timestamp.isoformat(), datum.label, datum.value, datum.error, datum.source.name]
+        ).encode('utf-8')
+
+
+def target_data_archive(target, products, photometry=False):
+    """
+    Generates a ZIP archive of the files of the given data products of a
+    target and, optionally, of its photometry as CSV.
+    """
+    def entries():
+        arcnames = set()
+        for product in products:
+            arcname = product.get_file_name()
+            if arcname in arcnames:
+                arcname = '{0}_{1}'.format(product.id, arcname)
+            arcnames.add(arcname)
+            yield '{0}/{1}'.format(target.identifier, arcname), file_chunks(product)
+        if photometry:
+            yield '{0}/photometry.csv'.format(target.identifier), photometry_csv(target)
+
+    return stream_zip(entries())
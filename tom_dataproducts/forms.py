@@ -30,3 +30,35 @@ class DataProductUploadForm(forms.Form):
         )
     )
     tag = forms.ChoiceField(choices=DataProduct.DATA_PRODUCT_TAGS)
+
+
+class DataProductDownloadForm(forms.Form):
+    products = forms.ModelMultipleChoiceField(
+        DataProduct.objects.all(),
+        widget=forms.CheckboxSelectMultiple,
+        required=False,
+        help_text='Leave empty to download every product matching the filters below'
+    )
+    tag = forms.ChoiceField(choices=(('', 'Any'),) + DataProduct.DATA_PRODUCT_TAGS, required=False)
+    group = forms.ModelChoiceField(DataProductGroup.objects.all(), required=False)
+    start = forms.DateField(required=False, widget=forms.TextInput(attrs={'type': 'date'}))
+    end = forms.DateField(required=False, widget=forms.TextInput(attrs={'type': 'date'}))
+    photometry = forms.BooleanField(required=False, initial=True, label='Include photometry')
+
+    def __init__(self, *args, target=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if target:
+            self.fields['products'].queryset = target.dataproduct_set.all()
+
+    def filter_products(self, products):
+        if self.cleaned_data['products']:
+            products = products.filter(pk__in=self.cleaned_data['products'])
+        if self.cleaned_data['tag']:
+            products = products.filter(tag=self.cleaned_data['tag'])
+        if self.cleaned_data['group']:
+            products = products.filter(group=self.cleaned_data['group'])
+        if self.cleaned_data['start']:
+            products = products.filter(created__date__gte=self.cleaned_data['start'])
+        if self.cleaned_data['end']:
+            products = products.filter(created__date__lte=self.cleaned_data['end'])
+        return products.exclude(data='').exclude(data=None)
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.core.exceptions import ObjectDoesNotExist
+
+from tom_dataproducts.models import DataProduct, FITS_FILE
+from tom_dataproducts.tiles import create_tile_pyramid, get_pyramid_info
+
+
+class Command(BaseCommand):
+    help = 'Precomputes the tile pyramids used to view large FITS data products'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--product_id',
+            help='Create the tile pyramid for a single data product'
+        )
+        parser.add_argument(
+            '--overwrite',
+            action='store_true',
+            help='Regenerate tile pyramids that already exist'
+        )
+
+    def handle(self, *args, **options):
+        if options['product_id']:
+            try:
+                products = [DataProduct.objects.get(pk=options['product_id'])]
+            except ObjectDoesNotExist:
+                raise Exception('Invalid data product id provided')
+        else:
+            products = DataProduct.objects.filter(tag=FITS_FILE[0])
+
+        failed_products = {}
+        created = 0
+        for product in products:
+            if get_pyramid_info(product) and not options['overwrite']:
+                continue
+            try:
+                create_tile_pyramid(product)
+                created += 1
+            except Exception as e:
+                failed_products[product.id] = str(e)
+
+        if len(failed_products) == 0:
+            return 'Created {0} tile pyramids'.format(created)
+        else:
+            return 'Created {0} tile pyramids with errors: {1}'.format(created, str(failed_products))
@@ -0,0 +1,20 @@
+# Generated by Django 2.1.15 on 2026-10-19 00:58
+
+from django.db import migrations, models
+import tom_dataproducts.models
+import tom_dataproducts.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_dataproducts', '0002_auto_20190201_1829'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dataproduct',
+            name='data',
+            field=models.FileField(default=None, max_length=255, null=True, storage=tom_dataproducts.storage.ContentAddressedStorage(), upload_to=tom_dataproducts.models.data_product_path),
+        ),
+    ]
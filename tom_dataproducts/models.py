@@ -13,6 +13,8 @@ from astropy.visualization import ZScaleInterval
 from tom_targets.models import Target
 from tom_observations.models import ObservationRecord
 from tom_common import utils as common_utils
+from tom_dataproducts.cutouts import create_cutout, DEFAULT_CUTOUT_SIZE
+from tom_dataproducts.storage import ContentAddressedStorage
 
 LIGHT_CURVE = ('light_curve', 'Light Curve')
 FITS_FILE = ('fits_file', 'Fits File')
@@ -20,7 +22,9 @@ IMAGE_FILE = ('image_file', 'Image File')
 
 
 def data_product_path(instance, filename):
-    # Uploads go to MEDIA_ROOT
+    # Uploads go to MEDIA_ROOT. Newly saved files are stored by the content
+    # addressed storage under the hash of their content, which only keeps
+    # the filename of this path.
     if instance.observation_record is not None:
         return '{0}/{1}/{2}'.format(instance.target.identifier, instance.observation_record.facility, filename)
     else:
@@ -54,7 +58,9 @@ class DataProduct(models.Model):
     product_id = models.CharField(max_length=2000, unique=True, null=True)
     target = models.ForeignKey(Target, on_delete=models.CASCADE)
     observation_record = models.ForeignKey(ObservationRecord, null=True, default=None, on_delete=models.CASCADE)
-    data = models.FileField(upload_to=data_product_path, null=True, default=None)
+    data = models.FileField(
+        upload_to=data_product_path, storage=ContentAddressedStorage(), max_length=255, null=True, default=None
+    )
     extra_data = models.TextField(blank=True, default='')
     group = models.ManyToManyField(DataProductGroup)
     created = models.DateTimeField(auto_now_add=True)
@@ -97,6 +103,15 @@ class DataProduct(models.Model):
             plt.close(fig)
         return b64encode(buffer.read()).decode('utf-8')
 
+    def get_cutout(self, ra=None, dec=None, size=DEFAULT_CUTOUT_SIZE, fmt='fits'):
+        """
+        Returns a cutout of size arcseconds around the given coordinates, which
+        default to the position of the target, as FITS or PNG bytes.
+        """
+        ra = self.target.ra if ra is None else ra
+        dec = self.target.dec if dec is None else dec
+        return create_cutout(self, ra, dec, size=size, fmt=fmt)
+
 
 class ReducedDatumSource(models.Model):
     name = models.CharField(
@@ -0,0 +1,61 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+BLOB_DIRECTORY = 'blobs'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File storage that deduplicates files by their content.
+
+    Files are stored as ``blobs/<aa>/<bb>/<sha256>/<filename>``, where the
+    sha256 is the hash of the file content and the first two levels are
+    sharded by its leading characters. Saving a file whose content is
+    already stored returns the existing name without writing anything, and
+    identical content saved under a different filename is hard linked to
+    the existing blob so that it only occupies disk space once.
+
+    Files stored before this storage was in use keep their original names
+    and are read and deleted as usual.
+    """
+
+    def blob_directory(self, digest):
+        return os.path.join(BLOB_DIRECTORY, digest[:2], digest[2:4], digest)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        directory = self.blob_directory(digest.hexdigest())
+        name = os.path.join(directory, self.get_valid_name(os.path.basename(name))).replace('\\', '/')
+
+        if self.exists(name):
+            return name
+        for existing in self.listdir(directory)[1] if self.exists(directory) else []:
+            try:
+                os.link(self.path(os.path.join(directory, existing)), self.path(name))
+                return name
+            except OSError:
+                break
+        return self._save(name, content)
+
+    def delete(self, name):
+        super().delete(name)
+        directory = os.path.dirname(self.path(name))
+        # Remove the blob and shard directories once they are empty
+        while directory.startswith(self.path(BLOB_DIRECTORY) + os.sep):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break
+            directory = os.path.dirname(directory)
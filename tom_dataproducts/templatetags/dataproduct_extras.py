@@ -6,7 +6,7 @@ import plotly.graph_objs as go
 from tom_targets.models import Target
 from tom_observations.models import ObservationRecord
 from tom_dataproducts.models import DataProduct, ReducedDatum
-from tom_dataproducts.forms import DataProductUploadForm
+from tom_dataproducts.forms import DataProductUploadForm, DataProductDownloadForm
 from tom_observations.facility import get_service_class
 
 register = template.Library()
@@ -20,16 +20,29 @@ def dataproduct_list_for_target(target):
     }
 
 
-@register.inclusion_tag('tom_dataproducts/partials/saved_dataproduct_list_for_observation.html')
-def dataproduct_list_for_observation_saved(observation_record):
-    products = get_service_class(observation_record.facility)().all_data_products(observation_record)
-    return {'products': products}
+@register.inclusion_tag('tom_dataproducts/partials/download_dataproducts_for_target.html')
+def download_dataproducts_for_target(target):
+    return {
+        'form': DataProductDownloadForm(target=target),
+        'target': target
+    }
 
 
-@register.inclusion_tag('tom_dataproducts/partials/unsaved_dataproduct_list_for_observation.html')
-def dataproduct_list_for_observation_unsaved(observation_record):
-    products = get_service_class(observation_record.facility)().all_data_products(observation_record)
-    return {'products': products}
+def _all_data_products(context, observation_record):
+    # Reuse the saved/unsaved split already computed by the observation detail view
+    if context.get('object') == observation_record and 'data_products' in context:
+        return context['data_products']
+    return get_service_class(observation_record.facility)().all_data_products(observation_record)
+
+
+@register.inclusion_tag('tom_dataproducts/partials/saved_dataproduct_list_for_observation.html', takes_context=True)
+def dataproduct_list_for_observation_saved(context, observation_record):
+    return {'products': _all_data_products(context, observation_record)}
+
+
+@register.inclusion_tag('tom_dataproducts/partials/unsaved_dataproduct_list_for_observation.html', takes_context=True)
+def dataproduct_list_for_observation_unsaved(context, observation_record):
+    return {'products': _all_data_products(context, observation_record)}
 
 
 @register.inclusion_tag('tom_dataproducts/partials/dataproduct_list.html')
@@ -1,12 +1,31 @@
+import os
+import tempfile
+import zipfile
+from datetime import datetime
+from io import BytesIO, StringIO
+
+import numpy as np
+from astropy.io import fits
+from astropy.wcs import WCS
 from django.test import TestCase, override_settings
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.urls import reverse
 from unittest.mock import patch
 
 from tom_observations.tests.utils import FakeFacility
 from tom_observations.tests.factories import TargetFactory, ObservingRecordFactory
-from tom_dataproducts.models import DataProduct
+from tom_dataproducts.models import DataProduct, DataProductGroup, ReducedDatum, ReducedDatumSource
+from tom_dataproducts.tiles import create_tile_pyramid, delete_tile_pyramid, get_pyramid_info
+from tom_dataproducts.tiles import tile_directory, tile_path
+
+
+def fits_file(name, data, header=None):
+    buffer = BytesIO()
+    fits.PrimaryHDU(data, header=header).writeto(buffer)
+    return SimpleUploadedFile(name, buffer.getvalue())
 
 
 @override_settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeFacility'])
@@ -51,6 +70,57 @@ class TestObservationDataViews(TestCase):
             self.assertTrue(mock.called)
             self.assertContains(response, 'Successfully saved: afile.fits')
 
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_save_all_dataproducts(self, dp_mock):
+        def fake_download(url):
+            if 'missing' in url:
+                raise Exception('404 Client Error')
+            dfile = tempfile.TemporaryFile()
+            dfile.write(url.encode())
+            dfile.seek(0)
+            return dfile
+
+        archive_products = [
+            {'id': 'testproductid', 'filename': 'afile.fits', 'url': 'https://archive/afile'},
+            {'id': 'newproductid', 'filename': 'bfile.fits', 'url': 'https://archive/bfile'},
+            {'id': 'missingproductid', 'filename': 'cfile.fits', 'url': 'https://archive/missing'},
+        ]
+        with patch.object(FakeFacility, 'data_products', return_value=archive_products), \
+                patch('tom_dataproducts.downloads.download_file', side_effect=fake_download) as download_mock:
+            FakeFacility().save_data_products(self.observation_record)
+            products = FakeFacility().save_data_products(self.observation_record)
+        # Saved products are not downloaded again, failed downloads are retried
+        self.assertEqual(download_mock.call_count, 3)
+        self.assertEqual(sorted(p.product_id for p in products), ['newproductid', 'testproductid'])
+        self.assertEqual(products.errors, [('cfile.fits', '404 Client Error')])
+        saved = DataProduct.objects.get(product_id='newproductid')
+        self.assertEqual(saved.data.read(), b'https://archive/bfile')
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_save_dataproduct_saved_concurrently(self, dp_mock):
+        archive_products = [{'id': 'newproductid', 'filename': 'bfile.fits', 'url': 'https://archive/bfile'}]
+        get = DataProduct.objects.get
+
+        def saved_by_other_request(**kwargs):
+            # Another request saves the product right after it was found missing
+            if not DataProduct.objects.filter(**kwargs).exists():
+                DataProduct.objects.create(product_id='newproductid', target=self.target)
+                raise DataProduct.DoesNotExist
+            return get(**kwargs)
+
+        def fake_download(url):
+            dfile = tempfile.TemporaryFile()
+            dfile.write(b'bfile')
+            dfile.seek(0)
+            return dfile
+
+        with patch.object(FakeFacility, 'data_products', return_value=archive_products), \
+                patch('tom_dataproducts.downloads.download_file', side_effect=fake_download), \
+                patch.object(DataProduct.objects, 'get', side_effect=saved_by_other_request):
+            products = FakeFacility().save_data_products(self.observation_record)
+        self.assertEqual([p.pk for p in products], [DataProduct.objects.get(product_id='newproductid').pk])
+        self.assertEqual(products.errors, [])
+
     def test_tag_file(self, dp_mock):
         self.client.post(
             reverse('tom_dataproducts:tag', kwargs={'pk': self.data_product.id}),
@@ -58,3 +128,216 @@ class TestObservationDataViews(TestCase):
         )
         self.data_product.refresh_from_db()
         self.assertEqual(self.data_product.tag, 'fits_file')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class TestTilePyramid(TestCase):
+    def setUp(self):
+        self.target = TargetFactory.create()
+        self.data_product = DataProduct.objects.create(
+            product_id='testtileid',
+            target=self.target,
+            data=fits_file('mosaic.fits', np.random.normal(100, 10, (300, 600)).astype(np.float32)),
+            tag='fits_file'
+        )
+        user = User.objects.create_user(username='test', email='test@example.com')
+        self.client.force_login(user)
+
+    def tearDown(self):
+        delete_tile_pyramid(self.data_product)
+
+    def test_create_tile_pyramid(self):
+        info = create_tile_pyramid(self.data_product)
+        self.assertEqual(info['max_level'], 10)
+        self.assertEqual(get_pyramid_info(self.data_product), info)
+        # Full resolution is 3 tiles across and 2 down, the next level fits in 2 by 1
+        self.assertTrue(os.path.exists(tile_path(self.data_product, 10, 2, 1)))
+        self.assertFalse(os.path.exists(tile_path(self.data_product, 10, 3, 0)))
+        self.assertTrue(os.path.exists(tile_path(self.data_product, 9, 1, 0)))
+        self.assertFalse(os.path.exists(tile_path(self.data_product, 9, 1, 1)))
+        self.assertTrue(os.path.exists(tile_path(self.data_product, 0, 0, 0)))
+
+    @override_settings(JOB_RUNNER='worker')
+    def test_tile_viewer_queues_pyramid(self):
+        response = self.client.get(reverse('tom_dataproducts:tiles', kwargs={'pk': self.data_product.id}))
+        self.assertContains(response, 'being generated', status_code=202)
+        self.assertIsNone(get_pyramid_info(self.data_product))
+        call_command('processjobs', once=True, stdout=StringIO())
+        response = self.client.get(reverse('tom_dataproducts:tiles', kwargs={'pk': self.data_product.id}))
+        self.assertContains(response, 'maxLevel: 10')
+        response = self.client.get(reverse(
+            'tom_dataproducts:tile', kwargs={'pk': self.data_product.id, 'level': 10, 'x': 0, 'y': 0}
+        ))
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+    def test_pyramid_replaced(self):
+        create_tile_pyramid(self.data_product)
+        stale_tile = tile_path(self.data_product, 10, 5, 5)
+        open(stale_tile, 'w').close()
+        create_tile_pyramid(self.data_product)
+        self.assertFalse(os.path.exists(stale_tile))
+        self.assertTrue(os.path.exists(tile_path(self.data_product, 10, 2, 1)))
+        self.assertEqual(os.listdir(os.path.dirname(tile_directory(self.data_product))), [str(self.data_product.id)])
+
+    def test_tile_viewer_of_other_products(self):
+        product = DataProduct.objects.create(
+            target=self.target, data=SimpleUploadedFile('curve.txt', b'lightcurve'), tag='light_curve'
+        )
+        response = self.client.get(reverse('tom_dataproducts:tiles', kwargs={'pk': product.id}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_missing_tile(self):
+        response = self.client.get(reverse(
+            'tom_dataproducts:tile', kwargs={'pk': self.data_product.id, 'level': 3, 'x': 9, 'y': 9}
+        ))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class TestCutouts(TestCase):
+    def setUp(self):
+        self.target = TargetFactory.create(ra=150.0, dec=2.0)
+        wcs = WCS(naxis=2)
+        wcs.wcs.ctype = ['RA---TAN', 'DEC--TAN']
+        wcs.wcs.crval = [150.0, 2.0]
+        wcs.wcs.crpix = [100.5, 100.5]
+        wcs.wcs.cdelt = [-1 / 3600, 1 / 3600]
+        self.data_product = DataProduct.objects.create(
+            product_id='testcutoutid',
+            target=self.target,
+            data=fits_file('frame.fits', np.arange(40000, dtype=np.float32).reshape(200, 200), wcs.to_header()),
+            tag='fits_file'
+        )
+        user = User.objects.create_user(username='test', email='test@example.com')
+        self.client.force_login(user)
+
+    def test_cutout_around_target(self):
+        cutout = fits.open(BytesIO(self.data_product.get_cutout(size=10)))[0]
+        self.assertEqual(cutout.data.shape, (10, 10))
+        self.assertEqual(cutout.data[0, 0], 95 * 200 + 95)
+        self.assertAlmostEqual(WCS(cutout.header).wcs.crval[0], 150.0)
+
+    def test_cutout_view(self):
+        response = self.client.get(
+            reverse('tom_dataproducts:cutout', kwargs={'pk': self.data_product.id}),
+            data={'ra': 150.001, 'dec': 2.0, 'size': 20, 'format': 'png'}
+        )
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+    def test_cutout_size_limited(self):
+        with patch('tom_dataproducts.cutouts.MAX_CUTOUT_SIZE', 20):
+            cutout = fits.open(BytesIO(self.data_product.get_cutout(size=1e6)))[0]
+        self.assertEqual(cutout.data.shape, (20, 20))
+        response = self.client.get(
+            reverse('tom_dataproducts:cutout', kwargs={'pk': self.data_product.id}), data={'size': -5}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_cutout_of_target_without_coordinates(self):
+        self.target.ra = self.target.dec = None
+        self.target.save()
+        response = self.client.get(reverse('tom_dataproducts:cutout', kwargs={'pk': self.data_product.id}))
+        self.assertEqual(response.status_code, 400)
+
+    def test_cutout_of_other_products(self):
+        product = DataProduct.objects.create(
+            target=self.target, data=SimpleUploadedFile('curve.txt', b'lightcurve'), tag='light_curve'
+        )
+        response = self.client.get(reverse('tom_dataproducts:cutout', kwargs={'pk': product.id}))
+        self.assertEqual(response.status_code, 400)
+
+    def test_cutout_outside_image(self):
+        response = self.client.get(
+            reverse('tom_dataproducts:cutout', kwargs={'pk': self.data_product.id}),
+            data={'ra': 10.0, 'dec': -40.0}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class TestContentAddressedStorage(TestCase):
+    def setUp(self):
+        self.target = TargetFactory.create()
+        self.other_target = TargetFactory.create()
+
+    def create_product(self, target, name, content):
+        return DataProduct.objects.create(target=target, data=SimpleUploadedFile(name, content))
+
+    def test_identical_files_are_stored_once(self):
+        first = self.create_product(self.target, 'afile.fits', b'somedata')
+        second = self.create_product(self.other_target, 'afile.fits', b'somedata')
+        renamed = self.create_product(self.target, 'bfile.fits', b'somedata')
+        different = self.create_product(self.target, 'afile.fits', b'otherdata')
+        self.assertEqual(first.data.name, second.data.name)
+        self.assertEqual(renamed.get_file_name(), 'bfile.fits')
+        self.assertEqual(os.stat(first.data.path).st_ino, os.stat(renamed.data.path).st_ino)
+        self.assertNotEqual(first.data.name, different.data.name)
+
+    def test_blob_removed_with_last_reference(self):
+        first = self.create_product(self.target, 'afile.fits', b'somedata')
+        second = self.create_product(self.other_target, 'afile.fits', b'somedata')
+        path = first.data.path
+        first.delete()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(second.data.read(), b'somedata')
+        second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(os.path.dirname(path)))
+
+    def test_blob_removed_with_cascade_and_queryset_deletes(self):
+        first = self.create_product(self.target, 'afile.fits', b'somedata')
+        second = self.create_product(self.target, 'bfile.fits', b'otherdata')
+        third = self.create_product(self.other_target, 'cfile.fits', b'moredata')
+        self.target.delete()
+        self.assertFalse(os.path.exists(first.data.path))
+        self.assertFalse(os.path.exists(second.data.path))
+        self.assertTrue(os.path.exists(third.data.path))
+        DataProduct.objects.filter(target=self.other_target).delete()
+        self.assertFalse(os.path.exists(third.data.path))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class TestTargetDataDownload(TestCase):
+    def setUp(self):
+        self.target = TargetFactory.create(identifier='sn2019abc')
+        self.fits_product = DataProduct.objects.create(
+            target=self.target, data=SimpleUploadedFile('afile.fits', b'fitsdata'), tag='fits_file'
+        )
+        self.curve_product = DataProduct.objects.create(
+            target=self.target, data=SimpleUploadedFile('curve.txt', b'lightcurve'), tag='light_curve'
+        )
+        self.group = DataProductGroup.objects.create(name='grouped')
+        self.curve_product.group.add(self.group)
+        ReducedDatum.objects.create(
+            source=ReducedDatumSource.objects.create(name='MARS'),
+            target=self.target,
+            data_type='PHOTOMETRY',
+            timestamp=timezone.make_aware(datetime(2019, 2, 1)),
+            value=18.5,
+            error=0.1,
+            label='r'
+        )
+        user = User.objects.create_user(username='test', email='test@example.com')
+        self.client.force_login(user)
+
+    def download(self, **params):
+        response = self.client.get(
+            reverse('tom_dataproducts:download', kwargs={'pk': self.target.id}), data=params
+        )
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        return zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+
+    def test_download_all(self):
+        archive = self.download(photometry='on')
+        self.assertEqual(
+            sorted(archive.namelist()),
+            ['sn2019abc/afile.fits', 'sn2019abc/curve.txt', 'sn2019abc/photometry.csv']
+        )
+        self.assertEqual(archive.read('sn2019abc/afile.fits'), b'fitsdata')
+        photometry = archive.read('sn2019abc/photometry.csv').decode('utf-8').splitlines()
+        self.assertEqual(photometry[1], '2019-02-01T00:00:00+00:00,r,18.5,0.1,MARS')
+
+    def test_download_filtered(self):
+        self.assertEqual(self.download(tag='fits_file').namelist(), ['sn2019abc/afile.fits'])
+        self.assertEqual(self.download(group=self.group.id).namelist(), ['sn2019abc/curve.txt'])
+        self.assertEqual(self.download(products=[self.fits_product.id]).namelist(), ['sn2019abc/afile.fits'])
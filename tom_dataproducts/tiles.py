@@ -0,0 +1,191 @@
+import errno
+import json
+import math
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg') # noqa
+import matplotlib.pyplot as plt
+from astropy.io import fits
+from astropy.visualization import ZScaleInterval
+from django.conf import settings
+
+TILE_SIZE = 256
+TILE_FORMAT = 'png'
+PYRAMID_DESCRIPTOR = 'pyramid.json'
+
+# Number of image rows scaled to 8 bit at once, so that memory mapped
+# mosaics are never fully converted to floating point in memory.
+STRIP_ROWS = 1024
+
+
+def tile_directory(product):
+    """
+    Returns the directory in which the tile pyramid for a data product is stored.
+    """
+    return os.path.join(settings.MEDIA_ROOT, 'tiles', str(product.id))
+
+
+def tile_path(product, level, x, y):
+    return _tile_file(tile_directory(product), level, x, y)
+
+
+def _tile_file(directory, level, x, y):
+    return os.path.join(directory, str(level), '{0}_{1}.{2}'.format(x, y, TILE_FORMAT))
+
+
+def get_pyramid_info(product):
+    """
+    Returns the descriptor of a previously generated tile pyramid, or None if
+    the pyramid has not been generated yet.
+    """
+    try:
+        with open(os.path.join(tile_directory(product), PYRAMID_DESCRIPTOR)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_tileable(product):
+    """
+    Returns whether a tile pyramid can be generated for a data product,
+    which must be a FITS file.
+    """
+    return bool(product.data) and product.get_file_extension() in product.FITS_EXTENSIONS
+
+
+def delete_tile_pyramid(product):
+    shutil.rmtree(tile_directory(product), ignore_errors=True)
+
+
+def _replace_directory(source, destination):
+    """
+    Moves a directory into place, replacing any existing directory with the
+    same name. A directory is never left half written, as the tiles of a
+    pyramid are only moved in once all of them exist.
+    """
+    while True:
+        try:
+            os.replace(source, destination)
+            return
+        except OSError as e:
+            if e.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                raise
+            # os.replace only replaces empty directories, so move the existing
+            # pyramid out of the way first. Another process may do the same
+            # at the same time, in which case the next attempt succeeds.
+            old = tempfile.mkdtemp(dir=os.path.dirname(destination), prefix='.old-')
+            try:
+                os.replace(destination, os.path.join(old, 'pyramid'))
+            except FileNotFoundError:
+                pass
+            finally:
+                shutil.rmtree(old, ignore_errors=True)
+
+
+def _scale_to_bytes(data):
+    """
+    Scales image data to 8 bit greyscale using zscale limits computed from a
+    subsample of the image, working through the image in strips of rows.
+    """
+    height, width = data.shape
+    step = max(1, int(math.sqrt(height * width / 1e6)))
+    interval = ZScaleInterval(nsamples=2000, contrast=0.1)
+    vmin, vmax = interval.get_limits(np.asarray(data[::step, ::step], dtype=np.float32))
+    span = (vmax - vmin) or 1.0
+
+    image = np.empty((height, width), dtype=np.uint8)
+    for start in range(0, height, STRIP_ROWS):
+        strip = np.asarray(data[start:start + STRIP_ROWS], dtype=np.float32)
+        strip = np.nan_to_num((strip - vmin) / span)
+        image[start:start + STRIP_ROWS] = np.clip(strip, 0, 1) * 255
+    # FITS images have their origin in the lower left corner, tiles in the upper left
+    return np.flipud(image)
+
+
+def _downsample(image):
+    """
+    Halves the resolution of an image by averaging 2x2 blocks of pixels,
+    padding odd dimensions by repeating the last row or column.
+    """
+    height, width = image.shape
+    if height % 2:
+        image = np.vstack([image, image[-1:]])
+    if width % 2:
+        image = np.hstack([image, image[:, -1:]])
+    blocks = image.astype(np.uint16)
+    blocks = blocks[0::2, 0::2] + blocks[1::2, 0::2] + blocks[0::2, 1::2] + blocks[1::2, 1::2]
+    return (blocks // 4).astype(np.uint8)
+
+
+def create_tile_pyramid(product, tile_size=TILE_SIZE):
+    """
+    Generates a deep zoom style tile pyramid for a FITS data product.
+
+    Level ``max_level`` holds the image at full resolution, and every level
+    below it halves the resolution of the previous one, down to level 0
+    which is a single pixel. Each level is cut into ``tile_size`` square
+    tiles, stored as ``<level>/<column>_<row>.png`` in the product's tile
+    directory, so that a viewer only needs to fetch the tiles covering the
+    visible region at the resolution it is displaying.
+
+    Generating the pyramid of a large mosaic takes a while, so this is run
+    by the createtiles management command rather than in a request. The
+    pyramid is built in a temporary directory and moved into place when it
+    is complete, so that concurrent builds and views never see a partial
+    pyramid.
+
+    Parameters
+    ----------
+    product : DataProduct
+        The FITS data product to generate tiles for
+    tile_size : int
+        Width and height of each tile, in pixels
+
+    Returns
+    -------
+    dict
+        Descriptor of the generated pyramid, containing the image width,
+        height, tile size, format and the maximum level
+
+    """
+    extname = product.FITS_EXTENSIONS.get(product.get_file_extension(), 0)
+    with fits.open(product.data.path, memmap=True) as hdul:
+        image = _scale_to_bytes(hdul[extname].data)
+
+    height, width = image.shape
+    max_level = int(math.ceil(math.log2(max(width, height, 1))))
+    destination = tile_directory(product)
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    directory = tempfile.mkdtemp(dir=os.path.dirname(destination), prefix='.{0}-'.format(product.id))
+
+    try:
+        for level in range(max_level, -1, -1):
+            os.makedirs(os.path.join(directory, str(level)))
+            level_height, level_width = image.shape
+            for y in range(0, int(math.ceil(level_height / tile_size))):
+                for x in range(0, int(math.ceil(level_width / tile_size))):
+                    tile = image[y * tile_size:(y + 1) * tile_size, x * tile_size:(x + 1) * tile_size]
+                    plt.imsave(
+                        _tile_file(directory, level, x, y), tile, cmap='gray', vmin=0, vmax=255, format=TILE_FORMAT
+                    )
+            image = _downsample(image)
+
+        info = {
+            'width': width,
+            'height': height,
+            'tile_size': tile_size,
+            'format': TILE_FORMAT,
+            'max_level': max_level
+        }
+        with open(os.path.join(directory, PYRAMID_DESCRIPTOR), 'w') as f:
+            json.dump(info, f)
+        # mkdtemp creates the directory readable by its owner only
+        os.chmod(directory, 0o755)
+        _replace_directory(directory, destination)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return info
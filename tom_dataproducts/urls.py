@@ -4,7 +4,8 @@ from tom_dataproducts.views import DataProductListView, DataProductSaveView, Dat
 from tom_dataproducts.views import DataProductDeleteView, DataProductGroupCreateView
 from tom_dataproducts.views import DataProductGroupDetailView, DataProductGroupDataView, DataProductGroupDeleteView
 from tom_dataproducts.views import DataProductUploadView, DataProductFeatureView, DataProductTagView
-from tom_dataproducts.views import UpdateReducedDataGroupingView
+from tom_dataproducts.views import UpdateReducedDataGroupingView, DataProductTileViewerView, DataProductTileView
+from tom_dataproducts.views import DataProductCutoutView, DataProductDownloadView
 
 app_name = 'tom_dataproducts'
 
@@ -16,9 +17,13 @@ urlpatterns = [
     path('data/group/<pk>/', DataProductGroupDetailView.as_view(), name='group-detail'),
     path('data/group/<pk>/delete/', DataProductGroupDeleteView.as_view(), name='group-delete'),
     path('data/upload/', DataProductUploadView.as_view(), name='upload'),
+    path('data/target/<pk>/download/', DataProductDownloadView.as_view(), name='download'),
     path('data/reduced/update/', UpdateReducedDataGroupingView.as_view(), name='update-reduced-data'),
     path('data/<pk>/delete/', DataProductDeleteView.as_view(), name='delete'),
     path('data/<pk>/feature/', DataProductFeatureView.as_view(), name='feature'),
     path('data/<pk>/tag/', DataProductTagView.as_view(), name='tag'),
+    path('data/<pk>/cutout/', DataProductCutoutView.as_view(), name='cutout'),
+    path('data/<pk>/tiles/', DataProductTileViewerView.as_view(), name='tiles'),
+    path('data/<pk>/tiles/<int:level>/<int:x>_<int:y>.png', DataProductTileView.as_view(), name='tile'),
     path('<pk>/save/', DataProductSaveView.as_view(), name='save'),
 ]
@@ -1,5 +1,4 @@
 from urllib.parse import urlparse
-from io import StringIO
 
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic.edit import FormView, DeleteView
@@ -9,41 +8,52 @@ from django.views.generic import View, ListView
 from django.views.generic.base import RedirectView
 from django.views.generic.detail import DetailView
 from django.urls import reverse, reverse_lazy
-from django.shortcuts import redirect
+from django.shortcuts import redirect, get_object_or_404
 from django.contrib import messages
-from django.core.management import call_command
 from django.core.cache import cache
 from django.core.cache.utils import make_template_fragment_key
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, FileResponse, Http404, HttpResponse, HttpResponseBadRequest
+from django.http import StreamingHttpResponse
+from astropy.nddata.utils import NoOverlapError
 
 from .models import DataProduct, DataProductGroup
-from .forms import AddProductToGroupForm, DataProductUploadForm
+from .forms import AddProductToGroupForm, DataProductUploadForm, DataProductDownloadForm
+from .export import target_data_archive
+from .cutouts import CUTOUT_FORMATS, DEFAULT_CUTOUT_SIZE
+from .tiles import delete_tile_pyramid, get_pyramid_info, is_tileable, tile_path
 from tom_observations.models import ObservationRecord
+from tom_targets.models import Target
 from tom_observations.facility import get_service_class
+from tom_common.jobs import enqueue, job_message
 
 
 class DataProductSaveView(LoginRequiredMixin, View):
     def post(self, request, *args, **kwargs):
-        service_class = get_service_class(request.POST['facility'])
+        facility = get_service_class(request.POST['facility'])()
         observation_record = ObservationRecord.objects.get(pk=kwargs['pk'])
         products = request.POST.getlist('products')
+        download_errors = []
         if not products:
             messages.warning(request, 'No products were saved, please select at least one dataproduct')
         elif products[0] == 'ALL':
-            products = service_class().save_data_products(observation_record)
+            products = facility.save_data_products(observation_record)
+            download_errors.extend(getattr(products, 'errors', []))
             messages.success(request, 'Saved all available data products')
         else:
             for product in products:
-                products = service_class().save_data_products(
+                products = facility.save_data_products(
                     observation_record,
                     product
                 )
+                download_errors.extend(getattr(products, 'errors', []))
                 messages.success(
                     request,
                     'Successfully saved: {0}'.format('\n'.join(
                         [str(p) for p in products]
                     ))
                 )
+        for filename, error in download_errors:
+            messages.error(request, 'Failed to save {0}: {1}'.format(filename, error))
         return redirect(reverse(
             'tom_observations:detail',
             kwargs={'pk': observation_record.id})
@@ -106,6 +116,25 @@ class DataProductUploadView(LoginRequiredMixin, FormView):
             return super().form_invalid(form)
 
 
+class DataProductDownloadView(LoginRequiredMixin, View):
+    """
+    Streams a ZIP archive of the selected data products of a target, and of its
+    photometry as CSV, without building the archive in memory or on disk.
+    """
+    def get(self, request, *args, **kwargs):
+        target = get_object_or_404(Target, pk=kwargs['pk'])
+        form = DataProductDownloadForm(request.GET, target=target)
+        if not form.is_valid():
+            return HttpResponseBadRequest(form.errors.as_text())
+        products = form.filter_products(target.dataproduct_set.all())
+        response = StreamingHttpResponse(
+            target_data_archive(target, products.iterator(), photometry=form.cleaned_data['photometry']),
+            content_type='application/zip'
+        )
+        response['Content-Disposition'] = 'attachment; filename="{0}_data.zip"'.format(target.identifier)
+        return response
+
+
 class DataProductDeleteView(LoginRequiredMixin, DeleteView):
     model = DataProduct
     success_url = reverse_lazy('home')
@@ -116,7 +145,7 @@ class DataProductDeleteView(LoginRequiredMixin, DeleteView):
         return referer
 
     def delete(self, request, *args, **kwargs):
-        self.get_object().data.delete()
+        delete_tile_pyramid(self.get_object())
         return super().delete(request, *args, **kwargs)
 
     def get_context_data(self, *args, **kwargs):
@@ -166,6 +195,65 @@ class DataProductFeatureView(View):
         )
 
 
+class DataProductTileViewerView(DetailView):
+    """
+    Displays a FITS data product using its tile pyramid, so that only the tiles
+    covering the visible region are fetched. If the createtiles management
+    command has not generated the pyramid yet, it is queued as a background
+    job and the page says so until the pyramid is ready.
+    """
+    model = DataProduct
+    template_name = 'tom_dataproducts/dataproduct_tiles.html'
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        if not is_tileable(self.object):
+            raise Http404('Only FITS data products can be viewed as tiles')
+        context = self.get_context_data(object=self.object)
+        if context['pyramid'] is None:
+            job, created = enqueue('createtiles', product_id=str(self.object.id))
+            messages.info(request, job_message(job, created, 'Generating the tiles'))
+            return self.render_to_response(context, status=202)
+        return self.render_to_response(context)
+
+    def get_context_data(self, *args, **kwargs):
+        context = super().get_context_data(*args, **kwargs)
+        context['pyramid'] = get_pyramid_info(self.object)
+        return context
+
+
+class DataProductTileView(View):
+    def get(self, request, *args, **kwargs):
+        product = get_object_or_404(DataProduct, pk=kwargs['pk'])
+        try:
+            return FileResponse(
+                open(tile_path(product, kwargs['level'], kwargs['x'], kwargs['y']), 'rb'),
+                content_type='image/png'
+            )
+        except OSError:
+            raise Http404('No such tile')
+
+
+class DataProductCutoutView(View):
+    """
+    Returns a small FITS or PNG stamp cut out of a FITS data product, centered
+    on the ra and dec query parameters or on the target when they are omitted.
+    """
+    def get(self, request, *args, **kwargs):
+        product = get_object_or_404(DataProduct, pk=kwargs['pk'])
+        fmt = request.GET.get('format', 'fits')
+        try:
+            ra = float(request.GET['ra']) if request.GET.get('ra') else None
+            dec = float(request.GET['dec']) if request.GET.get('dec') else None
+            size = float(request.GET.get('size', DEFAULT_CUTOUT_SIZE))
+            cutout = product.get_cutout(ra=ra, dec=dec, size=size, fmt=fmt)
+        except (ValueError, NoOverlapError) as e:
+            return HttpResponseBadRequest(str(e))
+        response = HttpResponse(cutout, content_type=CUTOUT_FORMATS[fmt])
+        response['Content-Disposition'] = 'inline; filename="cutout_{0}.{1}"'.format(product.id, fmt)
+        return response
+
+
 class DataProductGroupDetailView(DetailView):
     model = DataProductGroup
 
@@ -212,12 +300,11 @@ class DataProductGroupDataView(LoginRequiredMixin, FormView):
 class UpdateReducedDataGroupingView(LoginRequiredMixin, RedirectView):
     def get(self, request, *args, **kwargs):
         target_id = request.GET.get('target_id', None)
-        out = StringIO()
         if target_id:
-            call_command('updatereduceddata', target_id=target_id, stdout=out)
+            job, created = enqueue('updatereduceddata', target_id=target_id)
         else:
-            call_command('updatereduceddata', stdout=out)
-        messages.info(request, out.getvalue())
+            job, created = enqueue('updatereduceddata')
+        messages.info(request, job_message(job, created, 'Data update'))
         return HttpResponseRedirect(self.get_redirect_url(*args, **kwargs))
 
     def get_redirect_url(self):
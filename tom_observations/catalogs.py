@@ -0,0 +1,79 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Determine settings for this module. A catalog is refreshed once it is older
+# than ttl seconds, but the previous copy keeps being served for up to
+# max_age seconds while the refresh happens in the background.
+CATALOG_SETTINGS = {
+    'ttl': 3600,
+    'max_age': 7 * 86400,
+    'refresh_timeout': 120,
+    **getattr(settings, 'FACILITY_CATALOG_SETTINGS', {})
+}
+
+
+def _catalog_key(name):
+    return 'facility_catalog_{0}'.format(name)
+
+
+def refresh_catalog(name, fetch):
+    """
+    Fetches a catalog and stores it in the cache, returning its content.
+    """
+    content = fetch()
+    cache.set(_catalog_key(name), {'content': content, 'fetched': time.time()}, CATALOG_SETTINGS['max_age'])
+    return content
+
+
+def _refresh_in_background(name, fetch):
+    lock_key = _catalog_key(name) + '_refreshing'
+    # Only one worker refreshes a given catalog at a time
+    if not cache.add(lock_key, True, CATALOG_SETTINGS['refresh_timeout']):
+        return
+
+    def refresh():
+        try:
+            refresh_catalog(name, fetch)
+        except Exception as e:
+            logger.warning('Could not refresh catalog %s: %s', name, e)
+        finally:
+            cache.delete(lock_key)
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def get_catalog(name, fetch):
+    """
+    Returns a facility catalog, such as the instruments or proposals
+    available at a facility, from the cache.
+
+    Catalogs are served stale-while-revalidate: once the cached copy is
+    older than the ttl it is still returned immediately while a background
+    thread fetches a fresh one. The facility is only queried synchronously
+    when no copy is cached at all.
+
+    Parameters
+    ----------
+    name : str
+        Name identifying the catalog in the cache
+    fetch : callable
+        Function without arguments that returns the content of the catalog
+
+    Returns
+    -------
+    object
+        The content of the catalog, as returned by fetch
+
+    """
+    entry = cache.get(_catalog_key(name))
+    if entry is None:
+        return refresh_catalog(name, fetch)
+    if time.time() - entry['fetched'] > CATALOG_SETTINGS['ttl']:
+        _refresh_in_background(name, fetch)
+    return entry['content']
@@ -1,10 +1,10 @@
-import requests
 from django.conf import settings
 from django import forms
 from dateutil.parser import parse
 from crispy_forms.layout import Layout, Div
 
 from tom_observations.facility import GenericObservationForm
+from tom_common import http_client
 from tom_common.exceptions import ImproperCredentialsException
 from tom_observations.facility import GenericObservationFacility
 from tom_targets.models import Target
@@ -51,7 +51,7 @@ SITES = {
 
 
 def make_request(*args, **kwargs):
-    response = requests.request(*args, **kwargs)
+    response = http_client.request(*args, **kwargs)
     if 400 <= response.status_code < 500:
         print('Request failed: {}'.format(response.content))
         raise ImproperCredentialsException('GEM')
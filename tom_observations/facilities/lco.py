@@ -1,4 +1,3 @@
-import requests
 from django.conf import settings
 from django import forms
 from dateutil.parser import parse
@@ -8,6 +7,8 @@ from django.core.cache import cache
 import datetime
 
 from tom_observations.facility import GenericObservationForm
+from tom_observations.catalogs import get_catalog, refresh_catalog
+from tom_common import http_client
 from tom_common.exceptions import ImproperCredentialsException
 from tom_observations.facility import GenericObservationFacility
 from tom_targets.models import Target
@@ -23,6 +24,7 @@ except (AttributeError, KeyError):
 
 # Module specific settings.
 PORTAL_URL = LCO_SETTINGS['portal_url']
+ARCHIVE_URL = 'https://archive-api.lco.global'
 TERMINAL_OBSERVING_STATES = ['COMPLETED', 'CANCELED', 'WINDOW_EXPIRED']
 
 # The SITES dictionary is used to calculate visibility intervals in the
@@ -71,7 +73,7 @@ SITES = {
 
 
 def make_request(*args, **kwargs):
-    response = requests.request(*args, **kwargs)
+    response = http_client.request(*args, **kwargs)
     if 400 <= response.status_code < 500:
         raise ImproperCredentialsException('LCO: ' + str(response.content))
     response.raise_for_status()
@@ -101,7 +103,7 @@ def _flatten_error_dict(form, error_dict):
     return non_field_errors
 
 
-def _get_instruments():
+def _fetch_instruments():
     response = make_request(
         'GET',
         PORTAL_URL + '/api/instruments/',
@@ -110,6 +112,19 @@ def _get_instruments():
     return response.json()
 
 
+def _fetch_proposals():
+    response = make_request(
+        'GET',
+        PORTAL_URL + '/api/profile/',
+        headers={'Authorization': 'Token {0}'.format(LCO_SETTINGS['api_key'])}
+    )
+    return response.json()['proposals']
+
+
+def _get_instruments():
+    return get_catalog('lco_instruments', _fetch_instruments)
+
+
 def _instrument_choices():
     return [(k, k) for k in _get_instruments()]
 
@@ -119,13 +134,8 @@ def _filter_choices():
 
 
 def _proposal_choices():
-    response = make_request(
-        'GET',
-        PORTAL_URL + '/api/profile/',
-        headers={'Authorization': 'Token {0}'.format(LCO_SETTINGS['api_key'])}
-    )
     choices = []
-    for p in response.json()['proposals']:
+    for p in get_catalog('lco_proposals', _fetch_proposals):
         if p['current']:
             choices.append((p['id'], '{} ({})'.format(p['title'], p['id'])))
     return choices
@@ -348,6 +358,10 @@ class LCOFacility(GenericObservationFacility):
     def get_observing_sites(self):
         return SITES
 
+    def refresh_catalogs(self):
+        refresh_catalog('lco_instruments', _fetch_instruments)
+        refresh_catalog('lco_proposals', _fetch_proposals)
+
     def get_observation_status(self, observation_id):
         response = make_request(
             'GET',
@@ -357,15 +371,13 @@ class LCOFacility(GenericObservationFacility):
         return response.json()['state']
 
     def data_products(self, observation_id, product_id=None):
-        products = []
         for frame in self._archive_frames(observation_id, product_id):
-            products.append({
+            yield {
                 'id': frame['id'],
                 'filename': frame['filename'],
                 'created': parse(frame['DATE_OBS']),
                 'url': frame['url']
-            })
-        return products
+            }
 
     # The following methods are used internally by this module
     # and should not be called directly from outside code.
@@ -396,21 +408,20 @@ class LCOFacility(GenericObservationFacility):
             return {}
 
     def _archive_frames(self, observation_id, product_id=None):
-        # todo save this key somewhere
-        frames = []
+        # Frames are yielded as each page of the archive listing arrives,
+        # following the next links until the listing is exhausted.
+        headers = self._archive_headers()
         if product_id:
             response = make_request(
                 'GET',
-                'https://archive-api.lco.global/frames/{0}/'.format(product_id),
-                headers=self._archive_headers()
+                ARCHIVE_URL + '/frames/{0}/'.format(product_id),
+                headers=headers
             )
-            frames = [response.json()]
+            yield response.json()
         else:
-            response = make_request(
-                'GET',
-                'https://archive-api.lco.global/frames/?REQNUM={0}'.format(observation_id),
-                headers=self._archive_headers()
-            )
-            frames = response.json()['results']
-
-        return frames
+            url = ARCHIVE_URL + '/frames/?REQNUM={0}'.format(observation_id)
+            while url:
+                response = make_request('GET', url, headers=headers)
+                page = response.json()
+                yield from page['results']
+                url = page.get('next')
@@ -1,10 +1,10 @@
-import requests
 from django.conf import settings
 from django import forms
 from dateutil.parser import parse
 from crispy_forms.layout import Layout, Div, HTML
 from crispy_forms.bootstrap import PrependedAppendedText, PrependedText
 
+from tom_common import http_client
 from tom_observations.facility import GenericObservationForm
 from tom_observations.facility import GenericObservationFacility
 from tom_targets.models import Target
@@ -193,8 +193,8 @@ class SNExGemini(GenericObservationFacility):
     def submit_observation(clz, observation_payloads):
         new_observation_ids = []
         for observation_payload in observation_payloads:
-            response = requests.post(PORTAL_URL[get_site_code_from_program(observation_payload['prog'])] ,
-                                     verify=False, params=observation_payload)
+            response = http_client.post(PORTAL_URL[get_site_code_from_program(observation_payload['prog'])] ,
+                                        verify=False, params=observation_payload)
             # Note this assumes that if there is an error with the api, it will happen on the first payload
             # If it happens on a later payload, we could end up with partially submitted requests
             # we could in principle try to roll back the successful calls using the observation ids we just got.
@@ -3,14 +3,33 @@ from django import forms
 from importlib import import_module
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Submit, Layout
-from django.core.files.base import ContentFile
+from django.core.files import File
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from abc import ABC, abstractmethod
-import requests
+from concurrent.futures import ThreadPoolExecutor
 import json
 
+from requests.exceptions import RequestException
+
+from tom_common.exceptions import ServiceUnavailableException
 from tom_targets.models import Target
 
 
+# How long, in seconds, listings of the data products of an observation are
+# cached for. Observations in a terminal state are not expected to produce
+# new data, so their listings are kept for longer.
+DATA_PRODUCT_CACHE_TIMEOUTS = {
+    'active': 300,
+    'terminal': 7 * 86400,
+    **getattr(settings, 'DATA_PRODUCT_CACHE_TIMEOUTS', {})
+}
+
+# Maximum number of concurrent status requests made to a facility that does
+# not provide statuses for many observations in one call.
+STATUS_SWEEP_WORKERS = getattr(settings, 'STATUS_SWEEP_WORKERS', 8)
+
 DEFAULT_FACILITY_CLASSES = [
         'tom_observations.facilities.lco.LCOFacility',
         'tom_observations.facilities.gemini.GEMFacility',
@@ -43,6 +62,16 @@ def get_service_class(name):
         raise ImportError('Could not a find a facility with that name. Did you add it to TOM_FACILITY_CLASSES?')
 
 
+class SavedDataProducts(list):
+    """
+    The data products saved by save_data_products, with the (filename, error)
+    tuples of those that could not be downloaded as errors.
+    """
+    def __init__(self, products=(), errors=()):
+        super().__init__(products)
+        self.errors = list(errors)
+
+
 class GenericObservationFacility(ABC):
     """
     The facility class contains all the logic specific to the facility it is
@@ -56,6 +85,7 @@ class GenericObservationFacility(ABC):
     For an implementation example please see
     https://github.com/TOMToolkit/tom_base/blob/master/tom_observations/facilities/lco.py
     """
+    stale_data = False
 
     def update_observation_status(self, observation_id):
         from tom_observations.models import ObservationRecord
@@ -66,53 +96,169 @@ class GenericObservationFacility(ABC):
         except ObservationRecord.DoesNotExist:
             raise Exception('No record exists for that observation id')
 
-    def update_all_observation_statuses(self, target=None):
+    def refresh_catalogs(self):
+        """
+        Fetches the catalogs, such as instruments and proposals, that the
+        observation form of the facility reads from the cache. Facilities
+        without cached catalogs have nothing to refresh.
+        """
+        pass
+
+    def get_observation_statuses(self, observation_ids):
+        """
+        Returns the statuses of many observations. Facilities whose API can
+        report on many observations in one call should override this method;
+        by default get_observation_status is called concurrently for each
+        observation, with at most STATUS_SWEEP_WORKERS calls at once.
+
+        Parameters
+        ----------
+        observation_ids : list
+            The ids of the observations at the facility
+
+        Returns
+        -------
+        tuple
+            A dictionary of the status of each observation id, and a
+            dictionary of the error message for each id that failed
+
+        """
+        statuses = {}
+        errors = {}
+        with ThreadPoolExecutor(max_workers=STATUS_SWEEP_WORKERS) as executor:
+            futures = {
+                observation_id: executor.submit(self.get_observation_status, observation_id)
+                for observation_id in observation_ids
+            }
+            for observation_id, future in futures.items():
+                try:
+                    statuses[observation_id] = future.result()
+                except Exception as e:
+                    errors[observation_id] = str(e)
+        return statuses, errors
+
+    def update_all_observation_statuses(self, target=None, records=None):
+        """
+        Updates the status of every observation at the facility that is not
+        in a terminal state, or of the given records only. Statuses are
+        fetched in one sweep, and only the records whose status changed are
+        written, one query per new status. Given records are updated in place.
+        """
         from tom_observations.models import ObservationRecord
-        failed_records = []
-        records = ObservationRecord.objects.filter(facility=self.name)
-        if target:
-            records = records.filter(target=target)
-        records = records.exclude(status__in=self.get_terminal_observing_states())
+        if records is None:
+            records = ObservationRecord.objects.filter(facility=self.name)
+            if target:
+                records = records.filter(target=target)
+            records = records.exclude(status__in=self.get_terminal_observing_states())
+        records = list(records)
+        if not records:
+            return []
+        try:
+            statuses, errors = self.get_observation_statuses(list({r.observation_id for r in records}))
+        except Exception as e:
+            return [(record.observation_id, str(e)) for record in records]
+        failed_records = [(record.observation_id, errors[record.observation_id])
+                          for record in records if record.observation_id in errors]
+
         for record in records:
-            try:
-                self.update_observation_status(record.observation_id)
-            except Exception as e:
-                failed_records.append((record.observation_id, str(e)))
+            status = statuses.get(record.observation_id)
+            if status is not None:
+                record.status = status
+        ObservationRecord.objects.update_statuses(records)
         return failed_records
 
+    def archive_data_products(self, observation_record):
+        """
+        Returns the list of data products of an observation provided by
+        data_products, cached per observation so that pages showing the same
+        observation do not query the facility again.
+
+        A copy of the last listing is kept for longer, and is returned when
+        the facility cannot be reached, in which case stale_data is set.
+        """
+        cache_key = 'data_products_{0}_{1}'.format(self.name, observation_record.observation_id)
+        products = cache.get(cache_key)
+        if products is None:
+            try:
+                products = list(self.data_products(observation_record.observation_id))
+            except (ServiceUnavailableException, RequestException):
+                products = cache.get(cache_key + '_stale')
+                if products is None:
+                    raise
+                self.stale_data = True
+                return products
+            if observation_record.status in self.get_terminal_observing_states():
+                timeout = DATA_PRODUCT_CACHE_TIMEOUTS['terminal']
+            else:
+                timeout = DATA_PRODUCT_CACHE_TIMEOUTS['active']
+            cache.set(cache_key, products, timeout)
+            cache.set(cache_key + '_stale', products, DATA_PRODUCT_CACHE_TIMEOUTS['terminal'])
+        return products
+
     def all_data_products(self, observation_record):
+        """
+        Splits the data products of an observation into those saved in the TOM,
+        including products uploaded manually by users, and those that are not.
+        Saved products are resolved with a single query.
+        """
         from tom_dataproducts.models import DataProduct
+        archive_products = self.archive_data_products(observation_record)
+        saved_products = DataProduct.objects.filter(
+            Q(product_id__in=[product['id'] for product in archive_products]) |
+            Q(observation_record_id=observation_record.id, product_id=None)
+        )
+        saved_by_id = {}
+        user_products = []
+        for dp in saved_products:
+            if dp.product_id is None:
+                user_products.append(dp)
+            else:
+                saved_by_id[dp.product_id] = dp
+
         products = {'saved': [], 'unsaved': []}
-        for product in self.data_products(observation_record.observation_id):
+        for product in archive_products:
             try:
-                dp = DataProduct.objects.get(product_id=product['id'])
-                products['saved'].append(dp)
-            except DataProduct.DoesNotExist:
+                products['saved'].append(saved_by_id[str(product['id'])])
+            except KeyError:
                 products['unsaved'].append(product)
-        # Obtain products uploaded manually by users
-        user_products = DataProduct.objects.filter(
-            observation_record_id=observation_record.id, product_id=None
-        )
-        for product in user_products:
-            products['saved'].append(product)
+        # Products uploaded manually by users
+        products['saved'].extend(user_products)
         return products
 
     def save_data_products(self, observation_record, product_id=None):
+        """
+        Saves the data products of an observation that have not been saved
+        yet, streaming several downloads to disk concurrently. Returns the
+        saved products, with the products that could not be downloaded listed
+        in its errors.
+        """
         from tom_dataproducts.models import DataProduct
-        final_products = []
+        from tom_dataproducts.downloads import download_products
+        final_products = SavedDataProducts()
         products = self.data_products(observation_record.observation_id, product_id)
 
-        for product in products:
-            dp, created = DataProduct.objects.get_or_create(
+        def unsaved_products():
+            for product in products:
+                try:
+                    final_products.append(DataProduct.objects.get(product_id=product['id']))
+                except DataProduct.DoesNotExist:
+                    yield product
+
+        for product, dfile, error in download_products(unsaved_products()):
+            if error:
+                final_products.errors.append((product['filename'], str(error)))
+                continue
+            dp = DataProduct(
                 product_id=product['id'],
                 target=observation_record.target,
                 observation_record=observation_record,
             )
-            if created:
-                product_data = requests.get(product['url']).content
-                dfile = ContentFile(product_data)
-                dp.data.save(product['filename'], dfile)
-                dp.save()
+            try:
+                with dfile, transaction.atomic():
+                    dp.data.save(product['filename'], File(dfile))
+            except IntegrityError:
+                # The same product was saved concurrently, by another request
+                dp = DataProduct.objects.get(product_id=product['id'])
             final_products.append(dp)
         return final_products
 
@@ -174,7 +320,9 @@ class GenericObservationFacility(ABC):
         Using an observation_id, retrieve a list of the data
         products that belong to this observation. In this case,
         the LCO module retrieves a list of frames from the LCO
-        data archive.
+        data archive. This may also be a generator, in which case
+        save_data_products starts downloading products while the
+        rest are still being retrieved.
         """
         pass
 
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from tom_observations import facility
+from tom_observations.scheduler import poll_due_observations, next_due
+
+
+class Command(BaseCommand):
+    help = 'Keeps checking the status of each observation request when it is due, as scheduled per observation'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Check the observations that are due once, then exit'
+        )
+        parser.add_argument(
+            '--max_sleep',
+            type=int,
+            default=60,
+            help='Maximum number of seconds to wait between checks'
+        )
+
+    def poll(self, facilities):
+        for instance in facilities:
+            try:
+                checked, failed_records = poll_due_observations(instance)
+            except Exception as e:
+                self.stderr.write('Could not check observations at {0}: {1}'.format(instance.name, e))
+                continue
+            if checked:
+                self.stdout.write('Checked {0} observations at {1}'.format(checked, instance.name))
+            for observation_id, error in failed_records:
+                self.stderr.write('Could not update {0} at {1}: {2}'.format(observation_id, instance.name, error))
+
+    def handle(self, *args, **options):
+        facilities = [clazz() for clazz in facility.get_service_classes().values()]
+        if options['once']:
+            self.poll(facilities)
+            return
+        try:
+            while True:
+                self.poll(facilities)
+                sleep = options['max_sleep']
+                due = next_due(facilities)
+                if due is not None:
+                    sleep = min(sleep, max((due - timezone.now()).total_seconds(), 1))
+                time.sleep(sleep)
+        except KeyboardInterrupt:
+            pass
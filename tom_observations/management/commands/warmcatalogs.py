@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from tom_observations import facility
+
+
+class Command(BaseCommand):
+    help = 'Fetches the instrument and proposal catalogs of each facility into the cache'
+
+    def handle(self, *args, **options):
+        failed_facilities = {}
+        for facility_name in facility.get_service_classes():
+            clazz = facility.get_service_class(facility_name)
+            try:
+                clazz().refresh_catalogs()
+            except Exception as e:
+                failed_facilities[facility_name] = str(e)
+        if failed_facilities:
+            return 'Catalogs refreshed with errors: {0}'.format(str(failed_facilities))
+        return 'Catalogs refreshed successfully'
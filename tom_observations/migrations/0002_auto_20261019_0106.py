@@ -0,0 +1,23 @@
+# Generated by Django 2.1.15 on 2026-10-19 01:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_observations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='observationrecord',
+            name='next_check',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='observationrecord',
+            name='unchanged_checks',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 import json
 
 from tom_targets.models import Target
@@ -6,6 +7,37 @@ from tom_observations.facility import get_service_class
 from tom_common.hooks import run_hook
 
 
+class ObservationRecordManager(models.Manager):
+    def update_statuses(self, records):
+        """
+        Writes the statuses of the given records, whose status attribute has
+        been changed in memory, with one query per new status. The
+        observation_change_state hook is run for each record whose status
+        differs from the one it was loaded with, exactly as save would.
+
+        Returns
+        -------
+        list
+            The records whose status changed
+
+        """
+        changed = {}
+        for record in records:
+            if record.status != record.loaded_status():
+                changed.setdefault(record.status, []).append(record)
+        now = timezone.now()
+        changed_records = []
+        for status, status_records in changed.items():
+            self.filter(pk__in=[r.pk for r in status_records]).update(status=status, modified=now)
+            for record in status_records:
+                previous_status = record.loaded_status()
+                record.modified = now
+                record._loaded_status = record.status
+                run_hook('observation_change_state', record, previous_status)
+            changed_records.extend(status_records)
+        return changed_records
+
+
 class ObservationRecord(models.Model):
     target = models.ForeignKey(Target, on_delete=models.CASCADE)
     facility = models.CharField(max_length=50)
@@ -14,18 +46,46 @@ class ObservationRecord(models.Model):
     status = models.CharField(max_length=200)
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
+    next_check = models.DateTimeField(null=True, blank=True, db_index=True)
+    unchanged_checks = models.PositiveIntegerField(default=0)
+
+    objects = ObservationRecordManager()
 
     class Meta:
         ordering = ('-created',)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the status as loaded, so that saving can tell whether it changed without querying again
+        if 'status' in instance.__dict__:
+            instance._loaded_status = instance.status
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        if fields is None or 'status' in fields:
+            self._loaded_status = self.status
+
+    def loaded_status(self):
+        """
+        Returns the status of the record as stored in the database when it
+        was loaded or last saved.
+        """
+        if not hasattr(self, '_loaded_status'):
+            self._loaded_status = ObservationRecord.objects.values_list('status', flat=True).get(pk=self.id)
+        return self._loaded_status
+
     def save(self, *args, **kwargs):
         if self.id:
-            presave_data = ObservationRecord.objects.get(pk=self.id)
+            previous_status = self.loaded_status()
             super().save(*args, **kwargs)
-            if self.status != presave_data.status:
-                run_hook('observation_change_state', self, presave_data.status)
+            self._loaded_status = self.status
+            if self.status != previous_status:
+                run_hook('observation_change_state', self, previous_status)
         else:
             super().save(*args, **kwargs)
+            self._loaded_status = self.status
             run_hook('observation_change_state', self, None)
 
     @property
@@ -0,0 +1,155 @@
+import json
+import logging
+from datetime import timedelta
+
+from dateutil.parser import parse
+from django.conf import settings
+from django.db.models import Case, When, Value, Q, DateTimeField, IntegerField
+from django.utils import timezone
+
+from tom_observations.models import ObservationRecord
+
+logger = logging.getLogger(__name__)
+
+# Determine settings for this module. Intervals are in seconds.
+POLLING_SETTINGS = {
+    # Pending observations whose window opens within a day, or is open
+    'near_window': 10 * 60,
+    # Pending observations whose window opens within a week
+    'soon_window': 60 * 60,
+    # Pending observations whose window opens later than that
+    'far_window': 12 * 3600,
+    # Observations in any other state that is not terminal
+    'active': 15 * 60,
+    'max_interval': 86400,
+    # Each check that finds no change doubles the interval, up to this many times
+    'max_backoff': 4,
+    'pending_states': ['PENDING'],
+    **getattr(settings, 'OBSERVATION_POLLING', {})
+}
+
+# Parameters of the observation forms that hold the start of the observing window
+WINDOW_START_PARAMETERS = ('start', 'window_start')
+
+
+def window_start(record):
+    """
+    Returns the start of the observing window of an observation, as found
+    in the parameters it was submitted with, or None.
+    """
+    try:
+        parameters = json.loads(record.parameters)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(parameters, dict):
+        return None
+    for key in WINDOW_START_PARAMETERS:
+        try:
+            start = parse(parameters[key])
+        except (KeyError, TypeError, ValueError, OverflowError):
+            continue
+        if timezone.is_naive(start):
+            start = timezone.make_aware(start, timezone.utc)
+        return start
+    return None
+
+
+def polling_interval(record, now, backoff=True):
+    """
+    Returns how long to wait before checking the status of an observation
+    again, based on its status, how soon its window opens, and unless backoff
+    is False, how many checks in a row found its status unchanged.
+    """
+    start = window_start(record)
+    if record.status in POLLING_SETTINGS['pending_states'] and start is not None:
+        if start - now < timedelta(days=1):
+            interval = POLLING_SETTINGS['near_window']
+        elif start - now < timedelta(days=7):
+            interval = POLLING_SETTINGS['soon_window']
+        else:
+            interval = POLLING_SETTINGS['far_window']
+    else:
+        interval = POLLING_SETTINGS['active']
+    if backoff:
+        interval *= 2 ** min(record.unchanged_checks, POLLING_SETTINGS['max_backoff'])
+    interval = timedelta(seconds=min(interval, POLLING_SETTINGS['max_interval']))
+    # Always check again as the window opens, as that is when the status is most likely to change
+    if start is not None and now < start < now + interval:
+        return start - now
+    return interval
+
+
+def due_records(facility, now=None):
+    """
+    Returns the observations at a facility that are not in a terminal state
+    and whose next check is due.
+    """
+    now = now or timezone.now()
+    return ObservationRecord.objects.filter(facility=facility.name).exclude(
+        status__in=facility.get_terminal_observing_states()
+    ).filter(Q(next_check__isnull=True) | Q(next_check__lte=now))
+
+
+def poll_due_observations(facility, now=None):
+    """
+    Updates the statuses of the observations at a facility that are due to
+    be checked, and schedules their next check. Observations whose status
+    could not be fetched are checked again after the base interval, without
+    backing off, as nothing was learned about them.
+
+    Parameters
+    ----------
+    facility : GenericObservationFacility
+        The facility whose observations are polled
+    now : datetime
+        The time the checks are scheduled from. Defaults to the current time.
+
+    Returns
+    -------
+    tuple
+        The number of observations checked successfully, and the list of
+        (observation_id, error) tuples for those that could not be updated
+
+    """
+    now = now or timezone.now()
+    records = list(due_records(facility, now))
+    if not records:
+        return 0, []
+    previous_statuses = {record.pk: record.status for record in records}
+    failed_records = facility.update_all_observation_statuses(records=records)
+    failed_ids = {observation_id for observation_id, _ in failed_records}
+
+    next_checks = []
+    unchanged_checks = []
+    for record in records:
+        failed = record.observation_id in failed_ids
+        if record.status != previous_statuses[record.pk]:
+            record.unchanged_checks = 0
+        elif not failed:
+            record.unchanged_checks += 1
+        if record.status in facility.get_terminal_observing_states():
+            record.next_check = None
+        else:
+            record.next_check = now + polling_interval(record, now, backoff=not failed)
+        next_checks.append(When(pk=record.pk, then=Value(record.next_check)))
+        unchanged_checks.append(When(pk=record.pk, then=Value(record.unchanged_checks)))
+    ObservationRecord.objects.filter(pk__in=previous_statuses).update(
+        next_check=Case(*next_checks, output_field=DateTimeField()),
+        unchanged_checks=Case(*unchanged_checks, output_field=IntegerField())
+    )
+    checked = len(records) - sum(record.observation_id in failed_ids for record in records)
+    logger.info('Checked %d observations at %s, %d failed', checked, facility.name, len(records) - checked)
+    return checked, failed_records
+
+
+def next_due(facilities):
+    """
+    Returns the time of the earliest scheduled check among the observations
+    at the given facilities, or None if nothing is scheduled.
+    """
+    query = Q()
+    for facility in facilities:
+        query |= Q(facility=facility.name) & ~Q(status__in=facility.get_terminal_observing_states())
+    return ObservationRecord.objects.filter(query, next_check__isnull=False).order_by(
+        'next_check'
+    ).values_list('next_check', flat=True).first()
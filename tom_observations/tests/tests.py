@@ -1,9 +1,15 @@
+import json
+import time
 from datetime import datetime, timedelta
+from io import StringIO
 from unittest import mock
 
 from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils import timezone
 
 import ephem
 from rise_set.angle import Angle
@@ -14,6 +20,9 @@ from tom_observations.utils import get_rise_set, get_last_rise_set_pair
 from tom_observations.utils import get_next_rise_set_pair, observer_for_site
 from tom_observations.tests.utils import FakeFacility
 from tom_observations.models import ObservationRecord
+from tom_observations.facilities.lco import LCOFacility
+from tom_observations.catalogs import get_catalog
+from tom_observations.scheduler import polling_interval, poll_due_observations
 
 
 @override_settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeFacility'])
@@ -44,6 +53,7 @@ class TestObservationViews(TestCase):
             response, FakeFacility().get_observation_url(self.observation_record.observation_id)
         )
 
+    @override_settings(JOB_RUNNER='eager')
     def test_update_observations(self):
         response = self.client.get(reverse('tom_observations:list') + '?update_status=True', follow=True)
         self.assertEqual(response.status_code, 200)
@@ -75,6 +85,115 @@ class TestObservationViews(TestCase):
         self.assertTrue(ObservationRecord.objects.filter(observation_id='fakeid').exists())
 
 
+@override_settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeFacility'])
+class TestObservationDataProducts(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.target = TargetFactory.create()
+        self.observation_record = ObservingRecordFactory.create(
+            target_id=self.target.id,
+            facility=FakeFacility.name,
+            parameters='{}',
+            status='PENDING'
+        )
+        user = User.objects.create_user(username='test', password='test')
+        self.client.force_login(user)
+
+    def test_archive_listing_fetched_once(self):
+        with mock.patch.object(FakeFacility, 'data_products', return_value=[{'id': 'testdpid'}]) as dp_mock:
+            url = reverse('tom_observations:detail', kwargs={'pk': self.observation_record.id})
+            self.assertContains(self.client.get(url), 'testdpid')
+            self.assertEqual(dp_mock.call_count, 1)
+            self.assertContains(self.client.get(url), 'testdpid')
+            self.assertEqual(dp_mock.call_count, 1)
+
+    def test_stale_listing_when_facility_unavailable(self):
+        from tom_common.exceptions import ServiceUnavailableException
+        with mock.patch.object(FakeFacility, 'data_products', return_value=[{'id': 'testdpid'}]):
+            FakeFacility().archive_data_products(self.observation_record)
+        cache.delete('data_products_{0}_{1}'.format(FakeFacility.name, self.observation_record.observation_id))
+        url = reverse('tom_observations:detail', kwargs={'pk': self.observation_record.id})
+        with mock.patch.object(FakeFacility, 'data_products', side_effect=ServiceUnavailableException('fake')):
+            response = self.client.get(url)
+        self.assertContains(response, 'testdpid')
+        self.assertContains(response, 'may be out of date')
+
+    def test_all_data_products_single_query(self):
+        from tom_dataproducts.models import DataProduct
+        archive_products = [{'id': str(i), 'filename': 'file{0}.fits'.format(i)} for i in range(20)]
+        for i in range(0, 20, 2):
+            DataProduct.objects.create(
+                product_id=str(i), target=self.target, observation_record=self.observation_record
+            )
+        uploaded = DataProduct.objects.create(target=self.target, observation_record=self.observation_record)
+        with mock.patch.object(FakeFacility, 'data_products', return_value=archive_products):
+            FakeFacility().archive_data_products(self.observation_record)
+            with self.assertNumQueries(1):
+                products = FakeFacility().all_data_products(self.observation_record)
+        self.assertEqual([dp.product_id for dp in products['saved']], [str(i) for i in range(0, 20, 2)] + [None])
+        self.assertEqual(products['saved'][-1], uploaded)
+        self.assertEqual([p['id'] for p in products['unsaved']], [str(i) for i in range(1, 20, 2)])
+
+
+class TestLCOArchiveFrames(TestCase):
+    def frame(self, frame_id):
+        return {
+            'id': frame_id,
+            'filename': 'frame{0}.fits.fz'.format(frame_id),
+            'DATE_OBS': '2019-02-01T00:00:00Z',
+            'url': 'https://archive/{0}'.format(frame_id)
+        }
+
+    @mock.patch.object(LCOFacility, '_archive_headers', return_value={})
+    @mock.patch('tom_observations.facilities.lco.make_request')
+    def test_data_products_follows_pages_lazily(self, mock_request, mock_headers):
+        pages = [
+            {'results': [self.frame(1), self.frame(2)], 'next': 'https://archive/frames/?REQNUM=1&offset=2'},
+            {'results': [self.frame(3)], 'next': None},
+        ]
+        mock_request.return_value.json.side_effect = pages
+        products = LCOFacility().data_products('1')
+        self.assertEqual(next(products)['id'], 1)
+        self.assertEqual(mock_request.call_count, 1)
+        self.assertEqual([p['id'] for p in products], [2, 3])
+        self.assertEqual(mock_request.call_count, 2)
+        self.assertEqual(mock_request.call_args[0][1], 'https://archive/frames/?REQNUM=1&offset=2')
+
+
+class TestFacilityCatalogs(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_catalog_fetched_once_while_fresh(self):
+        fetch = mock.Mock(return_value={'1M0-SCICAM-SINISTRO': {'filters': ['b', 'V']}})
+        self.assertEqual(get_catalog('test_instruments', fetch), fetch.return_value)
+        self.assertEqual(get_catalog('test_instruments', fetch), fetch.return_value)
+        self.assertEqual(fetch.call_count, 1)
+
+    @mock.patch('tom_observations.catalogs.threading.Thread')
+    def test_stale_catalog_refreshed_in_background(self, thread_mock):
+        fetch = mock.Mock(return_value=['old'])
+        get_catalog('test_proposals', fetch)
+        fetch.return_value = ['new']
+        with mock.patch('tom_observations.catalogs.time.time', return_value=time.time() + 86400):
+            # The stale copy is served while a single refresh is started
+            self.assertEqual(get_catalog('test_proposals', fetch), ['old'])
+            self.assertEqual(get_catalog('test_proposals', fetch), ['old'])
+        self.assertEqual(thread_mock.call_count, 1)
+        thread_mock.call_args[1]['target']()
+        self.assertEqual(get_catalog('test_proposals', fetch), ['new'])
+        self.assertEqual(fetch.call_count, 2)
+
+    @mock.patch('tom_observations.facilities.lco._fetch_proposals', return_value=[])
+    @mock.patch('tom_observations.facilities.lco._fetch_instruments', return_value={})
+    def test_warm_catalogs(self, instruments_mock, proposals_mock):
+        call_command('warmcatalogs', stdout=StringIO())
+        self.assertEqual(instruments_mock.call_count, 1)
+        self.assertEqual(proposals_mock.call_count, 1)
+        list(LCOFacility.form.base_fields['instrument_name'].choices)
+        self.assertEqual(instruments_mock.call_count, 1)
+
+
 class TestUpdatingObservations(TestCase):
     def setUp(self):
         self.t1 = TargetFactory.create()
@@ -87,15 +206,132 @@ class TestUpdatingObservations(TestCase):
     # Tests that only 2 of the three created observing records are updated, as
     # the third is in a completed state
     def test_update_all_observations_for_facility(self):
-        with mock.patch.object(FakeFacility, 'update_observation_status') as uos_mock:
+        with mock.patch.object(FakeFacility, 'get_observation_status', return_value='COMPLETED') as gos_mock:
             FakeFacility().update_all_observation_statuses()
-            self.assertEquals(uos_mock.call_count, 2)
+            self.assertEquals(gos_mock.call_count, 2)
+        self.assertEqual(ObservationRecord.objects.filter(facility='FakeFacility', status='COMPLETED').count(), 2)
 
     # Tests that only the observing records associated with the given target are updated
     def test_update_individual_target_observations_for_facility(self):
-        with mock.patch.object(FakeFacility, 'update_observation_status', return_value='COMPLETED') as uos_mock:
+        with mock.patch.object(FakeFacility, 'get_observation_status', return_value='COMPLETED') as gos_mock:
             FakeFacility().update_all_observation_statuses(target=self.t1)
-            self.assertEquals(uos_mock.call_count, 2)
+            self.assertEquals(gos_mock.call_count, 2)
+
+    def test_update_writes_changed_records_and_runs_hooks(self):
+        statuses = {str(self.or1.observation_id): 'PENDING', str(self.or3.observation_id): 'COMPLETED'}
+        with mock.patch.object(FakeFacility, 'get_observation_statuses', return_value=(statuses, {})), \
+                mock.patch('tom_observations.models.run_hook') as hook_mock, \
+                self.assertNumQueries(2):
+            failed = FakeFacility().update_all_observation_statuses()
+        self.assertEqual(failed, [])
+        hook_mock.assert_called_once_with('observation_change_state', mock.ANY, 'PENDING')
+        self.assertEqual(hook_mock.call_args[0][1].pk, self.or3.pk)
+        self.or3.refresh_from_db()
+        self.assertEqual(self.or3.status, 'COMPLETED')
+
+    def test_update_reports_failed_records(self):
+        def get_status(observation_id):
+            if observation_id == str(self.or1.observation_id):
+                raise Exception('not found')
+            return 'PENDING'
+
+        with mock.patch.object(FakeFacility, 'get_observation_status', side_effect=get_status):
+            failed = FakeFacility().update_all_observation_statuses()
+        self.assertEqual(failed, [(str(self.or1.observation_id), 'not found')])
+
+
+@mock.patch('tom_observations.models.run_hook')
+class TestObservationRecordChangeTracking(TestCase):
+    def setUp(self):
+        target = TargetFactory.create()
+        for status in ['PENDING', 'PENDING', 'COMPLETED']:
+            ObservingRecordFactory.create(target_id=target.id, facility='FakeFacility', status=status)
+
+    def test_save_runs_hook_on_change_only(self, hook_mock):
+        record = ObservationRecord.objects.filter(status='PENDING').first()
+        with self.assertNumQueries(1):
+            record.save()
+        hook_mock.assert_not_called()
+        record.status = 'COMPLETED'
+        with self.assertNumQueries(1):
+            record.save()
+        hook_mock.assert_called_once_with('observation_change_state', record, 'PENDING')
+        record.save()
+        self.assertEqual(hook_mock.call_count, 1)
+
+    def test_save_of_unloaded_record(self, hook_mock):
+        record = ObservationRecord.objects.filter(status='PENDING').first()
+        unloaded = ObservationRecord(
+            id=record.id, target_id=record.target_id, facility=record.facility, status='CANCELED', parameters='',
+            created=record.created
+        )
+        unloaded.save()
+        hook_mock.assert_called_once_with('observation_change_state', unloaded, 'PENDING')
+
+    def test_update_statuses(self, hook_mock):
+        records = list(ObservationRecord.objects.all())
+        for record in records:
+            record.status = 'COMPLETED'
+        with self.assertNumQueries(1):
+            changed = ObservationRecord.objects.update_statuses(records)
+        self.assertEqual(len(changed), 2)
+        self.assertEqual(hook_mock.call_count, 2)
+        self.assertTrue(all(call[0][2] == 'PENDING' for call in hook_mock.call_args_list))
+        self.assertEqual(ObservationRecord.objects.filter(status='COMPLETED').count(), 3)
+        ObservationRecord.objects.update_statuses(records)
+        self.assertEqual(hook_mock.call_count, 2)
+
+
+class TestPollingScheduler(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.target = TargetFactory.create()
+
+    def record(self, status='PENDING', start=None, **kwargs):
+        parameters = json.dumps({'start': start.isoformat()} if start else {})
+        return ObservingRecordFactory.create(
+            target_id=self.target.id, facility='FakeFacility', status=status, parameters=parameters, **kwargs
+        )
+
+    def test_polling_interval(self):
+        near = self.record(start=self.now + timedelta(hours=2))
+        far = self.record(start=self.now + timedelta(days=30))
+        active = self.record(status='ATTEMPTED')
+        self.assertEqual(polling_interval(near, self.now), timedelta(minutes=10))
+        self.assertEqual(polling_interval(far, self.now), timedelta(hours=12))
+        self.assertEqual(polling_interval(active, self.now), timedelta(minutes=15))
+        # Repeated checks without change back off, but not past the opening of the window
+        active.unchanged_checks = 3
+        near.unchanged_checks = 4
+        self.assertEqual(polling_interval(active, self.now), timedelta(minutes=120))
+        self.assertEqual(polling_interval(near, self.now), timedelta(hours=2))
+
+    def test_poll_due_observations(self):
+        due = self.record(start=self.now + timedelta(days=30))
+        changing = self.record(unchanged_checks=2)
+        not_due = self.record(next_check=self.now + timedelta(hours=1))
+        statuses = {str(due.observation_id): 'PENDING', str(changing.observation_id): 'COMPLETED'}
+        with mock.patch.object(FakeFacility, 'get_observation_statuses', return_value=(statuses, {})) as gos_mock:
+            checked, failed = poll_due_observations(FakeFacility(), now=self.now)
+        self.assertEqual(checked, 2)
+        self.assertNotIn(str(not_due.observation_id), gos_mock.call_args[0][0])
+        due.refresh_from_db()
+        self.assertEqual(due.unchanged_checks, 1)
+        self.assertEqual(due.next_check, self.now + timedelta(hours=24))
+        changing.refresh_from_db()
+        self.assertEqual((changing.status, changing.unchanged_checks, changing.next_check), ('COMPLETED', 0, None))
+
+    def test_poll_failed_observations(self):
+        failing = self.record(status='ATTEMPTED', unchanged_checks=3)
+        errors = {str(failing.observation_id): 'timed out'}
+        with mock.patch.object(FakeFacility, 'get_observation_statuses', return_value=({}, errors)):
+            checked, failed = poll_due_observations(FakeFacility(), now=self.now)
+        self.assertEqual(checked, 0)
+        self.assertEqual(failed, [(str(failing.observation_id), 'timed out')])
+        failing.refresh_from_db()
+        # A failed check says nothing about the observation, so it neither backs off nor waits longer
+        self.assertEqual(failing.unchanged_checks, 3)
+        self.assertEqual(failing.next_check, self.now + timedelta(minutes=15))
 
 
 class TestRiseSet(TestCase):
@@ -1,12 +1,9 @@
-from io import StringIO
-
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic.edit import FormView
 from django_filters.views import FilterView
 from django.views.generic.detail import DetailView
 from django.urls import reverse
 from django.shortcuts import redirect
-from django.core.management import call_command
 from django.contrib import messages
 
 from .models import ObservationRecord
@@ -14,6 +11,7 @@ from .forms import ManualObservationForm
 from tom_dataproducts.forms import AddProductToGroupForm
 from tom_targets.models import Target
 from tom_observations.facility import get_service_class
+from tom_common.jobs import enqueue, job_message
 
 
 class ObservationListView(FilterView):
@@ -28,9 +26,8 @@ class ObservationListView(FilterView):
         if update_status:
             if not request.user.is_authenticated:
                 return redirect(reverse('login'))
-            out = StringIO()
-            call_command('updatestatus', stdout=out)
-            messages.info(request, out.getvalue())
+            job, created = enqueue('updatestatus')
+            messages.info(request, job_message(job, created, 'Observation status update'))
             return redirect(reverse('tom_observations:list'))
         return super().get(request, *args, **kwargs)
 
@@ -128,8 +125,12 @@ class ObservationRecordDetailView(DetailView):
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
         context['form'] = AddProductToGroupForm()
-        service_class = get_service_class(self.object.facility)
-        context['data_products'] = service_class().all_data_products(self.object)
+        facility = get_service_class(self.object.facility)()
+        context['data_products'] = facility.all_data_products(self.object)
+        if facility.stale_data:
+            messages.warning(
+                self.request, '{} is not responding, the data products shown may be out of date.'.format(facility.name)
+            )
         newest_image = None
         for data_product in context['data_products']['saved']:
             newest_image = data_product if (not newest_image or data_product.modified > newest_image.modified) and \
@@ -1,9 +1,15 @@
 from django.contrib import admin
-from .models import Target
+from .models import Target, TargetAlias
+
+
+class TargetAliasInline(admin.TabularInline):
+    model = TargetAlias
+    extra = 0
 
 
 class TargetAdmin(admin.ModelAdmin):
     model = Target
+    inlines = [TargetAliasInline]
 
 
 admin.site.register(Target, TargetAdmin)
@@ -0,0 +1,141 @@
+"""
+Resolution of target names to targets through the TargetAlias table.
+
+Every name of a target is stored as an alias with a normalized key, so
+that a name is resolved with a single indexed lookup rather than a scan of
+the name fields. Transient designations are looked up with and without
+their prefix, so that "SN 2019abc", "AT2019abc" and "2019abc" all resolve to
+the same target.
+"""
+import re
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from tom_targets.models import TargetAlias
+from tom_targets.search import normalize_name
+
+# Prefixes of designations that are otherwise the same, such as those of the
+# Transient Name Server for supernovae and other transients
+ALIAS_PREFIXES = getattr(settings, 'TARGET_ALIAS_PREFIXES', ['sn', 'at'])
+
+DESIGNATION = re.compile(r'^(?:{0})?(\d{{4}}[a-z]+)$'.format('|'.join(ALIAS_PREFIXES)))
+
+
+def alias_keys(name):
+    """
+    Returns the keys under which a name may be stored, the key of the name
+    itself first.
+    """
+    key = normalize_name(name)
+    if not key:
+        return []
+    keys = [key]
+    designation = DESIGNATION.match(key)
+    if designation:
+        bare = designation.group(1)
+        keys.extend(k for k in [bare] + [prefix + bare for prefix in ALIAS_PREFIXES] if k != key)
+    return keys
+
+
+def target_names(target):
+    return (target.identifier, target.name, target.name2, target.name3)
+
+
+def add_aliases(targets):
+    """
+    Stores the identifier and names of each target as its aliases, with two
+    queries for any number of targets. Names that are already an alias of
+    any target are left as they are.
+    """
+    aliases = {}
+    for target in targets:
+        for name in target_names(target):
+            key = normalize_name(name)
+            if key and key not in aliases:
+                aliases[key] = TargetAlias(target=target, name=name, key=key)
+    return _create_aliases(aliases)
+
+
+def add_names(target, names):
+    """
+    Stores other names of a target as its aliases, such as the names of a
+    duplicate merged into it. Returns the names that are already an alias of
+    another target and so were not added.
+    """
+    aliases = {}
+    for name in names:
+        key = normalize_name(name)
+        if key and key not in aliases:
+            aliases[key] = TargetAlias(target=target, name=name, key=key)
+    _create_aliases(aliases)
+    taken = TargetAlias.objects.filter(key__in=list(aliases)).exclude(target=target).values_list('key', flat=True)
+    return [aliases[key].name for key in taken]
+
+
+def sync_aliases(target, previous_names=()):
+    """
+    Brings the aliases of a saved target in line with its names: the aliases
+    of names it no longer has are removed, so that they can be used by other
+    targets, and those of its current names are added. Aliases that were
+    added for other reasons, such as merging a duplicate, are kept.
+    """
+    current = {normalize_name(name) for name in target_names(target)}
+    removed = {normalize_name(name) for name in previous_names} - current
+    if removed:
+        TargetAlias.objects.filter(target=target, key__in=removed).delete()
+    return add_aliases([target])
+
+
+def _create_aliases(aliases):
+    if not aliases:
+        return []
+    existing = set(TargetAlias.objects.filter(key__in=list(aliases)).values_list('key', flat=True))
+    new_aliases = [alias for key, alias in aliases.items() if key not in existing]
+    try:
+        with transaction.atomic():
+            return TargetAlias.objects.bulk_create(new_aliases)
+    except IntegrityError:
+        # Another target took one of the names since they were checked, so
+        # insert them one at a time and leave out the names that are taken
+        created = []
+        for alias in new_aliases:
+            try:
+                with transaction.atomic():
+                    alias.save()
+                created.append(alias)
+            except IntegrityError:
+                pass
+        return created
+
+
+def resolve_targets(names):
+    """
+    Resolves a batch of names to targets with a single query.
+
+    Parameters
+    ----------
+    names : list
+        Names of targets, in any case and spacing
+
+    Returns
+    -------
+    dict
+        The target of each name, or None for names that are not known
+
+    """
+    keys = {name: alias_keys(name) for name in names}
+    all_keys = {key for name_keys in keys.values() for key in name_keys}
+    aliases = TargetAlias.objects.filter(key__in=all_keys).select_related('target') if all_keys else []
+    targets = {alias.key: alias.target for alias in aliases}
+    return {
+        name: next((targets[key] for key in name_keys if key in targets), None)
+        for name, name_keys in keys.items()
+    }
+
+
+def resolve_target(name):
+    """
+    Returns the target with the given name, or None if there is none.
+    """
+    return resolve_targets([name])[name]
@@ -1,5 +1,31 @@
+import math
+
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
+
+
+def ensure_search_index(using, **kwargs):
+    from django.db import connections
+    from tom_targets.search import ensure_search_index
+    ensure_search_index(connections[using])
+
+
+def _null_safe(function):
+    return lambda value: None if value is None else function(value)
+
+
+def add_math_functions(connection, **kwargs):
+    # SQLite is mostly built without the math functions that cone searches
+    # use, which the other databases have
+    if connection.vendor == 'sqlite':
+        for name, function in (('SIN', math.sin), ('COS', math.cos)):
+            connection.connection.create_function(name, 1, _null_safe(function))
 
 
 class TomTargetsConfig(AppConfig):
     name = 'tom_targets'
+
+    def ready(self):
+        post_migrate.connect(ensure_search_index, sender=self)
+        connection_created.connect(add_math_functions)
@@ -0,0 +1,140 @@
+"""
+Parsing of Right Ascension and Declination given in degrees or in
+sexagesimal notation, for arrays of values at a time.
+
+Values that are plain numbers are taken to be degrees. Otherwise they are
+parsed as sexagesimal, in hours for Right Ascension and in degrees for
+Declination, with the fields separated by colons, spaces or unit letters,
+as in "12:30:45.6", "12 30 45.6", "12h30m45.6s" or "-05d30m00s". Each
+value is matched once with a compiled regular expression; conversion of
+the fields, arithmetic and validation are done on whole arrays.
+"""
+import re
+
+import numpy as np
+
+SEXAGESIMAL = re.compile(
+    r"""^\s*(?P<sign>[+-])?\s*
+    (?P<first>\d+)\s*[:hd°\s]\s*
+    (?P<second>\d+(?:\.\d*)?)\s*
+    (?:[:m'′\s]\s*(?P<third>\d+(?:\.\d*)?)\s*[s"″]?)?
+    \s*[m'′]?\s*$""",
+    re.VERBOSE
+)
+
+FORMAT_ERROR = 'Invalid format. Please use sexagesimal or degrees'
+RANGE_ERROR = 'Must be between {0} and {1} degrees'
+
+
+def _is_empty(value):
+    return value is None or (isinstance(value, str) and not value.strip()) or \
+        (isinstance(value, float) and np.isnan(value))
+
+
+def parse_angles(values, hours=False, minimum=None, maximum=None):
+    """
+    Converts an array of angles in degrees or sexagesimal notation to
+    degrees.
+
+    Parameters
+    ----------
+    values : sequence
+        Strings or numbers to convert. Empty values are returned as NaN,
+        while values that are not finite numbers are invalid.
+    hours : bool
+        Whether sexagesimal values are in hours rather than degrees
+    minimum, maximum : float
+        Optional range the angles must lie in, in degrees
+
+    Returns
+    -------
+    tuple
+        An array of the angles in degrees, with NaN for empty and invalid
+        values, and a dictionary of the error message of each invalid
+        value by its index
+
+    """
+    values = list(values)
+    degrees = np.full(len(values), np.nan)
+    errors = {}
+    present = np.array([not _is_empty(v) for v in values], dtype=bool)
+    strings = np.array([str(v).strip() for v in values], dtype=object)
+
+    # Most bulk inputs are plain degrees, which numpy converts in one call
+    try:
+        degrees[present] = strings[present].astype(float)
+        sexagesimal = np.zeros(len(values), dtype=bool)
+    except ValueError:
+        sexagesimal = present.copy()
+        for index in np.flatnonzero(present):
+            try:
+                degrees[index] = float(strings[index])
+                sexagesimal[index] = False
+            except ValueError:
+                pass
+
+    indices = np.flatnonzero(sexagesimal)
+    if len(indices):
+        matches = [SEXAGESIMAL.match(strings[index]) for index in indices]
+        for index, match in zip(indices, matches):
+            if match is None:
+                errors[int(index)] = FORMAT_ERROR
+        parsed = [(index, match) for index, match in zip(indices, matches) if match is not None]
+        if parsed:
+            indices = np.array([index for index, _ in parsed])
+            fields = np.array(
+                [(m.group('first'), m.group('second'), m.group('third') or '0') for _, m in parsed]
+            ).astype(float)
+            sign = np.array([-1.0 if m.group('sign') == '-' else 1.0 for _, m in parsed])
+            # Minutes must be whole when seconds are given
+            fractional = np.array([m.group('third') is not None for _, m in parsed]) & \
+                (fields[:, 1] != np.floor(fields[:, 1]))
+            invalid = (fields[:, 1] >= 60) | (fields[:, 2] >= 60) | fractional
+            for index in indices[invalid]:
+                errors[int(index)] = FORMAT_ERROR
+            value = sign * (fields[:, 0] + fields[:, 1] / 60 + fields[:, 2] / 3600)
+            degrees[indices[~invalid]] = (value * 15 if hours else value)[~invalid]
+
+    # float() takes "nan" and "inf", which are not angles
+    for index in np.flatnonzero(present & ~np.isfinite(degrees)):
+        errors.setdefault(int(index), FORMAT_ERROR)
+
+    valid = np.isfinite(degrees)
+    with np.errstate(invalid='ignore'):
+        out_of_range = valid & (
+            (degrees < minimum if minimum is not None else False) |
+            (degrees > maximum if maximum is not None else False)
+        )
+    for index in np.flatnonzero(out_of_range):
+        errors[int(index)] = RANGE_ERROR.format(minimum, maximum)
+    if errors:
+        degrees[list(errors)] = np.nan
+    return degrees, errors
+
+
+def parse_ra(values):
+    """
+    Converts an array of Right Ascensions, in degrees or sexagesimal hours,
+    to degrees. See parse_angles.
+    """
+    return parse_angles(values, hours=True, minimum=0, maximum=360)
+
+
+def parse_dec(values):
+    """
+    Converts an array of Declinations, in degrees or sexagesimal degrees, to
+    degrees. See parse_angles.
+    """
+    return parse_angles(values, hours=False, minimum=-90, maximum=90)
+
+
+def to_degrees(value, c_type):
+    """
+    Converts a single Right Ascension (c_type "ra") or Declination (c_type
+    "dec") to degrees, raising ValueError if it is invalid. Returns None for
+    an empty value.
+    """
+    degrees, errors = (parse_ra if c_type == 'ra' else parse_dec)([value])
+    if errors:
+        raise ValueError(errors[0])
+    return None if np.isnan(degrees[0]) else float(degrees[0])
@@ -0,0 +1,190 @@
+import logging
+
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+
+from tom_targets.healpix import angular_separation
+from tom_targets.models import Target
+
+logger = logging.getLogger(__name__)
+
+# Determine settings for this module. Positions closer than radius arcseconds
+# are considered the same object. The policy decides what happens to a new
+# target that matches an existing one: "skip" keeps the existing target only,
+# "merge" fills in the empty fields of the existing target from the new one,
+# and "create" creates the new target regardless. The policy applies both to
+# bulk imports and to targets created one at a time, which can still be created
+# as separate targets with the "Create anyway" option of the form. The default
+# is "skip", so set it to "create" to keep creating every submitted target.
+CROSSMATCH_SETTINGS = {
+    'radius': 2.0,
+    'policy': 'skip',
+    **getattr(settings, 'TARGET_CROSSMATCH', {})
+}
+POLICIES = ('skip', 'merge', 'create')
+
+# Fields that are merged into an existing target when they are empty on it
+MERGE_FIELDS = [
+    field.name for field in Target._meta.get_fields()
+    if field.concrete and field.editable and not field.primary_key and not field.is_relation
+    and field.name not in ('identifier', 'type', 'ra', 'dec')
+]
+
+
+def _window_pairs(query_dec, sorted_dec, radius):
+    """
+    Returns the pairs of indices of query positions and sorted positions
+    whose declinations differ by at most radius, using a binary search of
+    the window of each query position in the sorted declinations.
+    """
+    lo = np.searchsorted(sorted_dec, query_dec - radius, side='left')
+    hi = np.searchsorted(sorted_dec, query_dec + radius, side='right')
+    counts = hi - lo
+    query_index = np.repeat(np.arange(len(query_dec)), counts)
+    # Consecutive runs lo[i], lo[i] + 1, ..., hi[i] - 1 for every query position
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return query_index, np.repeat(lo, counts) + offsets
+
+
+def match_positions(ra, dec, catalog_ra, catalog_dec, radius):
+    """
+    Finds the nearest catalog position within radius of each position.
+
+    Catalog positions are sorted by declination once, and the candidates of
+    all positions are found and checked in a single vectorized sweep.
+
+    Parameters
+    ----------
+    ra, dec : array_like
+        Positions to match, in degrees
+    catalog_ra, catalog_dec : array_like
+        Positions to match against, in degrees
+    radius : float
+        Matching radius, in arcseconds
+
+    Returns
+    -------
+    numpy.ndarray
+        For each position, the index of the nearest catalog position within
+        radius, or -1 if there is none
+
+    """
+    ra, dec = np.asarray(ra, dtype=float), np.asarray(dec, dtype=float)
+    catalog_ra, catalog_dec = np.asarray(catalog_ra, dtype=float), np.asarray(catalog_dec, dtype=float)
+    matches = np.full(len(ra), -1, dtype=np.int64)
+    if not len(ra) or not len(catalog_ra):
+        return matches
+    radius = radius / 3600
+    order = np.argsort(catalog_dec)
+    query_index, sorted_index = _window_pairs(dec, catalog_dec[order], radius)
+    catalog_index = order[sorted_index]
+    separation = angular_separation(ra[query_index], dec[query_index], catalog_ra[catalog_index],
+                                    catalog_dec[catalog_index])
+    within = separation <= radius
+    query_index, catalog_index, separation = query_index[within], catalog_index[within], separation[within]
+    # Keep the nearest match of each position
+    nearest = np.lexsort((separation, query_index))
+    query_index, catalog_index = query_index[nearest], catalog_index[nearest]
+    first = np.ones(len(query_index), dtype=bool)
+    first[1:] = query_index[1:] != query_index[:-1]
+    matches[query_index[first]] = catalog_index[first]
+    return matches
+
+
+def nearest_target(ra, dec, radius=None):
+    """
+    Returns the existing target nearest to a position within radius
+    arcseconds, or None, using a cone search of the healpix index.
+    """
+    radius = CROSSMATCH_SETTINGS['radius'] if radius is None else radius
+    return Target.objects.cone_search(ra, dec, radius / 3600).order_by('cone_distance').first()
+
+
+def self_match(ra, dec, radius=None):
+    """
+    Finds duplicates within a batch of positions.
+
+    Returns
+    -------
+    numpy.ndarray
+        For each position, the index of the first earlier position in the
+        batch within radius arcseconds, or -1 if there is none
+
+    """
+    radius = (CROSSMATCH_SETTINGS['radius'] if radius is None else radius) / 3600
+    ra, dec = np.asarray(ra, dtype=float), np.asarray(dec, dtype=float)
+    first = np.full(len(ra), -1, dtype=np.int64)
+    if not len(ra):
+        return first
+    order = np.argsort(dec)
+    query_index, sorted_index = _window_pairs(dec, dec[order], radius)
+    other_index = order[sorted_index]
+    earlier = other_index < query_index
+    query_index, other_index = query_index[earlier], other_index[earlier]
+    within = angular_separation(ra[query_index], dec[query_index], ra[other_index], dec[other_index]) <= radius
+    query_index, other_index = query_index[within], other_index[within]
+    # The earliest position of a group is the root that later ones point to
+    for query, other in sorted(zip(query_index.tolist(), other_index.tolist())):
+        root = other if first[other] < 0 else first[other]
+        if first[query] < 0 or root < first[query]:
+            first[query] = root
+    return first
+
+
+def merge_fields(target, values):
+    """
+    Fills in the empty fields of a target from a dictionary of values, and
+    records a different identifier as an alternative name when there is room.
+    Returns whether the target changed.
+    """
+    changed = False
+    for field in MERGE_FIELDS:
+        if values.get(field) not in (None, '') and getattr(target, field) in (None, ''):
+            setattr(target, field, values[field])
+            changed = True
+    identifier = values.get('identifier')
+    names = (target.identifier, target.name, target.name2, target.name3)
+    if identifier and identifier not in names:
+        for field in ('name2', 'name3'):
+            if not getattr(target, field):
+                setattr(target, field, identifier)
+                changed = True
+                break
+    return changed
+
+
+def merge_targets(keep, duplicates):
+    """
+    Merges duplicate targets into the one to keep: their observations, data,
+    comments and other related objects are moved to it, their fields fill in
+    its empty fields, and the duplicates are deleted.
+    """
+    duplicates = [d for d in duplicates if d.pk != keep.pk]
+    with transaction.atomic():
+        if apps.is_installed('django_comments'):
+            import django_comments
+            # Comments refer to their target by a generic foreign key, which
+            # is not one of the related objects of the model
+            django_comments.get_model().objects.filter(
+                content_type=ContentType.objects.get_for_model(Target),
+                object_pk__in=[str(duplicate.pk) for duplicate in duplicates]
+            ).update(object_pk=str(keep.pk))
+        for relation in Target._meta.related_objects:
+            accessor = relation.get_accessor_name()
+            if relation.many_to_many:
+                for duplicate in duplicates:
+                    for related in getattr(duplicate, accessor).all():
+                        getattr(related, relation.field.name).add(keep)
+            elif relation.one_to_many:
+                relation.related_model.objects.filter(
+                    **{'{0}__in'.format(relation.field.name): duplicates}
+                ).update(**{relation.field.name: keep})
+        for duplicate in duplicates:
+            merge_fields(keep, {field: getattr(duplicate, field) for field in MERGE_FIELDS + ['identifier']})
+            logger.info('Merged target %s into %s', duplicate, keep)
+            duplicate.delete()
+        keep.save()
+    return keep
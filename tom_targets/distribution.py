@@ -0,0 +1,110 @@
+import hashlib
+import json
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import BigIntegerField, Count, ExpressionWrapper, F, Max
+
+from tom_targets import healpix
+from tom_targets.models import Target
+
+# Determine settings for this module. Bins at DEFAULT_ORDER are about 7 degrees
+# across; individual targets are only returned when there are at most
+# max_points of them within the requested region.
+DISTRIBUTION_SETTINGS = {
+    'default_order': 3,
+    'max_order': 10,
+    'max_points': 500,
+    'cache_timeout': 86400,
+    **getattr(settings, 'TARGET_DISTRIBUTION_SETTINGS', {})
+}
+
+
+def _in_bounds(queryset, bounds):
+    ra_min, ra_max, dec_min, dec_max = bounds
+    queryset = queryset.filter(dec__gte=dec_min, dec__lte=dec_max)
+    if ra_min <= ra_max:
+        return queryset.filter(ra__gte=ra_min, ra__lte=ra_max)
+    # The region wraps around RA 0
+    return queryset.filter(ra__gte=ra_min) | queryset.filter(ra__lte=ra_max)
+
+
+def distribution_cache_key(queryset, order, bounds, filters=None):
+    """
+    Returns the cache key of the distribution of the targets of a queryset.
+
+    The key depends on the filters the targets were selected with, and on
+    the number of matching targets and the time the last of them changed, so
+    that the cached distribution is replaced as soon as targets are added,
+    edited or removed.
+    """
+    signature = queryset.values('pk').aggregate(count=Count('pk'), modified=Max('modified'))
+    selection = hashlib.md5(json.dumps(filters or {}, sort_keys=True, default=str).encode()).hexdigest()
+    return 'target_distribution_{0}_{1}_{2}_{3}_{4}'.format(
+        selection, order, '_'.join(str(b) for b in bounds or ()), signature['count'],
+        signature['modified'].timestamp() if signature['modified'] else 0
+    )
+
+
+def sky_distribution(queryset, order=None, bounds=None, filters=None):
+    """
+    Summarizes the sky positions of the sidereal targets of a queryset.
+
+    Targets are binned into HEALPix pixels, unless a region is given that
+    contains few enough targets to be listed individually. Results are
+    cached per set of filters.
+
+    Parameters
+    ----------
+    queryset : QuerySet
+        The targets to summarize
+    order : int
+        HEALPix order of the bins
+    bounds : tuple
+        Optional (ra_min, ra_max, dec_min, dec_max) of the region to
+        summarize, in degrees
+    filters : dict
+        The filters the queryset was selected with, which identify it in the
+        cache. None for all targets.
+
+    Returns
+    -------
+    dict
+        Either {"order": order, "bins": [{"ra", "dec", "count"}, ...]} or
+        {"points": [{"ra", "dec", "name", "id"}, ...]}
+
+    """
+    order = min(DISTRIBUTION_SETTINGS['default_order'] if order is None else order, DISTRIBUTION_SETTINGS['max_order'])
+    queryset = queryset.filter(type=Target.SIDEREAL, healpix__isnull=False)
+    if bounds is not None:
+        queryset = _in_bounds(queryset, bounds)
+    if queryset.query.is_empty():
+        return {'points': []} if bounds is not None else {'order': order, 'bins': []}
+    key = distribution_cache_key(queryset, order, bounds, filters)
+    distribution = cache.get(key)
+    if distribution is not None:
+        return distribution
+
+    positions = []
+    if bounds is not None:
+        positions = list(queryset.values_list('ra', 'dec', 'name', 'pk')[:DISTRIBUTION_SETTINGS['max_points'] + 1])
+    if bounds is not None and len(positions) <= DISTRIBUTION_SETTINGS['max_points']:
+        distribution = {
+            'points': [{'ra': ra, 'dec': dec, 'name': name, 'id': pk} for ra, dec, name, pk in positions]
+        }
+    else:
+        # The parent of an indexed pixel at a coarser order is its index divided by a power of four
+        parent = ExpressionWrapper(
+            F('healpix') / 4 ** (healpix.INDEX_ORDER - order), output_field=BigIntegerField()
+        )
+        binned = queryset.order_by().annotate(pixel=parent).values('pixel').annotate(count=Count('pk'))
+        binned = np.array([(b['pixel'], b['count']) for b in binned], dtype=np.int64).reshape(-1, 2)
+        pixels, counts = binned[:, 0], binned[:, 1]
+        ra, dec = healpix.pix2ang(order, pixels)
+        distribution = {
+            'order': order,
+            'bins': [{'ra': r, 'dec': d, 'count': int(c)} for r, d, c in zip(ra.tolist(), dec.tolist(), counts)]
+        }
+    cache.set(key, distribution, DISTRIBUTION_SETTINGS['cache_timeout'])
+    return distribution
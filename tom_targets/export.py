@@ -0,0 +1,186 @@
+import csv
+import json
+from itertools import islice
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+from django.db.models import FloatField, OuterRef, Subquery
+
+from tom_dataproducts.export import Echo
+from tom_dataproducts.models import ReducedDatum
+from tom_targets.models import Target, TargetExtra
+
+# Number of targets fetched at a time, together with their extras and photometry
+EXPORT_CHUNK_SIZE = getattr(settings, 'TARGET_EXPORT_CHUNK_SIZE', 2000)
+
+EXPORT_FIELDS = [
+    field.name for field in Target._meta.concrete_fields if field.name not in ('healpix', 'search_names')
+]
+PHOTOMETRY_FIELDS = ['latest_timestamp', 'latest_filter', 'latest_magnitude', 'latest_error']
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'votable': ('application/x-votable+xml', 'xml'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _extras_of(ids):
+    extras = {}
+    rows = TargetExtra.objects.filter(target_id__in=ids).values_list('target_id', 'key', 'value')
+    for target_id, key, value in rows:
+        extras.setdefault(target_id, {})[key] = value
+    return extras
+
+
+def _latest_photometry_of(ids):
+    photometry = ReducedDatum.objects.filter(data_type='PHOTOMETRY')
+    latest = photometry.filter(target=OuterRef('target')).order_by('-timestamp').values('pk')[:1]
+    data = photometry.filter(target_id__in=ids, pk=Subquery(latest)).values_list(
+        'target_id', 'timestamp', 'label', 'value', 'error'
+    )
+    return {target_id: row for target_id, *row in data}
+
+
+def extra_keys(queryset):
+    """
+    Returns the keys of the extras of the targets of a queryset, which become
+    columns of tabular exports.
+    """
+    keys = TargetExtra.objects.filter(target__in=queryset.values('pk')).order_by('key').values_list('key', flat=True)
+    return [key for key in keys.distinct() if key not in EXPORT_FIELDS + PHOTOMETRY_FIELDS]
+
+
+def export_rows(queryset, extras=False, photometry=False):
+    """
+    Generates a dictionary of the fields of each target of a queryset.
+
+    Targets are fetched EXPORT_CHUNK_SIZE at a time with a server-side cursor
+    where the database supports it, and the extras and latest photometry of
+    each chunk with one query each, so that memory use does not grow with
+    the number of targets.
+
+    Parameters
+    ----------
+    queryset : QuerySet
+        The targets to export
+    extras : bool
+        Whether to include the extras of each target, as an "extras"
+        dictionary
+    photometry : bool
+        Whether to include the latest photometry of each target
+
+    Yields
+    ------
+    dict
+        The fields of each target
+
+    """
+    rows = queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    for chunk in _chunks(rows, EXPORT_CHUNK_SIZE):
+        ids = [row[0] for row in chunk]
+        chunk_extras = _extras_of(ids) if extras else {}
+        chunk_photometry = _latest_photometry_of(ids) if photometry else {}
+        for row in chunk:
+            target = dict(zip(EXPORT_FIELDS, row))
+            if photometry:
+                target.update(zip(PHOTOMETRY_FIELDS, chunk_photometry.get(target['id'], [None] * 4)))
+            if extras:
+                target['extras'] = chunk_extras.get(target['id'], {})
+            yield target
+
+
+def _value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def export_csv(queryset, extras=False, photometry=False):
+    columns = EXPORT_FIELDS + (PHOTOMETRY_FIELDS if photometry else [])
+    keys = extra_keys(queryset) if extras else []
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns + keys)
+    for target in export_rows(queryset, extras, photometry):
+        target_extras = target.get('extras', {})
+        yield writer.writerow(
+            [_value(target[column]) for column in columns] + [target_extras.get(key, '') for key in keys]
+        )
+
+
+def export_ndjson(queryset, extras=False, photometry=False):
+    for target in export_rows(queryset, extras, photometry):
+        yield json.dumps({column: _value(value) for column, value in target.items()}) + '\n'
+
+
+def _votable_datatype(name):
+    if name == 'id':
+        return 'datatype="long"'
+    if name in ('latest_magnitude', 'latest_error') or \
+            (name in EXPORT_FIELDS and isinstance(Target._meta.get_field(name), FloatField)):
+        return 'datatype="double"'
+    return 'datatype="unicodeChar" arraysize="*"'
+
+
+def export_votable(queryset, extras=False, photometry=False):
+    """
+    Generates a VOTable of the targets, written out row by row rather than
+    built in memory as astropy would.
+    """
+    columns = EXPORT_FIELDS + (PHOTOMETRY_FIELDS if photometry else [])
+    keys = extra_keys(queryset) if extras else []
+    yield (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<VOTABLE version="1.3" xmlns="http://www.ivoa.net/xml/VOTable/v1.3">\n'
+        '<RESOURCE type="results">\n<TABLE name="targets">\n'
+    )
+    for column in columns:
+        yield '<FIELD name={0} {1}/>\n'.format(quoteattr(column), _votable_datatype(column))
+    for key in keys:
+        yield '<FIELD name={0} datatype="unicodeChar" arraysize="*"/>\n'.format(quoteattr(key))
+    yield '<DATA>\n<TABLEDATA>\n'
+    for target in export_rows(queryset, extras, photometry):
+        target_extras = target.get('extras', {})
+        values = [_value(target[column]) for column in columns] + [target_extras.get(key) for key in keys]
+        yield '<TR>{0}</TR>\n'.format(''.join(
+            '<TD>{0}</TD>'.format(escape(str(value))) if value is not None else '<TD/>' for value in values
+        ))
+    yield '</TABLEDATA>\n</DATA>\n</TABLE>\n</RESOURCE>\n</VOTABLE>\n'
+
+
+EXPORTERS = {
+    'csv': export_csv,
+    'votable': export_votable,
+    'ndjson': export_ndjson,
+}
+
+
+def export_targets(queryset, export_format='csv', extras=False, photometry=False):
+    """
+    Generates an export of the targets of a queryset, piece by piece.
+
+    Parameters
+    ----------
+    queryset : QuerySet
+        The targets to export
+    export_format : str
+        One of "csv", "votable" or "ndjson"
+    extras : bool
+        Whether to include the extras of the targets
+    photometry : bool
+        Whether to include the latest photometry of the targets
+
+    Yields
+    ------
+    str
+        Consecutive pieces of the export
+
+    """
+    return EXPORTERS[export_format](queryset, extras=extras, photometry=photometry)
@@ -1,21 +1,116 @@
+import math
+
 import django_filters
-from django.db.models import Q
+from django import forms
+
+from tom_targets.models import Target, TargetExtra, parse_extra_value
+from tom_targets.search import search_targets
+
+
+class ExtraValueField(forms.CharField):
+    """
+    A bound of the value of an extra, which must be a number or a date.
+    """
+    def validate(self, value):
+        super().validate(value)
+        if value and parse_extra_value(value) == (None, None):
+            raise forms.ValidationError('Enter a number or a date.')
+
+
+class ExtraValueFilter(django_filters.CharFilter):
+    field_class = ExtraValueField
+
 
-from tom_targets.models import Target
+class ConeSearchField(forms.CharField):
+    """
+    A cone to search, given as the right ascension, declination and radius in
+    degrees, which is cleaned to a tuple of finite floats with a positive radius.
+    """
+    def to_python(self, value):
+        value = super().to_python(value)
+        if not value:
+            return None
+        try:
+            ra, dec, radius = (float(v) for v in value.split(','))
+        except ValueError:
+            raise forms.ValidationError('Enter the RA, Dec and search radius in degrees, separated by commas.')
+        if not all(math.isfinite(v) for v in (ra, dec, radius)):
+            raise forms.ValidationError('The RA, Dec and search radius must be finite numbers.')
+        if radius <= 0:
+            raise forms.ValidationError('The search radius must be positive.')
+        return ra, dec, radius
+
+
+class ConeSearchFilter(django_filters.CharFilter):
+    field_class = ConeSearchField
 
 
 class TargetFilter(django_filters.FilterSet):
-    key = django_filters.CharFilter(field_name='targetextra__key', label='Key')
-    value = django_filters.CharFilter(field_name='targetextra__value', label='Value')
-    identifier = django_filters.CharFilter(field_name='identifier', lookup_expr='icontains')
+    key = django_filters.CharFilter(method='filter_extra', label='Key')
+    value = django_filters.CharFilter(method='filter_extra', label='Value')
+    value_min = ExtraValueFilter(
+        method='filter_extra', label='Minimum Value', help_text='A number or date the value is at least'
+    )
+    value_max = ExtraValueFilter(
+        method='filter_extra', label='Maximum Value', help_text='A number or date the value is at most'
+    )
+    identifier = django_filters.CharFilter(field_name='identifier', method='filter_identifier')
     name = django_filters.CharFilter(field_name='name', method='filter_name')
+    cone_search = ConeSearchFilter(
+        method='filter_cone_search', label='Cone Search', help_text='RA, Dec, Search Radius (degrees)'
+    )
+
+    @property
+    def applied_filters(self):
+        """
+        The filters that select the targets, as a dictionary of the valid,
+        non-empty values of the form.
+        """
+        if not self.is_bound:
+            return {}
+        # Validating the form leaves the valid values in cleaned_data
+        self.form.errors
+        return {name: value for name, value in self.form.cleaned_data.items() if value not in (None, '', [])}
 
     def filter_name(self, queryset, name, value):
-        return queryset.filter(
-            Q(name__icontains=value) | Q(name2__icontains=value) | Q(name3__icontains=value)
-        )
+        return search_targets(queryset, value)
+
+    def filter_identifier(self, queryset, name, value):
+        # The search index narrows the targets down to those with a name that
+        # matches, of which only those whose identifier matches are kept
+        return search_targets(queryset, value).filter(identifier__icontains=value)
+
+    def filter_extra(self, queryset, name, value):
+        # The extra filters are combined into one condition in filter_queryset
+        return queryset
+
+    def filter_queryset(self, queryset):
+        """
+        Filters by the fields of the form, and by the extras that match all of
+        key, value and value range with a single subquery, so that they are
+        matched by the same extra of each target.
+        """
+        queryset = super().filter_queryset(queryset)
+        data = self.form.cleaned_data
+        conditions = {}
+        if data.get('key'):
+            conditions['key'] = data['key']
+        if data.get('value'):
+            conditions['value'] = data['value']
+        for bound, lookup in (('value_min', 'gte'), ('value_max', 'lte')):
+            if data.get(bound):
+                number, time = parse_extra_value(data[bound])
+                field = 'float_value' if number is not None else 'time_value'
+                conditions['{0}__{1}'.format(field, lookup)] = number if number is not None else time
+        if not conditions:
+            return queryset
+        return queryset.filter(pk__in=TargetExtra.objects.filter(**conditions).values('target_id'))
+
+    def filter_cone_search(self, queryset, name, value):
+        ra, dec, radius = value
+        return queryset.cone_search(ra, dec, radius)
 
 
     class Meta:
         model = Target
-        fields = ['type', 'identifier', 'name', 'key', 'value']
+        fields = ['type', 'identifier', 'name', 'key', 'value', 'value_min', 'value_max', 'cone_search']
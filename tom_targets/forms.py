@@ -1,11 +1,10 @@
 from django import forms
 from django.forms.models import inlineformset_factory
-from astropy.coordinates import Angle
-from astropy import units as u
 from django.forms import ValidationError
 
 from .models import Target, TargetExtra, SIDEREAL_FIELDS, NON_SIDEREAL_FIELDS, REQUIRED_SIDEREAL_FIELDS
 from .models import REQUIRED_NON_SIDEREAL_FIELDS
+from .coordinates import to_degrees
 
 
 class CoordinateField(forms.CharField):
@@ -16,17 +15,9 @@ class CoordinateField(forms.CharField):
 
     def to_python(self, value):
         try:
-            a = float(value)
-            return a
-        except ValueError:
-            try:
-                if self.c_type == 'ra':
-                    a = Angle(value, unit=u.hourangle)
-                else:
-                    a = Angle(value, unit=u.degree)
-                return a.to(u.degree).value
-            except Exception as e:
-                raise ValidationError('Invalid format. Please use sexigesimal or degrees')
+            return to_degrees(value, self.c_type)
+        except ValueError as e:
+            raise ValidationError(str(e))
 
 
 class TargetForm(forms.ModelForm):
@@ -40,6 +31,10 @@ class TargetForm(forms.ModelForm):
 class SiderealTargetCreateForm(TargetForm):
     ra = CoordinateField(required=True, label='Right Ascension', c_type='ra')
     dec = CoordinateField(required=True, label='Declination', c_type='dec')
+    create_anyway = forms.BooleanField(
+        required=False, label='Create anyway',
+        help_text='Create this target even if it is within the crossmatch radius of an existing target'
+    )
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
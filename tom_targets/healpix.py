@@ -0,0 +1,208 @@
+"""
+Vectorized HEALPix pixelization of the sphere in the NESTED scheme, for
+binning and indexing target positions without depending on healpy.
+
+The sky is divided into 12 base pixels, each of which is split into four
+at every increasing order, so that at order k there are 12 * 4**k pixels
+of equal area. In the NESTED scheme the index of a pixel at order k + 1
+divided by four is the index of its parent at order k.
+"""
+import numpy as np
+
+MAX_ORDER = 29
+
+# Order of the pixel index stored on each target, about 3 arcseconds across
+INDEX_ORDER = 16
+
+# Row and column of the southernmost corner of each base pixel
+_JRLL = np.array([2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4])
+_JPLL = np.array([1, 3, 5, 7, 0, 2, 4, 6, 1, 3, 5, 7])
+
+
+def nside(order):
+    return 1 << order
+
+
+def npix(order):
+    return 12 * 4 ** order
+
+
+def pixel_area(order):
+    """
+    Returns the area of a pixel at the given order, in square degrees.
+    """
+    return 4 * np.pi * (180 / np.pi) ** 2 / npix(order)
+
+
+def resolution(order):
+    """
+    Returns the approximate width of a pixel at the given order, in degrees.
+    """
+    return np.sqrt(pixel_area(order))
+
+
+def max_pixel_radius(order):
+    """
+    Returns an upper bound on the distance between the center of a pixel at
+    the given order and any point within it, in degrees.
+    """
+    return 1.5 * resolution(order)
+
+
+def angular_separation(ra1, dec1, ra2, dec2):
+    """
+    Returns the angular distance between positions, in degrees, using the
+    haversine formula, which is accurate at small separations.
+    """
+    ra1, dec1, ra2, dec2 = (np.radians(np.asarray(a, dtype=float)) for a in (ra1, dec1, ra2, dec2))
+    a = np.sin((dec2 - dec1) / 2) ** 2 + np.cos(dec1) * np.cos(dec2) * np.sin((ra2 - ra1) / 2) ** 2
+    return np.degrees(2 * np.arcsin(np.sqrt(np.clip(a, 0, 1))))
+
+
+def cone_pixels(order, ra, dec, radius):
+    """
+    Returns the NESTED pixels at the given order that may overlap a cone,
+    found by descending from the base pixels and discarding at each order
+    those that are too far from the center of the cone to overlap it.
+    """
+    pixels = np.arange(12)
+    for level in range(order + 1):
+        if level > 0:
+            pixels = (pixels[:, None] * 4 + np.arange(4)).ravel()
+        centers = pix2ang(level, pixels)
+        pixels = pixels[angular_separation(ra, dec, *centers) <= radius + max_pixel_radius(level)]
+    return pixels
+
+
+def cone_ranges(ra, dec, radius, index_order=INDEX_ORDER):
+    """
+    Returns the ranges of pixel indices at index_order that cover a cone.
+
+    The cone is covered with a few pixels at the coarsest order no finer
+    than the radius. As the scheme is nested, the descendants of each of
+    them at index_order form one contiguous range of indices.
+
+    Returns
+    -------
+    list
+        (start, end) tuples of the covered indices, end being exclusive
+
+    """
+    order = index_order
+    while order > 0 and resolution(order) < radius:
+        order -= 1
+    shift = 2 * (index_order - order)
+    ranges = []
+    for pixel in np.sort(cone_pixels(order, ra, dec, radius)).tolist():
+        start, end = pixel << shift, (pixel + 1) << shift
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def _spread_bits(x):
+    x = x.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)):
+        x = (x | (x << np.uint64(shift))) & np.uint64(mask)
+    return x
+
+
+def _compress_bits(x):
+    x = x.astype(np.uint64) & np.uint64(0x5555555555555555)
+    for shift, mask in ((1, 0x3333333333333333), (2, 0x0F0F0F0F0F0F0F0F), (4, 0x00FF00FF00FF00FF),
+                        (8, 0x0000FFFF0000FFFF), (16, 0x00000000FFFFFFFF)):
+        x = (x | (x >> np.uint64(shift))) & np.uint64(mask)
+    return x.astype(np.int64)
+
+
+def ang2pix(order, ra, dec):
+    """
+    Returns the NESTED indices of the pixels containing the given positions.
+
+    Parameters
+    ----------
+    order : int
+        HEALPix order, between 0 and 29
+    ra : array_like
+        Right Ascension, in degrees
+    dec : array_like
+        Declination, in degrees
+
+    Returns
+    -------
+    numpy.ndarray
+        Pixel indices, as 64 bit integers
+
+    """
+    ns = nside(order)
+    z = np.sin(np.radians(np.asarray(dec, dtype=float)))
+    tt = np.mod(np.asarray(ra, dtype=float), 360.0) / 90.0
+    z, tt = np.broadcast_arrays(z, tt)
+    za = np.abs(z)
+
+    face = np.empty(z.shape, dtype=np.int64)
+    ix = np.empty(z.shape, dtype=np.int64)
+    iy = np.empty(z.shape, dtype=np.int64)
+
+    # Equatorial region
+    eq = za <= 2.0 / 3.0
+    temp1 = ns * (0.5 + tt[eq])
+    temp2 = ns * z[eq] * 0.75
+    jp = (temp1 - temp2).astype(np.int64)
+    jm = (temp1 + temp2).astype(np.int64)
+    ifp = jp >> order
+    ifm = jm >> order
+    face[eq] = np.where(ifp == ifm, ifp | 4, np.where(ifp < ifm, ifp, ifm + 8))
+    ix[eq] = jm & (ns - 1)
+    iy[eq] = ns - (jp & (ns - 1)) - 1
+
+    # Polar caps
+    polar = ~eq
+    ntt = np.minimum(tt[polar].astype(np.int64), 3)
+    tp = tt[polar] - ntt
+    tmp = ns * np.sqrt(3 * (1 - za[polar]))
+    jp = np.minimum((tp * tmp).astype(np.int64), ns - 1)
+    jm = np.minimum(((1.0 - tp) * tmp).astype(np.int64), ns - 1)
+    north = z[polar] >= 0
+    face[polar] = np.where(north, ntt, ntt + 8)
+    ix[polar] = np.where(north, ns - jm - 1, jp)
+    iy[polar] = np.where(north, ns - jp - 1, jm)
+
+    pixels = (face << (2 * order)) + (_spread_bits(ix) | (_spread_bits(iy) << np.uint64(1))).astype(np.int64)
+    return pixels
+
+
+def pix2ang(order, pixels):
+    """
+    Returns the positions of the centers of the given NESTED pixels.
+
+    Returns
+    -------
+    tuple
+        Arrays of the Right Ascension and Declination of the centers, in degrees
+
+    """
+    ns = nside(order)
+    pixels = np.asarray(pixels, dtype=np.int64)
+    face = pixels >> (2 * order)
+    ipf = pixels & (ns * ns - 1)
+    ix = _compress_bits(ipf)
+    iy = _compress_bits(ipf >> 1)
+
+    jr = _JRLL[face] * ns - ix - iy - 1
+    fact2 = 4.0 / npix(order)
+    nr = np.where(jr < ns, jr, np.where(jr > 3 * ns, 4 * ns - jr, ns))
+    z = np.where(
+        jr < ns, 1 - nr * nr * fact2,
+        np.where(jr > 3 * ns, nr * nr * fact2 - 1, (2 * ns - jr) * 2 * ns * fact2)
+    )
+    kshift = np.where((jr >= ns) & (jr <= 3 * ns), (jr - ns) & 1, 0)
+    jp = (_JPLL[face] * nr + ix - iy + 1 + kshift) // 2
+    jp = np.where(jp > 4 * ns, jp - 4 * ns, jp)
+    jp = np.where(jp < 1, jp + 4 * ns, jp)
+    ra = (jp - (kshift + 1) * 0.5) * (90.0 / nr)
+    dec = np.degrees(np.arcsin(np.clip(z, -1, 1)))
+    return ra, dec
@@ -1,20 +1,214 @@
+import codecs
 import csv
-import io
+from itertools import islice
 
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connection, models, transaction
+
+from tom_common.hooks import run_hook
 from .models import Target
+from .coordinates import parse_ra, parse_dec
+from .crossmatch import CROSSMATCH_SETTINGS, match_positions, self_match, merge_fields
+from .aliases import add_aliases, resolve_targets
+
+# Number of rows validated and inserted together, in one transaction
+IMPORT_CHUNK_SIZE = getattr(settings, 'TARGET_IMPORT_CHUNK_SIZE', 1000)
+
+TARGET_FIELDS = {field.name: field for field in Target._meta.concrete_fields}
+
+
+def _build_target(row):
+    """
+    Builds an unsaved target from a row, converting every value to the type
+    of its field. Empty values of nullable fields are stored as null.
+    """
+    values = {}
+    for key, value in row.items():
+        if key not in TARGET_FIELDS:
+            raise TypeError("'{0}' is an invalid keyword argument for this function".format(key))
+        field = TARGET_FIELDS[key]
+        if value == '' and field.null:
+            value = None
+        values[key] = field.to_python(value)
+    target = Target(**values)
+    target.healpix = target.compute_healpix()
+    target.search_names = target.compute_search_names()
+    return target
+
+
+def _insert(targets):
+    """
+    Inserts targets and returns them with their primary keys, which
+    bulk_create only sets itself on databases that can return them. Must be
+    called inside a transaction.
+    """
+    if connection.features.can_return_ids_from_bulk_insert:
+        return Target.objects.bulk_create(targets)
+    if connection.vendor == 'sqlite':
+        # SQLite has a single writer, and the insert holds the write lock until
+        # the transaction ends, so no other rows can be inserted between it and
+        # the select. Keys only ever increase, so the new rows have the highest.
+        Target.objects.bulk_create(targets)
+        return list(reversed(Target.objects.order_by('-pk')[:len(targets)]))
+    # Elsewhere concurrent inserts may interleave keys, so insert each row on
+    # its own, without the hooks and aliases of Target.save
+    for target in targets:
+        models.Model.save(target)
+    return targets
+
+
+class CatalogPositions:
+    """
+    Positions of the existing targets, loaded once and extended with the
+    targets created while importing, to crossmatch every chunk against.
+    """
+    def __init__(self):
+        existing = list(Target.objects.filter(ra__isnull=False, dec__isnull=False).values_list('pk', 'ra', 'dec'))
+        self.pks = [e[0] for e in existing]
+        self.ra = np.array([e[1] for e in existing], dtype=float)
+        self.dec = np.array([e[2] for e in existing], dtype=float)
+
+    def match(self, ra, dec):
+        matches = match_positions(ra, dec, self.ra, self.dec, CROSSMATCH_SETTINGS['radius'])
+        return [self.pks[m] if m >= 0 else None for m in matches]
+
+    def extend(self, targets):
+        targets = [t for t in targets if t.ra is not None and t.dec is not None]
+        self.pks.extend(t.pk for t in targets)
+        self.ra = np.concatenate([self.ra, [t.ra for t in targets]])
+        self.dec = np.concatenate([self.dec, [t.dec for t in targets]])
+
 
+def _import_chunk(rows, policy, catalog, result):
+    """
+    Validates, crossmatches and inserts one chunk of (line number, row)
+    tuples, then runs the targets_post_save hook once for the targets created
+    in bulk.
+    """
+    ra, ra_errors = parse_ra([row.get('ra') for _, row in rows])
+    dec, dec_errors = parse_dec([row.get('dec') for _, row in rows])
+    errors = {index: 'ra: {0}'.format(error) for index, error in ra_errors.items()}
+    errors.update({index: 'dec: {0}'.format(error) for index, error in dec_errors.items()})
+    for index, (_, row) in enumerate(rows):
+        if row.get('type') == Target.SIDEREAL and index not in errors:
+            for key in ('ra', 'dec'):
+                if key in row and not str(row[key] or '').strip():
+                    errors[index] = '{0}: This field is required for sidereal targets'.format(key)
+    # Sexagesimal coordinates are stored in degrees
+    for index, (_, row) in enumerate(rows):
+        if index not in errors:
+            for key, values in (('ra', ra), ('dec', dec)):
+                if key in row:
+                    row[key] = None if np.isnan(values[index]) else float(values[index])
 
-def import_targets(targets):
-    # TODO: Replace this with an in memory iterator
-    stream = io.StringIO(targets.read().decode('utf-8'), newline=None)
-    targetreader = csv.DictReader(stream, dialect=csv.excel)
-    targets = []
-    errors = []
-    for index, row in enumerate(targetreader):
+    if policy != 'create':
+        existing = catalog.match(ra, dec)
+        earlier = self_match(ra, dec)
+        # Rows that are not at the position of a known target may still name one
+        named = resolve_targets([row.get('identifier') for _, row in rows if row.get('identifier')])
+        for index, (_, row) in enumerate(rows):
+            if existing[index] is None and named.get(row.get('identifier')) is not None:
+                existing[index] = named[row['identifier']].pk
+    else:
+        existing, earlier = [None] * len(rows), [-1] * len(rows)
+
+    new_targets = []
+    duplicate_of = {}
+    for index, (line, row) in enumerate(rows):
+        if index in errors:
+            continue
+        if existing[index] is not None or (earlier[index] >= 0 and earlier[index] not in errors):
+            duplicate_of[index] = existing[index]
+            continue
         try:
-            targets.append(Target.objects.create(**row))
-        except Exception as e:
-            error = 'Error on line {0}: {1}'.format(index + 2, str(e))
-            errors.append(error)
+            new_targets.append((index, _build_target(row)))
+        except (TypeError, ValueError, ValidationError) as e:
+            errors[index] = '; '.join(e.messages) if isinstance(e, ValidationError) else str(e)
+
+    inserted_in_bulk = True
+    try:
+        with transaction.atomic():
+            created = _insert([target for _, target in new_targets])
+            add_aliases(created)
+    except DatabaseError:
+        # Fall back to inserting one row at a time, to find the rows at fault.
+        # Saving each target runs its own target_post_save hook.
+        inserted_in_bulk = False
+        created = []
+        for index, target in new_targets:
+            try:
+                with transaction.atomic():
+                    target.save()
+                created.append(target)
+            except DatabaseError as e:
+                errors[index] = str(e)
+    if catalog is not None:
+        catalog.extend(created)
+    result['targets'].extend(created)
+    if created and inserted_in_bulk:
+        run_hook('targets_post_save', targets=created, created=True)
+
+    created_by_index = {index: target for (index, _), target in zip(new_targets, created)} \
+        if len(created) == len(new_targets) else {}
+    matched = Target.objects.in_bulk([pk for pk in duplicate_of.values() if pk is not None])
+    for index, pk in sorted(duplicate_of.items()):
+        line, row = rows[index]
+        match = matched.get(pk) if pk is not None else created_by_index.get(earlier[index])
+        if match is None:
+            continue
+        if policy == 'merge':
+            if merge_fields(match, row):
+                match.save()
+            message = 'Line {0}: {1} merged into existing target {2}'
+        else:
+            message = 'Line {0}: {1} skipped, it matches existing target {2}'
+        result['duplicates'].append(message.format(line, row.get('identifier', ''), match))
+
+    for index in sorted(errors):
+        result['errors'].append('Error on line {0}: {1}'.format(rows[index][0], errors[index]))
+
+
+def import_targets(targets, policy=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Creates targets from a CSV file, reading and inserting it in chunks so
+    that large files are never held in memory in their entirety.
+
+    Each chunk is validated, crossmatched against the existing targets and
+    the earlier rows of the file, and inserted in bulk in one transaction.
+    Rows that match a known target by position or by identifier are handled
+    according to the crossmatch policy.
+
+    Parameters
+    ----------
+    targets : file
+        The uploaded CSV file, encoded as UTF-8
+    policy : str
+        Crossmatch policy, one of "skip", "merge" or "create"
+    chunk_size : int
+        Number of rows inserted together
+
+    Returns
+    -------
+    dict
+        The created "targets", and lists of "errors" and "duplicates"
+        messages, each referring to the line of the row in the file
+
+    """
+    policy = policy or CROSSMATCH_SETTINGS['policy']
+    reader = csv.DictReader(codecs.iterdecode(targets, 'utf-8'), dialect=csv.excel)
+    catalog = CatalogPositions() if policy != 'create' else None
+    result = {'targets': [], 'errors': [], 'duplicates': []}
+
+    def numbered_rows():
+        for row in reader:
+            yield reader.line_num, row
 
-    return {'targets': targets, 'errors': errors}
+    rows = numbered_rows()
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        _import_chunk(chunk, policy, catalog, result)
+    return result
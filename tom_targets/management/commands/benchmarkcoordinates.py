@@ -0,0 +1,49 @@
+import time
+
+import numpy as np
+from astropy import units as u
+from astropy.coordinates import Angle
+from django.core.management.base import BaseCommand
+
+from tom_targets.coordinates import parse_ra, parse_dec
+
+
+def random_sexagesimal(count, seed=0):
+    """
+    Returns random Right Ascensions and Declinations as sexagesimal strings.
+    """
+    random = np.random.RandomState(seed)
+    # Milliseconds of time and hundredths of arcseconds, so that no field rounds up to 60
+    ra = random.randint(0, 24 * 3600 * 1000, count)
+    dec = np.round(np.degrees(np.arcsin(random.uniform(-1, 1, count))) * 360000).astype(int)
+    ra = ['{0:02d}:{1:02d}:{2:06.3f}'.format(r // 3600000, r // 60000 % 60, r % 60000 / 1000) for r in ra]
+    dec = ['{0}{1:02d}:{2:02d}:{3:05.2f}'.format(
+        '-' if d < 0 else '+', abs(d) // 360000, abs(d) // 6000 % 60, abs(d) % 6000 / 100
+    ) for d in dec]
+    return ra, dec
+
+
+class Command(BaseCommand):
+    help = 'Compares the speed of batch coordinate parsing with parsing each value with astropy'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000, help='Number of coordinates to parse')
+
+    def handle(self, *args, **options):
+        ra, dec = random_sexagesimal(options['count'])
+
+        start = time.perf_counter()
+        astropy_ra = np.array([Angle(value, unit=u.hourangle).degree for value in ra])
+        astropy_dec = np.array([Angle(value, unit=u.degree).degree for value in dec])
+        astropy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch_ra, _ = parse_ra(ra)
+        batch_dec, _ = parse_dec(dec)
+        batch_time = time.perf_counter() - start
+
+        difference = max(np.abs(batch_ra - astropy_ra).max(), np.abs(batch_dec - astropy_dec).max())
+        self.stdout.write('astropy: {0:.3f} s, batch: {1:.3f} s, {2:.0f} times faster'.format(
+            astropy_time, batch_time, astropy_time / batch_time
+        ))
+        return 'Largest difference: {0:.2e} degrees'.format(difference)
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from tom_targets.models import Target
+from tom_targets.crossmatch import CROSSMATCH_SETTINGS, self_match, merge_targets
+
+
+class Command(BaseCommand):
+    help = 'Finds targets at the same position and optionally merges them into the oldest of each group'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--radius',
+            type=float,
+            default=CROSSMATCH_SETTINGS['radius'],
+            help='Radius within which targets are considered duplicates, in arcseconds'
+        )
+        parser.add_argument(
+            '--merge',
+            action='store_true',
+            help='Merge the duplicates, rather than only listing them'
+        )
+
+    def handle(self, *args, **options):
+        targets = list(Target.objects.filter(ra__isnull=False, dec__isnull=False).order_by('pk'))
+        first = self_match([t.ra for t in targets], [t.dec for t in targets], options['radius'])
+        groups = {}
+        for index, root in enumerate(first.tolist()):
+            if root >= 0:
+                groups.setdefault(root, []).append(targets[index])
+
+        for root, duplicates in groups.items():
+            keep = targets[root]
+            self.stdout.write('{0}: {1}'.format(keep, ', '.join(str(d) for d in duplicates)))
+            if options['merge']:
+                merge_targets(keep, duplicates)
+        action = 'Merged' if options['merge'] else 'Found'
+        return '{0} {1} duplicate targets in {2} groups'.format(
+            action, sum(len(d) for d in groups.values()), len(groups)
+        )
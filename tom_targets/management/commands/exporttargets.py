@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+
+from tom_targets.export import EXPORT_FORMATS, export_targets
+from tom_targets.filters import TargetFilter
+from tom_targets.models import Target
+
+
+class Command(BaseCommand):
+    help = 'Exports the targets matching the filters of the target list as CSV, VOTable or newline-delimited JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv', help='Format of the export')
+        parser.add_argument('--output', help='File to write the export to, instead of the standard output')
+        parser.add_argument('--extras', action='store_true', help='Include the extras of the targets')
+        parser.add_argument('--photometry', action='store_true', help='Include the latest photometry of the targets')
+        parser.add_argument(
+            '--filter',
+            action='append',
+            default=[],
+            help='A filter of the target list as name=value, e.g. --filter type=SIDEREAL. May be repeated.'
+        )
+
+    def handle(self, *args, **options):
+        filters = QueryDict(mutable=True)
+        for target_filter in options['filter']:
+            name, sep, value = target_filter.partition('=')
+            if not sep:
+                raise CommandError('Filters must be given as name=value, not {0}'.format(target_filter))
+            filters.appendlist(name, value)
+        targets = TargetFilter(filters, queryset=Target.objects.all()).qs
+
+        pieces = export_targets(targets, options['format'], options['extras'], options['photometry'])
+        if not options['output']:
+            for piece in pieces:
+                self.stdout.write(piece, ending='')
+            return
+        with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+            for piece in pieces:
+                output.write(piece)
@@ -0,0 +1,30 @@
+# Generated by Django 2.1.15 on 2026-10-19 01:15
+
+from django.db import migrations, models
+
+
+def index_targets(apps, schema_editor):
+    from tom_targets import healpix
+    Target = apps.get_model('tom_targets', 'Target')
+    targets = list(Target.objects.filter(ra__isnull=False, dec__isnull=False).values_list('pk', 'ra', 'dec'))
+    if not targets:
+        return
+    pks, ras, decs = zip(*targets)
+    for pk, pixel in zip(pks, healpix.ang2pix(healpix.INDEX_ORDER, ras, decs).tolist()):
+        Target.objects.filter(pk=pk).update(healpix=pixel)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_targets', '0005_merge_20190131_1950'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='target',
+            name='healpix',
+            field=models.BigIntegerField(blank=True, db_index=True, editable=False, help_text='NESTED HEALPix pixel of the position of the target, used to index it on the sky.', null=True, verbose_name='HEALPix Index'),
+        ),
+        migrations.RunPython(index_targets, migrations.RunPython.noop),
+    ]
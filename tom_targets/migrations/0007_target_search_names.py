@@ -0,0 +1,54 @@
+# Generated by Django 2.1.15 on 2026-10-19 01:24
+
+import re
+
+from django.db import migrations, models
+
+NON_ALPHANUMERIC = re.compile(r'[\W_]+')
+
+
+def search_names(*names):
+    # A copy of tom_targets.search.search_names as it was when this migration
+    # was written, so that later changes to it do not change what this
+    # migration does
+    normalized = []
+    for name in names:
+        name = NON_ALPHANUMERIC.sub('', str(name or '')).lower()
+        if name and name not in normalized:
+            normalized.append(name)
+    return ' '.join(normalized)
+
+
+def index_names(apps, schema_editor):
+    Target = apps.get_model('tom_targets', 'Target')
+    for target in Target.objects.only('identifier', 'name', 'name2', 'name3').iterator():
+        Target.objects.filter(pk=target.pk).update(
+            search_names=search_names(target.identifier, target.name, target.name2, target.name3)
+        )
+
+
+def create_search_index(apps, schema_editor):
+    from tom_targets.search import ensure_search_index
+    ensure_search_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    from tom_targets.search import drop_search_index
+    drop_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_targets', '0006_target_healpix'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='target',
+            name='search_names',
+            field=models.TextField(blank=True, default='', editable=False, help_text='Normalized identifier and names of the target, used to search for it by name.', verbose_name='Search Names'),
+        ),
+        migrations.RunPython(index_names, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 2.1.15 on 2026-10-19 01:27
+
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+NON_ALPHANUMERIC = re.compile(r'[\W_]+')
+
+
+def normalize_name(name):
+    # A copy of tom_targets.search.normalize_name as it was when this
+    # migration was written, so that later changes to it do not change what
+    # this migration does
+    return NON_ALPHANUMERIC.sub('', str(name or '')).lower()
+
+
+def add_aliases(apps, schema_editor):
+    Target = apps.get_model('tom_targets', 'Target')
+    TargetAlias = apps.get_model('tom_targets', 'TargetAlias')
+    aliases = {}
+    for target in Target.objects.order_by('pk').iterator():
+        for name in (target.identifier, target.name, target.name2, target.name3):
+            key = normalize_name(name)
+            if key and key not in aliases:
+                aliases[key] = TargetAlias(target_id=target.pk, name=name, key=key)
+    TargetAlias.objects.bulk_create(aliases.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_targets', '0007_target_search_names'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TargetAlias',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='A name of the target, e.g. SN 2019abc.', max_length=100)),
+                ('key', models.CharField(editable=False, help_text='The name in lowercase without spaces or punctuation, by which it is looked up.', max_length=100, unique=True)),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aliases', to='tom_targets.Target')),
+            ],
+            options={
+                'verbose_name_plural': 'target aliases',
+            },
+        ),
+        migrations.RunPython(add_aliases, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 2.1.15 on 2026-10-19 01:28
+
+import math
+from datetime import datetime
+
+from django.db import migrations, models
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+def parse_extra_value(value):
+    # A copy of tom_targets.models.parse_extra_value as it was when this
+    # migration was written, so that later changes to it do not change what
+    # this migration does
+    value = str(value or '').strip()
+    try:
+        number = float(value)
+        return (number if math.isfinite(number) else None), None
+    except ValueError:
+        pass
+    try:
+        time = parse_datetime(value)
+        if time is None:
+            date = parse_date(value)
+            time = datetime(date.year, date.month, date.day) if date else None
+    except ValueError:
+        time = None
+    if time is not None and timezone.is_naive(time):
+        time = timezone.make_aware(time, timezone.utc)
+    return None, time
+
+
+def type_values(apps, schema_editor):
+    TargetExtra = apps.get_model('tom_targets', 'TargetExtra')
+    for extra in TargetExtra.objects.only('value').iterator():
+        float_value, time_value = parse_extra_value(extra.value)
+        if float_value is not None or time_value is not None:
+            TargetExtra.objects.filter(pk=extra.pk).update(float_value=float_value, time_value=time_value)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_targets', '0008_targetalias'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='targetextra',
+            name='float_value',
+            field=models.FloatField(blank=True, editable=False, help_text='The value, if it is a number, for filtering by range.', null=True),
+        ),
+        migrations.AddField(
+            model_name='targetextra',
+            name='time_value',
+            field=models.DateTimeField(blank=True, editable=False, help_text='The value, if it is a date or time, for filtering by range.', null=True),
+        ),
+        migrations.RunPython(type_values, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='targetextra',
+            index=models.Index(fields=['key', 'float_value'], name='tom_targets_key_958a56_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='targetextra',
+            index=models.Index(fields=['key', 'time_value'], name='tom_targets_key_7cd479_idx'),
+        ),
+    ]
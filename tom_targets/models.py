@@ -1,8 +1,17 @@
-from django.db import models
+import math
+from datetime import datetime
+
+from django.db import models, transaction
+from django.db.models import Count, ExpressionWrapper, F, FloatField, Func, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.forms.models import model_to_dict
 
 from tom_common.hooks import run_hook
+from tom_targets import healpix
+from tom_targets.search import normalize_name, search_names
 
 
 GLOBAL_TARGET_FIELDS = ['identifier', 'name', 'name2', 'name3', 'type']
@@ -27,6 +36,57 @@ REQUIRED_SIDEREAL_FIELDS = ['ra', 'dec']
 REQUIRED_NON_SIDEREAL_FIELDS = NON_SIDEREAL_FIELDS
 
 
+class Sin(Func):
+    function = 'SIN'
+    output_field = FloatField()
+
+
+class Cos(Func):
+    function = 'COS'
+    output_field = FloatField()
+
+
+class TargetQuerySet(models.QuerySet):
+    def with_counts(self):
+        """
+        Annotates each target with the number of its observations as
+        observation_count and of its data products as dataproduct_count.
+        The counts are correlated subqueries, so a page of targets and their
+        counts is fetched in a single query.
+        """
+        from tom_observations.models import ObservationRecord
+        from tom_dataproducts.models import DataProduct
+
+        def count_of(model):
+            related = model.objects.filter(target=OuterRef('pk')).order_by().values('target')
+            return Coalesce(
+                Subquery(related.annotate(count=Count('pk')).values('count'), output_field=IntegerField()), 0
+            )
+
+        return self.annotate(observation_count=count_of(ObservationRecord), dataproduct_count=count_of(DataProduct))
+
+    def cone_search(self, ra, dec, radius):
+        """
+        Returns the targets within radius degrees of a position, annotated
+        with the haversine of their distance from it as cone_distance, which
+        orders them by distance.
+
+        Candidates are narrowed down with the healpix index to the pixels
+        covering the cone, then the exact angular distance of each candidate
+        is checked in the same query.
+        """
+        ranges = Q()
+        for start, end in healpix.cone_ranges(ra, dec, radius):
+            ranges |= Q(healpix__gte=start, healpix__lt=end)
+        half_radian = math.pi / 360
+        sin_dec = Sin((F('dec') - dec) * half_radian)
+        sin_ra = Sin((F('ra') - ra) * half_radian)
+        cos_dec = Cos(F('dec') * (2 * half_radian))
+        haversine = sin_dec * sin_dec + math.cos(math.radians(dec)) * cos_dec * sin_ra * sin_ra
+        return self.filter(ranges).annotate(
+            cone_distance=ExpressionWrapper(haversine, output_field=FloatField())
+        ).filter(cone_distance__lte=math.sin(math.radians(radius) / 2) ** 2)
+
 class Target(models.Model):
     SIDEREAL = 'SIDEREAL'
     NON_SIDEREAL = 'NON_SIDEREAL'
@@ -129,18 +189,43 @@ class Target(models.Model):
     redshift = models.FloatField(
         null=True, blank=True, verbose_name='Redshift', help_text='The redshift of the target'
     )
+    healpix = models.BigIntegerField(
+        null=True, blank=True, editable=False, db_index=True, verbose_name='HEALPix Index',
+        help_text='NESTED HEALPix pixel of the position of the target, used to index it on the sky.'
+    )
+    search_names = models.TextField(
+        default='', blank=True, editable=False, verbose_name='Search Names',
+        help_text='Normalized identifier and names of the target, used to search for it by name.'
+    )
+
+    objects = TargetQuerySet.as_manager()
 
     class Meta:
         ordering = ('id',)
 
     def save(self, *args, **kwargs):
         created = False if self.id else True
-        super().save(*args, **kwargs)
+        self.healpix = self.compute_healpix()
+        self.search_names = self.compute_search_names()
+        previous_names = () if created else \
+            Target.objects.filter(pk=self.pk).values_list('identifier', 'name', 'name2', 'name3').first() or ()
+        from tom_targets.aliases import sync_aliases
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            sync_aliases(self, previous_names)
         run_hook('target_post_save', target=self, created=created)
 
     def __str__(self):
         return str(self.identifier)
 
+    def compute_healpix(self):
+        if self.ra is None or self.dec is None:
+            return None
+        return int(healpix.ang2pix(healpix.INDEX_ORDER, self.ra, self.dec))
+
+    def compute_search_names(self):
+        return search_names(self.identifier, self.name, self.name2, self.name3)
+
     def get_absolute_url(self):
         return reverse('targets:detail', kwargs={'pk': self.id})
 
@@ -161,10 +246,76 @@ class Target(models.Model):
         return model_to_dict(self, fields=fields_for_type)
 
 
+def parse_extra_value(value):
+    """
+    Interprets the value of a target extra as a number and as a time.
+
+    Returns
+    -------
+    tuple
+        The value as a float and as an aware datetime, each None if the
+        value is not one. Dates are taken as midnight UTC.
+
+    """
+    value = str(value or '').strip()
+    try:
+        number = float(value)
+        return (number if math.isfinite(number) else None), None
+    except ValueError:
+        pass
+    try:
+        time = parse_datetime(value)
+        if time is None:
+            date = parse_date(value)
+            time = datetime(date.year, date.month, date.day) if date else None
+    except ValueError:
+        time = None
+    if time is not None and timezone.is_naive(time):
+        time = timezone.make_aware(time, timezone.utc)
+    return None, time
+
+
 class TargetExtra(models.Model):
     target = models.ForeignKey(Target, on_delete=models.CASCADE)
     key = models.CharField(max_length=200)
     value = models.TextField()
+    float_value = models.FloatField(
+        null=True, blank=True, editable=False, help_text='The value, if it is a number, for filtering by range.'
+    )
+    time_value = models.DateTimeField(
+        null=True, blank=True, editable=False, help_text='The value, if it is a date or time, for filtering by range.'
+    )
+
+    class Meta:
+        # The value itself is not indexed, as text of unbounded length cannot
+        # be indexed on MySQL and only up to a limited length on PostgreSQL
+        indexes = [
+            models.Index(fields=['key', 'float_value']),
+            models.Index(fields=['key', 'time_value']),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.float_value, self.time_value = parse_extra_value(self.value)
+        super().save(*args, **kwargs)
+
+
+class TargetAlias(models.Model):
+    target = models.ForeignKey(Target, on_delete=models.CASCADE, related_name='aliases')
+    name = models.CharField(max_length=100, help_text='A name of the target, e.g. SN 2019abc.')
+    key = models.CharField(
+        max_length=100, unique=True, editable=False,
+        help_text='The name in lowercase without spaces or punctuation, by which it is looked up.'
+    )
+
+    class Meta:
+        verbose_name_plural = 'target aliases'
+
+    def save(self, *args, **kwargs):
+        self.key = normalize_name(self.name)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.name
 
 
 class TargetList(models.Model):
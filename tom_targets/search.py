@@ -0,0 +1,179 @@
+"""
+Indexed search of targets by name.
+
+Every target stores the normalized forms of its identifier and names in
+its search_names column: lowercase, with everything but letters and digits
+removed, so that "SN 2019abc", "sn2019abc" and "2019abc" all match it. The
+column is indexed for substring search with a trigram index: an FTS5 table
+with the trigram tokenizer on SQLite, kept in sync by triggers, and a
+pg_trgm GIN index on PostgreSQL. Other databases, or queries too short for
+trigrams, fall back to a LIKE scan of the column.
+"""
+import logging
+import re
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.expressions import RawSQL
+
+logger = logging.getLogger(__name__)
+
+# Determine settings for this module. Autocomplete only searches queries of
+# at least min_length characters, and returns at most limit targets.
+SEARCH_SETTINGS = {
+    'min_length': 2,
+    'limit': 10,
+    **getattr(settings, 'TARGET_SEARCH_SETTINGS', {})
+}
+
+TARGET_TABLE = 'tom_targets_target'
+SEARCH_TABLE = 'tom_targets_target_search'
+TRIGRAM_INDEX = 'tom_targets_target_search_names_trgm'
+# Trigram indexes can only be used for queries of at least three characters
+TRIGRAM_LENGTH = 3
+
+NON_ALPHANUMERIC = re.compile(r'[\W_]+')
+
+SQLITE_INDEX = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {search} USING fts5("
+    "search_names, content='{target}', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS {search}_insert AFTER INSERT ON {target} BEGIN "
+    "INSERT INTO {search}(rowid, search_names) VALUES (new.id, new.search_names); END",
+    "CREATE TRIGGER IF NOT EXISTS {search}_delete AFTER DELETE ON {target} BEGIN "
+    "INSERT INTO {search}({search}, rowid, search_names) VALUES ('delete', old.id, old.search_names); END",
+    "CREATE TRIGGER IF NOT EXISTS {search}_update AFTER UPDATE OF search_names ON {target} BEGIN "
+    "INSERT INTO {search}({search}, rowid, search_names) VALUES ('delete', old.id, old.search_names); "
+    "INSERT INTO {search}(rowid, search_names) VALUES (new.id, new.search_names); END",
+    "INSERT INTO {search}({search}) VALUES ('rebuild')",
+]
+
+# Whether the SQLite search table and its triggers exist, by database alias,
+# so that searches only look them up once per process
+_sqlite_index = {}
+
+POSTGRESQL_INDEX = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS {index} ON {target} USING gin (search_names gin_trgm_ops)',
+]
+
+
+class SearchMatches(RawSQL):
+    """
+    The ids of the targets matching a full text query, as a subquery for a
+    pk__in filter. RawSQL would be wrapped in a second pair of parentheses,
+    which makes SQLite take the subquery as a scalar and only match its
+    first row.
+    """
+    def __init__(self, query):
+        super().__init__('SELECT rowid FROM {0} WHERE {0} MATCH %s'.format(SEARCH_TABLE), ['"{0}"'.format(query)])
+
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+def normalize_name(name):
+    """
+    Returns the form of a name that is searched and compared: lowercase,
+    with everything but letters and digits removed.
+    """
+    return NON_ALPHANUMERIC.sub('', str(name or '')).lower()
+
+
+def search_names(*names):
+    """
+    Returns the value of the search column for the given names.
+    """
+    normalized = []
+    for name in map(normalize_name, names):
+        if name and name not in normalized:
+            normalized.append(name)
+    return ' '.join(normalized)
+
+
+def _sqlite_index_exists(connection, cached=True):
+    if not cached or connection.alias not in _sqlite_index:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name = %s",
+                ['{0}_update'.format(SEARCH_TABLE)]
+            )
+            _sqlite_index[connection.alias] = cursor.fetchone() is not None
+    return _sqlite_index[connection.alias]
+
+
+def ensure_search_index(connection):
+    """
+    Creates the trigram index of the search column if it does not exist.
+
+    On SQLite, altering the target table recreates it without the triggers
+    that keep the search table in sync, so this is also run after every
+    migration, and rebuilds the search table whenever the triggers are
+    missing.
+    """
+    if connection.vendor == 'sqlite':
+        if _sqlite_index_exists(connection, cached=False):
+            return
+        statements = SQLITE_INDEX
+    elif connection.vendor == 'postgresql':
+        statements = POSTGRESQL_INDEX
+    else:
+        return
+    try:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement.format(search=SEARCH_TABLE, target=TARGET_TABLE, index=TRIGRAM_INDEX))
+    except DatabaseError as e:
+        logger.warning('Could not create the target name search index, searches will scan all targets: %s', e)
+    finally:
+        _sqlite_index.pop(connection.alias, None)
+
+
+def drop_search_index(connection):
+    _sqlite_index.pop(connection.alias, None)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for suffix in ('insert', 'delete', 'update'):
+                cursor.execute('DROP TRIGGER IF EXISTS {0}_{1}'.format(SEARCH_TABLE, suffix))
+            cursor.execute('DROP TABLE IF EXISTS {0}'.format(SEARCH_TABLE))
+        elif connection.vendor == 'postgresql':
+            cursor.execute('DROP INDEX IF EXISTS {0}'.format(TRIGRAM_INDEX))
+
+
+def search_targets(queryset, query):
+    """
+    Filters a queryset of targets to those with an identifier or name that
+    contains the query, ignoring case, spaces and punctuation.
+    """
+    query = normalize_name(query)
+    if not query:
+        return queryset
+    connection = transaction.get_connection(queryset.db)
+    if connection.vendor == 'sqlite' and len(query) >= TRIGRAM_LENGTH and _sqlite_index_exists(connection):
+        return queryset.filter(pk__in=SearchMatches(query))
+    return queryset.filter(search_names__contains=query)
+
+
+def autocomplete(query, limit=None):
+    """
+    Returns the targets whose names contain the query, those whose
+    identifier starts with it first, for suggesting targets as a name is
+    typed.
+
+    Returns
+    -------
+    list
+        Dictionaries of the id, identifier and name of each target
+
+    """
+    from tom_targets.models import Target
+
+    limit = limit or SEARCH_SETTINGS['limit']
+    normalized = normalize_name(query)
+    if len(normalized) < SEARCH_SETTINGS['min_length']:
+        return []
+    targets = search_targets(Target.objects.all(), query).annotate(
+        rank=Case(When(search_names__startswith=normalized, then=Value(0)), default=Value(1),
+                  output_field=IntegerField())
+    ).order_by('rank', 'identifier')
+    return list(targets.values('id', 'identifier', 'name')[:limit])
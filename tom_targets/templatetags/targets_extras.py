@@ -10,6 +10,7 @@ import ephem
 
 from tom_targets.models import Target
 from tom_targets.forms import TargetVisibilityForm
+from tom_targets.distribution import sky_distribution
 from tom_observations.utils import get_visibility
 
 import datetime
@@ -75,13 +76,15 @@ def target_reference(target):
     return {'target': target}
 
 @register.inclusion_tag('tom_targets/partials/target_distribution.html')
-def target_distribution(targets):
-    locations = targets.filter(type=Target.SIDEREAL).values_list('ra', 'dec', 'name')
+def target_distribution(target_filter):
+    bins = sky_distribution(target_filter.qs, filters=target_filter.applied_filters)['bins']
+    counts = np.array([b['count'] for b in bins])
     data = [
         dict(
-            lon=[l[0] for l in locations],
-            lat=[l[1] for l in locations],
-            text=[l[2] for l in locations],
+            lon=[b['ra'] for b in bins],
+            lat=[b['dec'] for b in bins],
+            text=['{0} targets'.format(count) for count in counts],
+            marker=dict(size=(4 + 16 * np.sqrt(counts / counts.max())).tolist() if len(bins) else []),
             hoverinfo='lon+lat+text',
             mode='markers',
             type='scattergeo'
@@ -1,19 +1,46 @@
+import csv
+import json
 import math
+from io import BytesIO, StringIO
 from unittest import mock
 from datetime import datetime, timedelta
 
+import numpy as np
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, DatabaseError
 from django.urls import reverse
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.utils import timezone
+from django.conf import settings
+from django_comments.models import Comment
 
 import ephem
 from astropy import units
 from astropy.coordinates import Angle
+from astropy.io.votable import parse_single_table
 
 from .factories import SiderealTargetFactory, NonSiderealTargetFactory
 from tom_targets.models import Target
+from tom_targets import healpix
+from tom_targets.distribution import sky_distribution
+from tom_targets.crossmatch import CROSSMATCH_SETTINGS, match_positions, merge_targets
+from tom_targets.import_targets import import_targets
+from tom_targets.coordinates import parse_angles, parse_ra, parse_dec
+from tom_targets.forms import SiderealTargetCreateForm
+from tom_targets.search import search_targets, normalize_name, autocomplete
+from tom_targets.search import drop_search_index, ensure_search_index, SEARCH_TABLE
+from tom_targets.aliases import alias_keys, resolve_target, resolve_targets
+from tom_targets.models import TargetAlias, TargetExtra, parse_extra_value
+from tom_targets.filters import TargetFilter
+from tom_targets.export import export_targets
+from tom_dataproducts.models import ReducedDatum, ReducedDatumSource
 from tom_observations.utils import get_visibility, get_pyephem_instance_for_type
 from tom_observations.tests.utils import FakeFacility
+from tom_observations.models import ObservationRecord
 
 
 class TestTargetDetail(TestCase):
@@ -87,6 +114,322 @@ class TestTargetCreate(TestCase):
         self.assertAlmostEqual(target.dec, 22.0145, places=4)
 
 
+class TestTargetList(TestCase):
+    def setUp(self):
+        user = User.objects.create(username='testuser')
+        self.client.force_login(user)
+
+    def create_targets(self, number):
+        for _ in range(number):
+            target = SiderealTargetFactory.create()
+            for observation_id in ['1', '2']:
+                ObservationRecord.objects.create(
+                    target=target, facility=FakeFacility.name, parameters='{}', observation_id=observation_id
+                )
+
+    def test_counts_annotated(self):
+        self.create_targets(1)
+        target = Target.objects.with_counts().get()
+        self.assertEqual((target.observation_count, target.dataproduct_count), (2, 0))
+        response = self.client.get(reverse('targets:list'))
+        self.assertEqual(response.context['object_list'][0].observation_count, 2)
+
+    def test_query_count_independent_of_page_size(self):
+        self.create_targets(2)
+        with CaptureQueriesContext(connection) as small_page:
+            self.client.get(reverse('targets:list'))
+        self.create_targets(20)
+        with CaptureQueriesContext(connection) as full_page:
+            response = self.client.get(reverse('targets:list'))
+        self.assertEqual(len(response.context['object_list']), 22)
+        self.assertEqual(len(small_page), len(full_page))
+
+
+class TestHealpix(TestCase):
+    def test_pixel_centers_round_trip(self):
+        for order in range(5):
+            pixels = np.arange(healpix.npix(order))
+            self.assertTrue((healpix.ang2pix(order, *healpix.pix2ang(order, pixels)) == pixels).all())
+
+    def test_nested_parents(self):
+        ra = np.random.uniform(0, 360, 1000)
+        dec = np.degrees(np.arcsin(np.random.uniform(-1, 1, 1000)))
+        self.assertTrue((healpix.ang2pix(16, ra, dec) >> 8 == healpix.ang2pix(12, ra, dec)).all())
+        self.assertEqual(healpix.ang2pix(0, [45, 0, 45], [90, 0, -90]).tolist(), [0, 4, 8])
+
+
+class TestTargetDistribution(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create(username='testuser')
+        self.client.force_login(user)
+        for ra, dec in [(10.0, 10.0), (10.1, 10.1), (200.0, -45.0)]:
+            SiderealTargetFactory.create(ra=ra, dec=dec)
+        NonSiderealTargetFactory.create()
+
+    def test_binned_distribution_cached(self):
+        distribution = sky_distribution(Target.objects.all(), order=3)
+        self.assertEqual(sorted(b['count'] for b in distribution['bins']), [1, 2])
+        with self.assertNumQueries(1):
+            self.assertEqual(sky_distribution(Target.objects.all(), order=3), distribution)
+        SiderealTargetFactory.create(ra=300.0, dec=0.0)
+        self.assertEqual(len(sky_distribution(Target.objects.all(), order=3)['bins']), 3)
+
+    def test_distribution_of_no_targets(self):
+        self.assertEqual(sky_distribution(Target.objects.none(), order=3), {'order': 3, 'bins': []})
+        for parameters in ({'identifier': 'nomatch'}, {'value_min': 'abc'}, {'cone_search': 'abc'}):
+            response = self.client.get(reverse('targets:list'), parameters)
+            self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('targets:distribution'), {'cone_search': 'abc'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_distribution_cached_per_filter(self):
+        response = self.client.get(reverse('targets:distribution'), {'order': 3})
+        self.assertEqual(sum(b['count'] for b in response.json()['bins']), 3)
+        response = self.client.get(reverse('targets:distribution'), {'order': 3, 'cone_search': '10, 10, 1'})
+        self.assertEqual(sum(b['count'] for b in response.json()['bins']), 2)
+
+    def test_points_in_region(self):
+        response = self.client.get(
+            reverse('targets:distribution'), {'ra_min': 9, 'ra_max': 11, 'dec_min': 9, 'dec_max': 11}
+        )
+        self.assertEqual(len(response.json()['points']), 2)
+        response = self.client.get(reverse('targets:distribution'), {'order': 'a'})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestConeSearch(TestCase):
+    def setUp(self):
+        self.near = SiderealTargetFactory.create(ra=150.0, dec=2.0)
+        self.edge = SiderealTargetFactory.create(ra=150.0, dec=2.0 + 9 / 3600)
+        self.far = SiderealTargetFactory.create(ra=150.0, dec=2.0 + 11 / 3600)
+        self.wrapped = SiderealTargetFactory.create(ra=359.9999, dec=0.0)
+        NonSiderealTargetFactory.create()
+
+    def test_healpix_kept_up_to_date(self):
+        self.assertEqual(self.near.healpix, int(healpix.ang2pix(healpix.INDEX_ORDER, 150.0, 2.0)))
+        self.near.ra = 10.0
+        self.near.save()
+        self.assertEqual(Target.objects.get(pk=self.near.pk).healpix, int(healpix.ang2pix(16, 10.0, 2.0)))
+
+    def test_cone_search(self):
+        with self.assertNumQueries(1):
+            matches = set(Target.objects.cone_search(150.0, 2.0, 10 / 3600))
+        self.assertEqual(matches, {self.near, self.edge})
+        self.assertEqual(list(Target.objects.cone_search(0.0001, 0.0, 1 / 3600)), [self.wrapped])
+        self.assertEqual(Target.objects.cone_search(20.0, 20.0, 1).count(), 0)
+
+    def test_large_cone_search(self):
+        # More matches than SQLite allows parameters in a query
+        random = np.random.RandomState(0)
+        ra, dec = random.uniform(49, 51, 3000), random.uniform(-1, 1, 3000)
+        Target.objects.bulk_create([
+            Target(identifier=str(i), type=Target.SIDEREAL, ra=r, dec=d,
+                   healpix=int(healpix.ang2pix(healpix.INDEX_ORDER, r, d)))
+            for i, (r, d) in enumerate(zip(ra, dec))
+        ])
+        expected = {str(i) for i in np.flatnonzero(healpix.angular_separation(50, 0, ra, dec) <= 0.9)}
+        matches = Target.objects.cone_search(50, 0, 0.9).order_by('cone_distance')
+        self.assertEqual(set(matches.values_list('identifier', flat=True)), expected)
+        self.assertGreater(len(expected), 1000)
+        nearest = np.argmin(healpix.angular_separation(50, 0, ra, dec))
+        self.assertEqual(matches.first().identifier, str(nearest))
+
+    def test_cone_search_filter(self):
+        user = User.objects.create(username='testuser')
+        self.client.force_login(user)
+        response = self.client.get(reverse('targets:list'), {'cone_search': '150, 2, 0.0028'})
+        self.assertEqual(set(response.context['object_list']), {self.near, self.edge})
+
+    def test_invalid_cone_search(self):
+        user = User.objects.create(username='testuser')
+        self.client.force_login(user)
+        for cone in ('abc', '1,2,nan', '1,2,-1', '1,2,0', 'inf,2,1'):
+            response = self.client.get(reverse('targets:list'), {'cone_search': cone})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('cone_search', response.context['filter'].errors)
+            self.assertEqual(len(response.context['object_list']), Target.objects.count())
+
+
+class TestCrossmatch(TestCase):
+    def setUp(self):
+        user = User.objects.create(username='testuser')
+        self.client.force_login(user)
+        self.existing = SiderealTargetFactory.create(identifier='SN 2019abc', name='', ra=150.0, dec=2.0, redshift=None)
+
+    def test_match_positions_against_brute_force(self):
+        ra, dec = np.random.uniform(10, 11, 500), np.random.uniform(-1, 1, 500)
+        catalog_ra, catalog_dec = np.random.uniform(10, 11, 2000), np.random.uniform(-1, 1, 2000)
+        matches = match_positions(ra, dec, catalog_ra, catalog_dec, 60)
+        separations = healpix.angular_separation(ra[:, None], dec[:, None], catalog_ra, catalog_dec)
+        expected = np.where(separations.min(axis=1) <= 60 / 3600, separations.argmin(axis=1), -1)
+        self.assertEqual(matches.tolist(), expected.tolist())
+
+    def test_import_skips_duplicates(self):
+        csv_file = SimpleUploadedFile('targets.csv', (
+            'identifier,name,type,ra,dec\n'
+            'AT2019abc,AT2019abc,SIDEREAL,150.0003,2.0\n'
+            'new,new,SIDEREAL,20.0,20.0\n'
+            'again,again,SIDEREAL,20.0001,20.0\n'
+        ).encode())
+        result = import_targets(csv_file, policy='skip')
+        self.assertEqual([t.identifier for t in result['targets']], ['new'])
+        self.assertEqual(len(result['duplicates']), 2)
+        self.assertIn('Line 2', result['duplicates'][0])
+        self.assertEqual(Target.objects.count(), 2)
+
+    def test_import_merges_duplicates(self):
+        csv_file = SimpleUploadedFile('targets.csv', (
+            'identifier,name,type,ra,dec,redshift\nAT2019abc,AT2019abc,SIDEREAL,150.0003,2.0,0.05\n'
+        ).encode())
+        result = import_targets(csv_file, policy='merge')
+        self.assertEqual(result['targets'], [])
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.redshift, self.existing.name, self.existing.name2), (0.05, 'AT2019abc', ''))
+
+    def test_dedupe_command(self):
+        duplicate = SiderealTargetFactory.create(ra=150.0, dec=2.0001)
+        ObservationRecord.objects.create(target=duplicate, facility=FakeFacility.name, parameters='{}')
+        out = StringIO()
+        call_command('dedupetargets', stdout=out)
+        self.assertEqual(Target.objects.count(), 2)
+        call_command('dedupetargets', merge=True, stdout=out)
+        self.assertEqual(list(Target.objects.all()), [self.existing])
+        self.assertEqual(self.existing.observationrecord_set.count(), 1)
+
+    def test_create_existing_target(self):
+        response = self.client.post(reverse('targets:create'), data={
+            'identifier': 'AT2019abc', 'name': 'AT2019abc', 'type': Target.SIDEREAL, 'ra': 150.0, 'dec': 2.0,
+            'targetextra_set-TOTAL_FORMS': 0, 'targetextra_set-INITIAL_FORMS': 0,
+        }, follow=True)
+        self.assertRedirects(response, reverse('targets:detail', kwargs={'pk': self.existing.pk}))
+        self.assertEqual(Target.objects.count(), 1)
+        self.assertNotContains(response, 'Not copied')
+
+    def test_create_existing_target_anyway(self):
+        response = self.client.post(reverse('targets:create'), data={
+            'identifier': 'AT2019abc', 'name': 'AT2019abc', 'type': Target.SIDEREAL, 'ra': 150.0, 'dec': 2.0,
+            'create_anyway': True,
+            'targetextra_set-TOTAL_FORMS': 0, 'targetextra_set-INITIAL_FORMS': 0,
+        }, follow=True)
+        created = Target.objects.get(identifier='AT2019abc')
+        self.assertRedirects(response, reverse('targets:detail', kwargs={'pk': created.pk}))
+        self.assertEqual(Target.objects.count(), 2)
+
+    def test_import_page_describes_policy(self):
+        response = self.client.get(reverse('targets:import'))
+        self.assertContains(response, 'are skipped')
+        with mock.patch.dict(CROSSMATCH_SETTINGS, policy='create'):
+            response = self.client.get(reverse('targets:import'))
+        self.assertContains(response, 'Every row creates a new target')
+
+    def create_duplicate(self):
+        return self.client.post(reverse('targets:create'), data={
+            'identifier': 'ZTF19aaaaaaa', 'name': 'ZTF19aaaaaaa', 'type': Target.SIDEREAL, 'ra': 150.0, 'dec': 2.0,
+            'targetextra_set-TOTAL_FORMS': 1, 'targetextra_set-INITIAL_FORMS': 0,
+            'targetextra_set-0-key': 'host', 'targetextra_set-0-value': 'NGC 1234',
+        }, follow=True)
+
+    def test_create_existing_target_skipped(self):
+        response = self.create_duplicate()
+        self.assertContains(response, 'Not copied to SN 2019abc: ZTF19aaaaaaa, host')
+        self.assertEqual(self.existing.targetextra_set.count(), 0)
+
+    def test_create_existing_target_merged(self):
+        other = SiderealTargetFactory.create(identifier='ZTF19aaaaaaa', ra=20.0, dec=20.0)
+        TargetExtra.objects.create(target=self.existing, key='host', value='NGC 5678')
+        with mock.patch.dict(CROSSMATCH_SETTINGS, policy='merge'):
+            response = self.create_duplicate()
+        self.assertContains(response, 'Not copied to SN 2019abc: ZTF19aaaaaaa, host')
+        self.assertEqual(resolve_target('ZTF19aaaaaaa'), other)
+        TargetExtra.objects.filter(target=self.existing).delete()
+        other.delete()
+        with mock.patch.dict(CROSSMATCH_SETTINGS, policy='merge'):
+            response = self.create_duplicate()
+        self.assertNotContains(response, 'Not copied')
+        self.assertEqual(resolve_target('ZTF19aaaaaaa'), self.existing)
+        self.assertEqual(self.existing.targetextra_set.get().value, 'NGC 1234')
+
+    def test_merge_moves_comments(self):
+        duplicate = SiderealTargetFactory.create(ra=150.0, dec=2.0001)
+        comment = Comment.objects.create(
+            content_object=duplicate, site_id=settings.SITE_ID, comment='Bright', user_name='test'
+        )
+        merge_targets(self.existing, [duplicate])
+        comment.refresh_from_db()
+        self.assertEqual(comment.content_object, self.existing)
+
+
+class TestTargetImport(TestCase):
+    def setUp(self):
+        self.csv_file = SimpleUploadedFile('targets.csv', (
+            'identifier,name,type,ra,dec,redshift\n'
+            'one,one,SIDEREAL,10.0,10.0,0.1\n'
+            'two,two,SIDEREAL,abc,10.0,\n'
+            'three,three,SIDEREAL,30.0,95.0,\n'
+            'four,four,SIDEREAL,40.0,-40.0,\n'
+            'five,five,SIDEREAL,10.0001,10.0,\n'
+            'six,six,SIDEREAL,60.0,60.0,\n'
+        ).encode())
+
+    @mock.patch('tom_common.hooks.targets_post_save')
+    def test_import_in_chunks(self, mock_hook):
+        result = import_targets(self.csv_file, policy='skip', chunk_size=2)
+        self.assertEqual([t.identifier for t in result['targets']], ['one', 'four', 'six'])
+        self.assertTrue(all(t.pk for t in result['targets']))
+        self.assertEqual(len(result['errors']), 2)
+        self.assertTrue(result['errors'][0].startswith('Error on line 3'))
+        self.assertTrue(result['errors'][1].startswith('Error on line 4'))
+        # The duplicate of a target created in an earlier chunk is skipped
+        self.assertEqual(len(result['duplicates']), 1)
+        self.assertIn('Line 6', result['duplicates'][0])
+        self.assertEqual(mock_hook.call_count, 3)
+        one = Target.objects.get(identifier='one')
+        self.assertEqual((one.redshift, one.healpix), (0.1, one.compute_healpix()))
+        self.assertIsNone(Target.objects.get(identifier='four').redshift)
+
+    @mock.patch('tom_common.hooks.target_post_save')
+    @mock.patch('tom_common.hooks.targets_post_save')
+    def test_hooks_run_once_when_inserting_row_by_row(self, mock_batch_hook, mock_hook):
+        with mock.patch('tom_targets.import_targets._insert', side_effect=DatabaseError):
+            result = import_targets(self.csv_file, policy='create')
+        self.assertEqual(len(result['targets']), 4)
+        mock_batch_hook.assert_not_called()
+        self.assertEqual(mock_hook.call_count, 4)
+
+    def test_keys_of_inserted_targets(self):
+        earlier = SiderealTargetFactory.create(identifier='earlier', ra=1, dec=1)
+        result = import_targets(self.csv_file, policy='create')
+        self.assertEqual([t.identifier for t in result['targets']], ['one', 'four', 'five', 'six'])
+        for target in result['targets']:
+            self.assertEqual(Target.objects.get(pk=target.pk).identifier, target.identifier)
+        self.assertNotIn(earlier, result['targets'])
+
+    @mock.patch('tom_common.hooks.target_post_save')
+    def test_insert_without_returned_keys(self, mock_hook):
+        # Databases other than SQLite that cannot return keys insert row by row
+        with mock.patch.object(connection, 'vendor', 'other'), \
+                mock.patch.object(connection.features, 'can_return_ids_from_bulk_insert', False):
+            result = import_targets(self.csv_file, policy='create')
+        self.assertEqual([t.identifier for t in result['targets']], ['one', 'four', 'five', 'six'])
+        self.assertTrue(all(t.pk for t in result['targets']))
+        self.assertEqual(mock_hook.call_count, 4)
+        self.assertEqual(resolve_target('six'), result['targets'][-1])
+
+    def test_import_inserts_in_bulk(self):
+        csv_file = SimpleUploadedFile('targets.csv', (
+            'identifier,name,type,ra,dec\n' + ''.join(
+                't{0},t{0},SIDEREAL,{1},0\n'.format(i, i * 0.1) for i in range(200)
+            )
+        ).encode())
+        with CaptureQueriesContext(connection) as queries:
+            result = import_targets(csv_file, policy='create')
+        self.assertEqual(len(result['targets']), 200)
+        # Rows are inserted together, in as many statements as the database allows
+        self.assertLess(len(queries.captured_queries), 20)
+
+
+
 class TestTargetSearch(TestCase):
     def setUp(self):
         self.st = SiderealTargetFactory.create(identifier='1337target', name='M42', name2='Messier 42')
@@ -187,3 +530,288 @@ class TestTargetVisibility(TestCase):
         self.assertEqual(len(airmass_data), len(expected_airmass))
         for i in range(0, len(expected_airmass)):
             self.assertLess(math.fabs(airmass_data[i] - expected_airmass[i]), 0.05)
+
+
+class TestCoordinates(TestCase):
+    def test_parse_matches_astropy(self):
+        ra = ['12:30:45.6', '12 30 45.6', '12h30m45.6s', '00:00:00', '12:30.5', '150.25']
+        dec = ['-05:30:00', '+05d30m00s', '-00:30:00', "-5°30'15\"", '10.5']
+        expected_ra = [Angle(v, unit=units.hourangle).degree for v in ra[:-1]] + [150.25]
+        expected_dec = [Angle(v, unit=units.degree).degree for v in dec[:-1]] + [10.5]
+        self.assertTrue(np.allclose(parse_ra(ra)[0], expected_ra))
+        self.assertTrue(np.allclose(parse_dec(dec)[0], expected_dec))
+
+    def test_errors_per_element(self):
+        degrees, errors = parse_ra(['10:00:00', 'abc', '', '12:61:00', '25:00:00', None])
+        self.assertEqual(sorted(errors), [1, 3, 4])
+        self.assertIn('between 0 and 360', errors[4])
+        self.assertEqual(degrees[0], 150)
+        self.assertTrue(np.isnan(degrees[1:]).all())
+        self.assertEqual(parse_dec(['91', '-90'])[1].keys(), {0})
+
+    def test_non_finite_values(self):
+        degrees, errors = parse_angles(['nan', 'inf', '-Infinity', '10'])
+        self.assertEqual(sorted(errors), [0, 1, 2])
+        self.assertEqual(degrees[3], 10)
+
+    def test_form_field(self):
+        form = SiderealTargetCreateForm(data={
+            'identifier': 'abc', 'name': 'abc', 'type': Target.SIDEREAL, 'ra': '10:00:00', 'dec': 'abc', 'epoch': 2000
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('dec', form.errors)
+        self.assertNotIn('ra', form.errors)
+        self.assertEqual(form.cleaned_data['ra'], 150)
+
+    def test_import_sexagesimal(self):
+        csv_file = SimpleUploadedFile('targets.csv', (
+            'identifier,name,type,ra,dec\nsex,sex,SIDEREAL,10:00:00,-30:30:00\nbad,bad,SIDEREAL,10:00:00,-95:00:00\n'
+        ).encode())
+        result = import_targets(csv_file, policy='create')
+        self.assertEqual(len(result['errors']), 1)
+        self.assertIn('Error on line 3: dec', result['errors'][0])
+        target = Target.objects.get(identifier='sex')
+        self.assertEqual((target.ra, target.dec), (150, -30.5))
+
+    def test_import_blank_coordinates(self):
+        csv_file = SimpleUploadedFile('targets.csv', (
+            'identifier,name,type,ra,dec\nblank,blank,SIDEREAL,,10\ncomet,comet,NON_SIDEREAL,,\n'
+        ).encode())
+        result = import_targets(csv_file, policy='create')
+        self.assertEqual(result['errors'], ['Error on line 2: ra: This field is required for sidereal targets'])
+        self.assertEqual([t.identifier for t in result['targets']], ['comet'])
+
+
+class TestNameSearch(TestCase):
+    def setUp(self):
+        self.sn = SiderealTargetFactory.create(identifier='SN 2019abc', name='ZTF19aaaaaaa', name2='', name3='',
+                                               ra=10, dec=10)
+        self.m42 = SiderealTargetFactory.create(identifier='1337target', name='M42', name2='Messier 42', name3='',
+                                                ra=20, dec=20)
+
+    def search(self, query):
+        return list(search_targets(Target.objects.all(), query))
+
+    def test_normalize_name(self):
+        self.assertEqual(normalize_name(' SN 2019-abc_'), 'sn2019abc')
+        self.assertEqual(self.m42.search_names, '1337target m42 messier42')
+
+    def test_search_ignores_case_spaces_and_punctuation(self):
+        self.assertEqual(self.search('2019abc'), [self.sn])
+        self.assertEqual(self.search('sn2019ABC'), [self.sn])
+        self.assertEqual(self.search('ztf19'), [self.sn])
+        self.assertEqual(self.search('messier 42'), [self.m42])
+        self.assertEqual(self.search('m4'), [self.m42])
+        self.assertEqual(self.search('noresults'), [])
+
+    def test_search_index_follows_changes(self):
+        self.sn.name2 = 'AT 2019xyz'
+        self.sn.save()
+        self.assertEqual(self.search('2019xyz'), [self.sn])
+        self.m42.delete()
+        self.assertEqual(self.search('messier'), [])
+        import_targets(SimpleUploadedFile(
+            'targets.csv', b'identifier,name,type,ra,dec\nimported,PS1-11xyz,SIDEREAL,30,30\n'
+        ))
+        self.assertEqual([t.identifier for t in self.search('ps111')], ['imported'])
+
+    def test_index_looked_up_once(self):
+        self.search('2019abc')
+        with self.assertNumQueries(1):
+            self.search('2019abc')
+        drop_search_index(connection)
+        self.assertEqual(self.search('2019abc'), [self.sn])
+        ensure_search_index(connection)
+        self.assertEqual(self.search('messier'), [self.m42])
+
+    def test_name_filter(self):
+        user = User.objects.create(username='testuser')
+        self.client.force_login(user)
+        response = self.client.get(reverse('targets:list'), {'name': 'Messier 42'})
+        self.assertEqual(list(response.context['object_list']), [self.m42])
+
+    def test_identifier_filter(self):
+        queryset = TargetFilter({'identifier': '2019ab'}, queryset=Target.objects.all()).qs
+        self.assertEqual(list(queryset), [self.sn])
+        self.assertIn(SEARCH_TABLE, str(queryset.query))
+        # Other names of the target do not match the identifier
+        self.assertEqual(list(TargetFilter({'identifier': 'ZTF19'}, queryset=Target.objects.all()).qs), [])
+
+    def test_autocomplete(self):
+        SiderealTargetFactory.create(identifier='ZTF19aaaaaab', name='', ra=30, dec=30)
+        self.assertEqual([t['identifier'] for t in autocomplete('ztf19')], ['ZTF19aaaaaab', 'SN 2019abc'])
+        self.assertEqual(autocomplete('z'), [])
+        user = User.objects.create(username='testuser')
+        self.client.force_login(user)
+        response = self.client.get(reverse('targets:autocomplete'), {'q': 'messier'})
+        self.assertEqual(response.json()['results'], [{'id': self.m42.id, 'identifier': '1337target', 'name': 'M42'}])
+
+
+class TestTargetAliases(TestCase):
+    def setUp(self):
+        self.sn = SiderealTargetFactory.create(identifier='SN 2019abc', name='ZTF19aaaaaaa', name2='', name3='',
+                                               ra=10, dec=10)
+        self.other = SiderealTargetFactory.create(identifier='AT2019xyz', name='', ra=20, dec=20)
+
+    def test_aliases_follow_names(self):
+        self.assertEqual(set(self.sn.aliases.values_list('key', flat=True)), {'sn2019abc', 'ztf19aaaaaaa'})
+        self.sn.name2 = 'PS19abc'
+        self.sn.save()
+        self.assertIn('ps19abc', self.sn.aliases.values_list('key', flat=True))
+        # Names of other targets are not taken over
+        self.other.name = 'ZTF19 aaaaaaa'
+        self.other.save()
+        self.assertEqual(resolve_target('ztf19aaaaaaa'), self.sn)
+
+    def test_aliases_of_old_names_removed(self):
+        TargetAlias.objects.create(target=self.sn, name='Gaia19abc')
+        self.sn.name = 'PS19abc'
+        self.sn.save()
+        self.assertEqual(set(self.sn.aliases.values_list('key', flat=True)), {'sn2019abc', 'ps19abc', 'gaia19abc'})
+        self.assertIsNone(resolve_target('ZTF19aaaaaaa'))
+        self.other.name = 'ZTF19aaaaaaa'
+        self.other.save()
+        self.assertEqual(resolve_target('ZTF19aaaaaaa'), self.other)
+
+    def test_names_taken_while_saving(self):
+        target = SiderealTargetFactory.build(identifier='new', name='ZTF19aaaaaaa', name2='', name3='', ra=30, dec=30)
+        # Another target takes the name between the check and the insert
+        with mock.patch('tom_targets.aliases.TargetAlias.objects.filter') as filter_mock:
+            filter_mock.return_value.values_list.return_value = []
+            target.save()
+        self.assertEqual(list(target.aliases.values_list('key', flat=True)), ['new'])
+        self.assertEqual(resolve_target('ZTF19aaaaaaa'), self.sn)
+
+    def test_alias_keys(self):
+        self.assertEqual(alias_keys('SN 2019abc'), ['sn2019abc', '2019abc', 'at2019abc'])
+        self.assertEqual(alias_keys('ZTF19aaaaaaa'), ['ztf19aaaaaaa'])
+        self.assertEqual(alias_keys('  '), [])
+
+    def test_resolve_variants(self):
+        for name in ('SN 2019abc', 'sn2019ABC', '2019abc', 'AT 2019abc', 'ztf19aaaaaaa'):
+            self.assertEqual(resolve_target(name), self.sn)
+        self.assertEqual(resolve_target('SN 2019xyz'), self.other)
+        self.assertIsNone(resolve_target('2019zzz'))
+
+    def test_resolve_batch_in_one_query(self):
+        TargetAlias.objects.create(target=self.sn, name='Gaia19abc')
+        with self.assertNumQueries(1):
+            resolved = resolve_targets(['gaia19abc', '2019xyz', 'unknown'])
+        self.assertEqual(resolved, {'gaia19abc': self.sn, '2019xyz': self.other, 'unknown': None})
+
+    def test_import_resolves_names(self):
+        result = import_targets(SimpleUploadedFile('targets.csv', (
+            'identifier,name,type,ra,dec\n2019abc,2019abc,SIDEREAL,50,50\nnew,new,SIDEREAL,60,60\n'
+        ).encode()), policy='skip')
+        self.assertEqual([t.identifier for t in result['targets']], ['new'])
+        self.assertIn('SN 2019abc', result['duplicates'][0])
+        self.assertEqual(resolve_target('NEW'), result['targets'][0])
+
+
+class TestTypedExtras(TestCase):
+    def setUp(self):
+        self.near = SiderealTargetFactory.create(ra=10, dec=10)
+        self.far = SiderealTargetFactory.create(ra=20, dec=20)
+        self.untyped = SiderealTargetFactory.create(ra=30, dec=30)
+        TargetExtra.objects.create(target=self.near, key='host_redshift', value='0.01')
+        TargetExtra.objects.create(target=self.near, key='classification', value='SN Ia')
+        TargetExtra.objects.create(target=self.near, key='discovered', value='2019-01-05')
+        TargetExtra.objects.create(target=self.far, key='host_redshift', value='0.2')
+        TargetExtra.objects.create(target=self.far, key='classification', value='SN II')
+        TargetExtra.objects.create(target=self.far, key='discovered', value='2019-06-01T12:00:00')
+        TargetExtra.objects.create(target=self.untyped, key='host_redshift', value='unknown')
+
+    def filter(self, **data):
+        return list(TargetFilter(data, queryset=Target.objects.all()).qs)
+
+    def test_parse_extra_value(self):
+        self.assertEqual(parse_extra_value('0.5'), (0.5, None))
+        self.assertEqual(parse_extra_value('nan'), (None, None))
+        self.assertEqual(parse_extra_value('SN Ia'), (None, None))
+        self.assertEqual(parse_extra_value('2019-01-05')[1], datetime(2019, 1, 5, tzinfo=timezone.utc))
+
+    def test_numeric_range(self):
+        self.assertEqual(self.filter(key='host_redshift', value_max='0.1'), [self.near])
+        self.assertEqual(self.filter(key='host_redshift', value_min='0.05', value_max='1'), [self.far])
+
+    def test_invalid_bound(self):
+        target_filter = TargetFilter({'key': 'host_redshift', 'value_min': 'abc'}, queryset=Target.objects.all())
+        self.assertCountEqual(target_filter.qs, [self.near, self.far, self.untyped])
+        self.assertIn('value_min', target_filter.errors)
+
+    def test_time_range(self):
+        self.assertEqual(self.filter(key='discovered', value_min='2019-03-01'), [self.far])
+        self.assertEqual(self.filter(key='discovered', value_max='2019-01-05 00:00'), [self.near])
+
+    def test_conditions_match_the_same_extra(self):
+        self.assertEqual(self.filter(key='classification', value='SN Ia'), [self.near])
+        # The value 0.2 belongs to a different key than classification
+        self.assertEqual(self.filter(key='classification', value_min='0.1'), [])
+        self.assertEqual(self.filter(value='unknown'), [self.untyped])
+
+    def test_formset_stores_typed_values(self):
+        extra = TargetExtra.objects.get(target=self.near, key='host_redshift')
+        extra.value = '0.03'
+        extra.save()
+        self.assertEqual(TargetExtra.objects.get(pk=extra.pk).float_value, 0.03)
+
+
+class TestTargetExport(TestCase):
+    def setUp(self):
+        self.sn = SiderealTargetFactory.create(identifier='SN 2019abc', name='SN 2019abc', ra=10, dec=10)
+        self.other = SiderealTargetFactory.create(identifier='other <&>', name='other', ra=20, dec=20)
+        self.comet = NonSiderealTargetFactory.create(identifier='comet', name='comet')
+        TargetExtra.objects.create(target=self.sn, key='classification', value='SN Ia')
+        source = ReducedDatumSource.objects.create(name='LCO')
+        for day, magnitude in ((1, 18.5), (3, 18.0), (2, 19.0)):
+            ReducedDatum.objects.create(
+                source=source, target=self.sn, data_type='PHOTOMETRY', value=magnitude, error=0.1, label='r',
+                timestamp=datetime(2019, 1, day, tzinfo=timezone.utc)
+            )
+
+    def export(self, export_format, queryset=None, **kwargs):
+        return ''.join(export_targets(queryset or Target.objects.all(), export_format, **kwargs))
+
+    def test_csv(self):
+        rows = list(csv.DictReader(StringIO(self.export('csv', extras=True, photometry=True))))
+        self.assertEqual([row['identifier'] for row in rows], ['SN 2019abc', 'other <&>', 'comet'])
+        self.assertEqual((rows[0]['classification'], rows[1]['classification']), ('SN Ia', ''))
+        self.assertEqual((rows[0]['latest_magnitude'], rows[0]['latest_filter']), ('18.0', 'r'))
+        self.assertEqual(rows[0]['latest_timestamp'], '2019-01-03T00:00:00+00:00')
+        self.assertNotIn('healpix', rows[0])
+
+    def test_ndjson(self):
+        lines = self.export('ndjson', extras=True).splitlines()
+        self.assertEqual(len(lines), 3)
+        target = json.loads(lines[0])
+        self.assertEqual((target['ra'], target['extras']), (10, {'classification': 'SN Ia'}))
+        self.assertNotIn('latest_magnitude', target)
+
+    def test_votable(self):
+        table = parse_single_table(BytesIO(self.export('votable', photometry=True).encode()))
+        self.assertEqual(list(table.array['identifier']), ['SN 2019abc', 'other <&>', 'comet'])
+        self.assertEqual(table.array['latest_magnitude'][0], 18.0)
+        self.assertTrue(table.array['ra'].mask[2])
+
+    def test_queries_per_chunk(self):
+        SiderealTargetFactory.create_batch(5, ra=30, dec=30)
+        with mock.patch('tom_targets.export.EXPORT_CHUNK_SIZE', 3):
+            with CaptureQueriesContext(connection) as queries:
+                self.export('csv', extras=True, photometry=True)
+        # The extra keys, the targets, and the extras and photometry of each of 3 chunks
+        self.assertEqual(len(queries.captured_queries), 2 + 2 * 3)
+
+    def test_export_view(self):
+        user = User.objects.create(username='testuser')
+        self.client.force_login(user)
+        response = self.client.get(reverse('targets:export'), {'format': 'ndjson', 'type': Target.NON_SIDEREAL})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="targets.ndjson"')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['identifier'] for line in lines], ['comet'])
+        self.assertEqual(self.client.get(reverse('targets:export'), {'format': 'xls'}).status_code, 400)
+
+    def test_export_command(self):
+        out = StringIO()
+        call_command('exporttargets', filter=['name=2019abc'], extras=True, stdout=out)
+        rows = list(csv.DictReader(StringIO(out.getvalue())))
+        self.assertEqual([row['identifier'] for row in rows], ['SN 2019abc'])
@@ -1,7 +1,8 @@
 from django.urls import path
 
 from .views import TargetCreateView, TargetUpdateView, TargetDetailView
-from .views import TargetDeleteView, TargetListView, TargetImportView
+from .views import TargetDeleteView, TargetListView, TargetImportView, TargetDistributionView
+from .views import TargetAutocompleteView, TargetExportView
 
 app_name = 'tom_targets'
 
@@ -9,6 +10,9 @@ urlpatterns = [
     path('', TargetListView.as_view(), name='list'),
     path('create/', TargetCreateView.as_view(), name='create'),
     path('import/', TargetImportView.as_view(), name='import'),
+    path('distribution/', TargetDistributionView.as_view(), name='distribution'),
+    path('autocomplete/', TargetAutocompleteView.as_view(), name='autocomplete'),
+    path('export/', TargetExportView.as_view(), name='export'),
     path('<pk>/update/', TargetUpdateView.as_view(), name='update'),
     path('<pk>/delete/', TargetDeleteView.as_view(), name='delete'),
     path('<pk>/', TargetDetailView.as_view(), name='detail')
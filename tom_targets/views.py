@@ -1,20 +1,25 @@
-from io import StringIO
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.views.generic.detail import DetailView
-from django.views.generic import TemplateView
+from django.views.generic import TemplateView, View
 from django_filters.views import FilterView
 from django.urls import reverse_lazy, reverse
 from django.shortcuts import redirect
 from django.conf import settings
 from django.contrib import messages
-from django.core.management import call_command
+from django.http import JsonResponse, HttpResponseBadRequest, StreamingHttpResponse
 
-from .models import Target
+from .models import Target, TargetExtra
 from .forms import SiderealTargetCreateForm, NonSiderealTargetCreateForm
 from .forms import TargetExtraFormset
 from .import_targets import import_targets
 from .filters import TargetFilter
+from .distribution import sky_distribution
+from .search import autocomplete
+from .export import EXPORT_FORMATS, export_targets
+from .crossmatch import CROSSMATCH_SETTINGS, merge_fields, nearest_target
+from .aliases import add_names, resolve_targets
+from tom_common.jobs import enqueue, job_message
 
 
 class TargetListView(FilterView):
@@ -24,12 +29,70 @@ class TargetListView(FilterView):
     model = Target
     filterset_class = TargetFilter
 
+    def get_queryset(self):
+        return Target.objects.with_counts()
+
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
         context['target_count'] = Target.objects.all().count()
         return context
 
 
+class TargetDistributionView(View):
+    """
+    Returns the sky distribution of the targets matching the filters of the
+    target list as JSON, binned at the requested HEALPix order, or as
+    individual targets when the requested region contains few of them.
+    """
+    def get(self, request, *args, **kwargs):
+        target_filter = TargetFilter(request.GET, queryset=Target.objects.all())
+        targets = target_filter.qs
+        try:
+            order = int(request.GET['order']) if request.GET.get('order') else None
+            bounds = None
+            if request.GET.get('ra_min'):
+                bounds = tuple(float(request.GET[p]) for p in ('ra_min', 'ra_max', 'dec_min', 'dec_max'))
+        except (KeyError, ValueError):
+            return HttpResponseBadRequest('order must be an integer, and ra_min, ra_max, dec_min and dec_max numbers')
+        if order is not None and order < 0:
+            return HttpResponseBadRequest('order must not be negative')
+        return JsonResponse(
+            sky_distribution(targets, order=order, bounds=bounds, filters=target_filter.applied_filters)
+        )
+
+
+class TargetExportView(View):
+    """
+    Streams the targets matching the filters of the target list in the format
+    given as the format parameter, with their extras and latest photometry
+    if the extras and photometry parameters are set.
+    """
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return HttpResponseBadRequest('format must be one of {0}'.format(', '.join(EXPORT_FORMATS)))
+        targets = TargetFilter(request.GET, queryset=Target.objects.all()).qs
+        content_type, extension = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(
+            export_targets(
+                targets, export_format, extras=bool(request.GET.get('extras')),
+                photometry=bool(request.GET.get('photometry'))
+            ),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = 'attachment; filename="targets.{0}"'.format(extension)
+        return response
+
+
+class TargetAutocompleteView(View):
+    """
+    Returns the targets whose identifier or names contain the query given
+    as the q parameter as JSON, for suggesting targets as a name is typed.
+    """
+    def get(self, request, *args, **kwargs):
+        return JsonResponse({'results': autocomplete(request.GET.get('q', ''))})
+
+
 class TargetCreateView(LoginRequiredMixin, CreateView):
     model = Target
     fields = '__all__'
@@ -65,7 +128,62 @@ class TargetCreateView(LoginRequiredMixin, CreateView):
             self.initial['type'] = Target.NON_SIDEREAL
             return NonSiderealTargetCreateForm
 
+    def submitted_extras(self):
+        extra = TargetExtraFormset(self.request.POST)
+        if not extra.is_valid():
+            return []
+        return [
+            (f.cleaned_data['key'], f.cleaned_data['value']) for f in extra.forms
+            if f.cleaned_data and not f.cleaned_data.get('DELETE')
+        ]
+
+    def copy_to_match(self, match, form, policy):
+        """
+        Copies the submitted names and extras to the existing target the
+        submitted one matches, when the policy is to merge them. Returns those
+        that the existing target does not have afterwards, so that the user
+        can be told.
+        """
+        names = [form.cleaned_data.get(field) for field in ('identifier', 'name', 'name2', 'name3')]
+        names = [name for name in dict.fromkeys(names) if name]
+        existing = dict(match.targetextra_set.values_list('key', 'value'))
+        extras = [(key, value) for key, value in self.submitted_extras() if existing.get(key) != value]
+        if policy != 'merge':
+            resolved = resolve_targets(names)
+            return [name for name in names if resolved[name] != match] + [key for key, _ in extras]
+
+        if merge_fields(match, form.cleaned_data):
+            match.save()
+        not_copied = add_names(match, names)
+        for key, value in extras:
+            if key in existing:
+                not_copied.append(key)
+            else:
+                TargetExtra.objects.create(target=match, key=key, value=value)
+                existing[key] = value
+        return not_copied
+
     def form_valid(self, form):
+        target = form.instance
+        policy = 'create' if form.cleaned_data.get('create_anyway') else CROSSMATCH_SETTINGS['policy']
+        if target.ra is not None and target.dec is not None and policy != 'create':
+            match = nearest_target(target.ra, target.dec)
+            if match is not None:
+                not_copied = self.copy_to_match(match, form, policy)
+                messages.warning(
+                    self.request,
+                    '{0} is within {1} arcseconds of the existing target {2}, which was {3} instead. '
+                    'Check "Create anyway" to create it as a separate target.'.format(
+                        target.identifier, CROSSMATCH_SETTINGS['radius'], match,
+                        'updated' if policy == 'merge' else 'kept'
+                    )
+                )
+                if not_copied:
+                    messages.warning(
+                        self.request,
+                        'Not copied to {0}: {1}'.format(match, ', '.join(not_copied))
+                    )
+                return redirect(match.get_absolute_url())
         super().form_valid(form)
         extra = TargetExtraFormset(self.request.POST)
         if extra.is_valid():
@@ -105,9 +223,8 @@ class TargetDetailView(DetailView):
             if not request.user.is_authenticated:
                 return redirect(reverse('login'))
             target_id = kwargs.get('pk', None)
-            out = StringIO()
-            call_command('updatestatus', target_id=target_id, stdout=out)
-            messages.info(request, out.getvalue())
+            job, created = enqueue('updatestatus', target_id=target_id)
+            messages.info(request, job_message(job, created, 'Observation status update'))
             return redirect(reverse('tom_targets:detail', args=(target_id,)))
         return super().get(request, *args, **kwargs)
 
@@ -115,6 +232,11 @@ class TargetDetailView(DetailView):
 class TargetImportView(LoginRequiredMixin, TemplateView):
     template_name = 'tom_targets/target_import.html'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['crossmatch'] = CROSSMATCH_SETTINGS
+        return context
+
     def post(self, request):
         csv_file = request.FILES['target_csv']
         result = import_targets(csv_file)
@@ -122,6 +244,8 @@ class TargetImportView(LoginRequiredMixin, TemplateView):
             request,
             'Targets created: {}'.format(len(result['targets']))
         )
+        for duplicate in result['duplicates']:
+            messages.info(request, duplicate)
         for error in result['errors']:
             messages.warning(request, error)
         return redirect(reverse('tom_targets:list'))